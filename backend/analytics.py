@@ -0,0 +1,144 @@
+# backend/analytics.py
+# Counts behind GET /admin/analytics
+#
+# The counts come from GROUP BY queries (one per table) instead of loading every
+# user/booking/review/message row into Python.
+# On top of that the result is kept as an in-process snapshot:
+# - the write endpoints (create_user, create_booking, update_booking_status,
+#   create_review, send_message, ...) add/subtract from it as they commit
+# - it is rebuilt from the database once it is older than ANALYTICS_TTL_SECONDS,
+#   which also corrects any drift from other workers or direct database edits
+# so the dashboard is normally served without touching the database at all.
+# A write that commits while the counts are being rebuilt may or may not be in
+# them, so a rebuild that overlapped a bump()/invalidate() is returned but not
+# kept (same generation check as backend/response_cache.py).
+#https://docs.sqlalchemy.org/en/20/tutorial/data_select.html#aggregate-functions-with-group-by-having
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from backend.models.booking import Booking
+from backend.models.message import Message
+from backend.models.review import Review
+from backend.models.user import User
+
+ANALYTICS_TTL_SECONDS = float(os.getenv("ANALYTICS_TTL_SECONDS", "60"))
+
+BOOKING_STATUSES = ("requested", "confirmed", "declined", "cancelled", "paid")
+
+
+def compute_counts(session: Session) -> Dict[str, int]:
+    """Runs the aggregate queries and returns every AdminAnalyticsOut field."""
+    counts: Dict[str, int] = {
+        "total_users": 0,
+        "total_mothers": 0,
+        "total_doulas": 0,
+        "total_admins": 0,
+        "pending_doulas": 0,
+        "verified_doulas": 0,
+        "total_bookings": 0,
+        **{f"bookings_{s}": 0 for s in BOOKING_STATUSES},
+        "total_reviews": 0,
+        "total_messages": 0,
+    }
+
+    # Users grouped by role and verified in one query
+    user_rows = session.exec(
+        select(User.role, User.verified, func.count()).group_by(User.role, User.verified)
+    ).all()
+    for role, verified, n in user_rows:
+        for key, delta in user_deltas(role, verified, n).items():
+            counts[key] += delta
+
+    # Bookings grouped by status
+    booking_rows = session.exec(
+        select(Booking.status, func.count()).group_by(Booking.status)
+    ).all()
+    for status, n in booking_rows:
+        for key, delta in booking_deltas(status, n).items():
+            counts[key] += delta
+
+    counts["total_reviews"] = session.exec(select(func.count()).select_from(Review)).one()
+    counts["total_messages"] = session.exec(select(func.count()).select_from(Message)).one()
+    return counts
+
+
+def user_deltas(role: Optional[str], verified: Optional[bool], n: int = 1) -> Dict[str, int]:
+    """Which counters a user with this role/verified state adds n to (use n=-1 to remove one)."""
+    deltas = {"total_users": n}
+    if role == "mother":
+        deltas["total_mothers"] = n
+    elif role == "admin":
+        deltas["total_admins"] = n
+    elif role == "doula":
+        deltas["total_doulas"] = n
+        deltas["verified_doulas" if verified else "pending_doulas"] = n
+    return deltas
+
+
+def booking_deltas(status: Optional[str], n: int = 1) -> Dict[str, int]:
+    deltas = {"total_bookings": n}
+    if status in BOOKING_STATUSES:
+        deltas[f"bookings_{status}"] = n
+    return deltas
+
+
+def combine(*deltas: Dict[str, int]) -> Dict[str, int]:
+    """Adds several delta dicts together, e.g. a booking leaving one status and entering another."""
+    out: Dict[str, int] = {}
+    for d in deltas:
+        for key, delta in d.items():
+            out[key] = out.get(key, 0) + delta
+    return out
+
+
+class AnalyticsSnapshot:
+    """In-process copy of the analytics counts with a TTL."""
+
+    def __init__(self, ttl_seconds: float = ANALYTICS_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.counts: Optional[Dict[str, int]] = None
+        self.expires_at = 0.0
+        # bumped by every bump()/invalidate(), see get()
+        self.generation = 0
+        # sync endpoints run in Starlette's threadpool, so this is a thread lock
+        self.lock = threading.Lock()
+
+    def get(self, session: Session) -> Dict[str, int]:
+        with self.lock:
+            if self.counts is not None and time.monotonic() < self.expires_at:
+                return dict(self.counts)
+            generation = self.generation
+
+        counts = compute_counts(session)
+        with self.lock:
+            if self.generation == generation:
+                self.counts = counts
+                self.expires_at = time.monotonic() + self.ttl_seconds
+            else:
+                # a write landed mid-count; its bump would be lost, so recount next time
+                self.counts = None
+        return dict(counts)
+
+    def bump(self, deltas: Dict[str, int]) -> None:
+        """Applies a committed write to the snapshot. No-op when there is no snapshot yet."""
+        with self.lock:
+            self.generation += 1
+            if self.counts is None:
+                return
+            for key, delta in deltas.items():
+                self.counts[key] = self.counts.get(key, 0) + delta
+
+    def invalidate(self) -> None:
+        """For writes that are awkward to track exactly; the next read recounts."""
+        with self.lock:
+            self.generation += 1
+            self.counts = None
+
+
+analytics = AnalyticsSnapshot()
@@ -0,0 +1,43 @@
+# backend/auth.py
+# Checks the Supabase access token sent by the app
+#
+# The app signs in with Supabase Auth (supabase.auth.getSession() in the mobile
+# screens); session.access_token is a JWT signed with the project's JWT secret.
+# Its "sub" claim is the user's auth_id, so an endpoint that takes the token
+# doesn't have to trust an auth_id the caller typed in.
+# SUPABASE_JWT_SECRET: Supabase dashboard -> Project Settings -> API -> JWT secret.
+#
+# References:
+# - https://supabase.com/docs/guides/auth/jwts
+# - https://pyjwt.readthedocs.io/en/stable/usage.html#encoding-decoding-tokens-with-hs256
+
+import os
+from uuid import UUID
+
+import jwt
+
+# Supabase puts this audience on tokens of signed-in users
+SUPABASE_JWT_AUDIENCE = "authenticated"
+
+
+class AuthError(Exception):
+    pass
+
+
+def verify_access_token(token: str) -> UUID:
+    """The auth_id (sub claim) of a valid, unexpired Supabase access token."""
+    # read per call: main.py loads backend/.env after importing this module
+    secret = os.getenv("SUPABASE_JWT_SECRET")
+    if not secret:
+        raise AuthError("SUPABASE_JWT_SECRET is not set")
+    try:
+        claims = jwt.decode(
+            token,
+            secret,
+            algorithms=["HS256"],
+            audience=SUPABASE_JWT_AUDIENCE,
+            options={"require": ["sub", "exp"]},
+        )
+        return UUID(claims["sub"])
+    except (jwt.InvalidTokenError, ValueError) as e:
+        raise AuthError(f"Invalid access token: {e}") from e
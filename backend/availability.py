@@ -0,0 +1,262 @@
+# backend/availability.py
+# Free-slot calculation for the availability endpoints
+#
+# free_slots used to load every booking the doula ever had and test each candidate
+# slot against every blocked interval (O(slots x blocks)). Here:
+# - bookings are only loaded for the dates asked for, through the (doula_id, starts_at) index
+# - blocked intervals (bookings + partial-day exceptions) are merged with a sorted sweep
+# - candidate slots walk the merged list with a single pointer
+# Everything is loaded for a list of doulas and a date range at once, so the
+# multi-day calendar and the "who is free?" search cost a fixed number of queries.
+#
+# Writes: create_booking and update_booking_status check for an overlapping active
+# booking with one range query (booking_conflict) on the (doula_id, starts_at, ends_at)
+# index. Active bookings of one doula never overlap, so only the last one starting
+# before a time can still be running then (running_since); the scans start there
+# instead of reading the doula's older history, however long a booking is.
+# On Postgres the ex_bookings_doula_no_overlap exclusion constraint (models/booking.py)
+# also rejects two requests that pass the check at the same time. Other databases
+# lock the doula's users row first (lock_doula_bookings), so a second write for the
+# same doula waits until the first one commits, in any worker.
+#
+# "Who is free?" (GET /availability/free-doulas) first narrows the doulas in SQL
+# with may_be_free(): working that weekday during the window, no whole-day
+# exception, no single booking covering the whole window. Only those candidates
+# are loaded into AvailabilityData for the exact slot calculation.
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import exists, func, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from backend.models.availability_models import DoulaAvailability, DoulaAvailabilityException
+from backend.models.booking import OVERLAP_CONSTRAINT, Booking
+from backend.models.user import User
+
+# Bookings in these states do not block a slot
+INACTIVE_BOOKING_STATUSES = ("declined", "cancelled")
+
+Interval = Tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sorts intervals and joins any that overlap or touch, so they can be swept once."""
+    merged: List[Interval] = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def slots_in_window(
+    window_start: datetime,
+    window_end: datetime,
+    blocked: Sequence[Interval],
+    duration: timedelta,
+    step: timedelta,
+) -> List[datetime]:
+    """
+    Start times on the step grid from window_start where [t, t + duration) misses
+    every blocked interval. blocked must come from merge_intervals().
+    """
+    slots = []
+    i = 0
+    t = window_start
+    while t + duration <= window_end:
+        # blocks that end before this slot starts can never matter again
+        while i < len(blocked) and blocked[i][1] <= t:
+            i += 1
+        if i < len(blocked) and blocked[i][0] < t + duration:
+            # clashes with this block: jump to the first grid time after it ends
+            gap = blocked[i][1] - window_start
+            t = window_start + -(-gap // step) * step
+            continue
+        slots.append(t)
+        t += step
+    return slots
+
+
+class AvailabilityData:
+    """Weekly hours, exceptions and active bookings for some doulas over a date range."""
+
+    def __init__(self, session: Session, doula_ids: Sequence[int], start: date, end: date) -> None:
+        """Loads everything with three queries. start and end are inclusive."""
+        self.weekly: Dict[Tuple[int, int], List[DoulaAvailability]] = defaultdict(list)
+        self.exceptions: Dict[Tuple[int, date], List[DoulaAvailabilityException]] = defaultdict(list)
+        self.bookings: Dict[int, List[Interval]] = defaultdict(list)
+        if not doula_ids:
+            return
+
+        for w in session.exec(select(DoulaAvailability).where(
+            DoulaAvailability.doula_id.in_(doula_ids),
+            DoulaAvailability.active == True
+        )).all():
+            self.weekly[(w.doula_id, w.day_of_week)].append(w)
+
+        for ex in session.exec(select(DoulaAvailabilityException).where(
+            DoulaAvailabilityException.doula_id.in_(doula_ids),
+            DoulaAvailabilityException.exception_date >= start,
+            DoulaAvailabilityException.exception_date <= end
+        )).all():
+            self.exceptions[(ex.doula_id, ex.exception_date)].append(ex)
+
+        range_start = datetime.combine(start, time.min)
+        range_end = datetime.combine(end + timedelta(days=1), time.min)
+        rows = session.exec(select(Booking.doula_id, Booking.starts_at, Booking.ends_at).where(
+            Booking.doula_id.in_(doula_ids),
+            Booking.starts_at >= func.coalesce(running_since(Booking.doula_id, range_start), range_start),
+            Booking.starts_at < range_end,
+            Booking.ends_at > range_start,
+            Booking.status.not_in(INACTIVE_BOOKING_STATUSES)
+        )).all()
+        for doula_id, s, e in rows:
+            if s and e:
+                self.bookings[doula_id].append((s, e))
+
+    def free_slots(self, doula_id: int, day: date, duration: timedelta, step: timedelta) -> List[datetime]:
+        """Free start times for one doula on one day, in order."""
+        exceptions = self.exceptions.get((doula_id, day), [])
+
+        # whole-day block?
+        for ex in exceptions:
+            if ex.start_time is None and ex.end_time is None:
+                return []
+
+        windows = sorted(
+            (datetime.combine(day, w.start_time), datetime.combine(day, w.end_time))
+            for w in self.weekly.get((doula_id, day.weekday()), [])
+        )
+        if not windows:
+            return []
+
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
+        blocked = [
+            (s, e) for s, e in self.bookings.get(doula_id, [])
+            if s < day_end and e > day_start
+        ]
+        for ex in exceptions:
+            if ex.start_time and ex.end_time:
+                blocked.append((datetime.combine(day, ex.start_time), datetime.combine(day, ex.end_time)))
+        blocked = merge_intervals(blocked)
+
+        slots: List[datetime] = []
+        for window_start, window_end in windows:
+            slots.extend(slots_in_window(window_start, window_end, blocked, duration, step))
+        # overlapping weekly windows could offer the same time twice
+        return sorted(set(slots))
+
+
+def may_be_free(doula_id, day: date, window_start: datetime, window_end: datetime) -> List[ColumnElement]:
+    """
+    WHERE conditions for doulas (doula_id: the doula id column of the outer query)
+    who could have a free slot in [window_start, window_end) on day. Only rules
+    doulas out; AvailabilityData.free_slots() still decides.
+    """
+    working = [
+        DoulaAvailability.doula_id == doula_id,
+        DoulaAvailability.day_of_week == day.weekday(),
+        DoulaAvailability.active == True,
+        DoulaAvailability.end_time > window_start.time(),
+    ]
+    if window_end.date() == day:
+        working.append(DoulaAvailability.start_time < window_end.time())
+
+    day_off = exists().where(
+        DoulaAvailabilityException.doula_id == doula_id,
+        DoulaAvailabilityException.exception_date == day,
+        DoulaAvailabilityException.start_time == None,
+        DoulaAvailabilityException.end_time == None,
+    )
+    # served by ix_bookings_doula_period (doula_id, starts_at, ends_at)
+    booked_throughout = exists().where(
+        Booking.doula_id == doula_id,
+        Booking.starts_at <= window_start,
+        Booking.starts_at >= func.coalesce(running_since(doula_id, window_start), window_start),
+        Booking.ends_at >= window_end,
+        Booking.status.not_in(INACTIVE_BOOKING_STATUSES),
+    )
+    return [exists().where(*working), ~day_off, ~booked_throughout]
+
+
+def running_since(doula_id, at: datetime):
+    """
+    starts_at of the doula's last active booking starting before at (NULL if none),
+    as a scalar subquery. doula_id can be a value or a column of the outer query.
+    """
+    earlier = aliased(Booking)
+    return select(func.max(earlier.starts_at)).where(
+        earlier.doula_id == doula_id,
+        earlier.starts_at < at,
+        earlier.status.not_in(INACTIVE_BOOKING_STATUSES),
+    ).scalar_subquery()
+
+
+def check_booking_period(starts: datetime, ends: datetime) -> None:
+    if ends <= starts:
+        raise HTTPException(status_code=400, detail="ends_at must be after starts_at")
+
+
+def booking_conflict(
+    session: Session, doula_id: int, starts: datetime, ends: datetime, exclude_id: Optional[int] = None
+) -> Optional[Booking]:
+    """An active booking of this doula overlapping [starts, ends), or None."""
+    stmt = select(Booking).where(
+        Booking.doula_id == doula_id,
+        Booking.starts_at >= func.coalesce(running_since(doula_id, starts), starts),
+        Booking.starts_at < ends,
+        Booking.ends_at > starts,
+        Booking.status.not_in(INACTIVE_BOOKING_STATUSES)
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(Booking.id != exclude_id)
+    return session.exec(stmt.limit(1)).first()
+
+
+def raise_conflict(clash: Optional[Booking] = None) -> None:
+    detail = "The doula already has a booking at this time"
+    if clash is not None:
+        detail += f" ({clash.starts_at:%Y-%m-%d %H:%M} - {clash.ends_at:%H:%M})"
+    raise HTTPException(status_code=409, detail=detail)
+
+
+def is_overlap_violation(error: IntegrityError) -> bool:
+    return OVERLAP_CONSTRAINT in str(error.orig)
+
+
+def lock_doula_bookings(session: Session, doula_id: int) -> None:
+    """
+    Call before booking_conflict() in a transaction that writes one of the doula's
+    bookings, ideally as its first statement: MySQL's REPEATABLE READ answers plain
+    reads from a snapshot taken at the transaction's first one. Holds the lock until
+    commit/rollback. Postgres needs none: the exclusion constraint rejects the second write.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return
+    if dialect == "sqlite":
+        # no row locks; any write takes the database write lock until commit
+        session.execute(update(User).where(User.id == doula_id).values(id=User.id))
+    else:
+        session.execute(select(User.id).where(User.id == doula_id).with_for_update())
+
+
+def date_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def parse_day(value: str, name: Optional[str] = None) -> date:
+    """'YYYY-MM-DD' (a full ISO datetime is accepted too, like the original free_slots)."""
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}' for {name or 'date'}. Use YYYY-MM-DD.")
@@ -0,0 +1,217 @@
+# backend/backplane.py
+# Pub/sub backplane for the chat sockets
+#
+# Each uvicorn worker only knows about its own sockets, so with more than one
+# worker a chat message has to be published once and then delivered to the local
+# sockets on every worker. The ConnectionManager publishes through a Backplane and
+# subscribes to it; the Backplane decides how messages reach the other workers.
+#
+# Implementations:
+# - InProcessBackplane: single worker (the default). Delivers straight back to
+#   this process, same behaviour as before.
+# - SqliteBackplane: several workers on one machine. Messages are appended to a
+#   small SQLite file (WAL mode) and every worker polls it for new rows.
+#   Also lets the multi-worker path be tested locally with no extra services.
+# Pick one with CHAT_BACKPLANE=memory|sqlite (CHAT_BACKPLANE_PATH for the file).
+#
+# Each backplane also keeps the recent history per channel, so a socket that
+# connects to any worker gets the same last messages.
+#
+# References:
+# - https://www.sqlite.org/wal.html (many readers + one writer across processes)
+# - https://docs.python.org/3/library/asyncio-task.html#asyncio.to_thread
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[None]]
+
+# Number of recent messages kept per channel for new connections
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "100"))
+
+
+class Backplane(abc.ABC):
+    """Base class: publish() sends to every worker, handlers get what arrives here."""
+
+    def __init__(self, history_size: int = CHAT_HISTORY_SIZE) -> None:
+        self.history_size = history_size
+        self.handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self.handlers[channel].append(handler)
+
+    async def _deliver(self, channel: str, message: Any) -> None:
+        for handler in self.handlers.get(channel, []):
+            await handler(message)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: Any, keep: bool = True) -> None:
+        """Delivers message on every worker. keep=False leaves it out of the history."""
+
+    @abc.abstractmethod
+    async def history(self, channel: str) -> List[Any]:
+        """The last history_size kept messages on channel, oldest first."""
+
+
+class InProcessBackplane(Backplane):
+    """Single-worker backplane: messages never leave this process."""
+
+    def __init__(self, history_size: int = CHAT_HISTORY_SIZE) -> None:
+        super().__init__(history_size)
+        self.recent: Dict[str, Deque[Any]] = defaultdict(lambda: deque(maxlen=self.history_size))
+
+    async def publish(self, channel: str, message: Any, keep: bool = True) -> None:
+        if keep:
+            self.recent[channel].append(message)
+        await self._deliver(channel, message)
+
+    async def history(self, channel: str) -> List[Any]:
+        return list(self.recent[channel])
+
+
+class SqliteBackplane(Backplane):
+    """
+    Multi-worker backplane for one machine, using a shared SQLite file as the broker.
+    A message is delivered locally as soon as it is published; the other workers
+    pick it up on their next poll (every CHAT_BACKPLANE_POLL_SECONDS).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        poll_seconds: float = 0.1,
+        retention_seconds: float = 600,
+        history_size: int = CHAT_HISTORY_SIZE,
+    ) -> None:
+        super().__init__(history_size)
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        # rows written by this worker are skipped when polling (already delivered)
+        self.origin = uuid.uuid4().hex
+        self.last_id = 0
+        self.conn: Optional[sqlite3.Connection] = None
+        # one connection shared by the to_thread calls, used one at a time
+        self.conn_lock = threading.Lock()
+        self.poller: Optional[asyncio.Task] = None
+
+    def _open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bus ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " channel TEXT NOT NULL,"
+            " origin TEXT NOT NULL,"
+            " keep INTEGER NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_bus_channel_keep ON bus (channel, keep, id)")
+        self.conn = conn
+        # start from the current end: older rows are history, not new messages
+        row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus").fetchone()
+        self.last_id = row[0]
+
+    def _run(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self.conn_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open)
+        self.poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self.poller:
+            self.poller.cancel()
+            try:
+                await self.poller
+            except asyncio.CancelledError:
+                pass
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    async def publish(self, channel: str, message: Any, keep: bool = True) -> None:
+        payload = json.dumps(message, default=str)
+        await asyncio.to_thread(
+            self._run,
+            "INSERT INTO bus (channel, origin, keep, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (channel, self.origin, int(keep), payload, time.time()),
+        )
+        await self._deliver(channel, json.loads(payload))
+
+    async def history(self, channel: str) -> List[Any]:
+        rows = await asyncio.to_thread(
+            self._run,
+            "SELECT payload FROM bus WHERE channel = ? AND keep = 1 ORDER BY id DESC LIMIT ?",
+            (channel, self.history_size),
+        )
+        return [json.loads(p) for (p,) in reversed(rows)]
+
+    async def _poll_loop(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                rows = await asyncio.to_thread(
+                    self._run,
+                    "SELECT id, channel, origin, payload FROM bus WHERE id > ? ORDER BY id",
+                    (self.last_id,),
+                )
+                for row_id, channel, origin, payload in rows:
+                    self.last_id = row_id
+                    if origin != self.origin:
+                        await self._deliver(channel, json.loads(payload))
+
+                if time.monotonic() - last_prune > 30:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(self._prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # a locked/busy file should not kill chat delivery; try again next tick
+                log.exception("Chat backplane poll failed")
+            await asyncio.sleep(self.poll_seconds)
+
+    def _prune(self) -> None:
+        # old rows can go, except the recent history of each channel
+        self._run(
+            "DELETE FROM bus WHERE created_at < ? AND id NOT IN ("
+            " SELECT b.id FROM bus b WHERE b.channel = bus.channel AND b.keep = 1"
+            " ORDER BY b.id DESC LIMIT ?)",
+            (time.time() - self.retention_seconds, self.history_size),
+        )
+
+
+def create_backplane() -> Backplane:
+    """Builds the backplane chosen by CHAT_BACKPLANE (memory by default)."""
+    kind = os.getenv("CHAT_BACKPLANE", "memory").lower()
+    if kind == "sqlite":
+        default_path = Path(__file__).parent / "chat_backplane.sqlite3"
+        return SqliteBackplane(
+            path=os.getenv("CHAT_BACKPLANE_PATH", str(default_path)),
+            poll_seconds=float(os.getenv("CHAT_BACKPLANE_POLL_SECONDS", "0.1")),
+        )
+    if kind == "memory":
+        return InProcessBackplane()
+    raise ValueError(f"Unknown CHAT_BACKPLANE '{kind}' (use memory or sqlite)")
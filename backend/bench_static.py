@@ -0,0 +1,92 @@
+# backend/bench_static.py
+# Requests/second for /static: plain StaticFiles vs CachedStaticFiles
+#
+#   python -m backend.bench_static                 (largest PDF in static/certificates)
+#   python -m backend.bench_static --requests 5000 --concurrency 50 --file images/x.jpg
+#
+# Runs the ASGI apps in-process (httpx.ASGITransport), so it measures the server side
+# only, without network. Three kinds of request, as the app makes them:
+# - full:        GET with no cache headers (first view)
+# - revalidate:  GET with If-None-Match from the previous response (cached copy, checking it)
+# - range:       GET of the first 64 KB (PDF viewer opening the first page)
+# With CachedStaticFiles an immutable (sha256/uuid-named) file is not requested again
+# at all, which this can't show: that is the biggest saving on the phone.
+#
+# References:
+# - https://www.python-httpx.org/advanced/transports/#asgi-transport
+
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from backend.static_files import CachedStaticFiles
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+
+def make_app(static_class) -> FastAPI:
+    app = FastAPI()
+    app.mount("/static", static_class(directory=str(STATIC_DIR)), name="static")
+    return app
+
+
+async def run(app: FastAPI, url: str, headers: dict, requests: int, concurrency: int) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm up (and fill the ETag cache)
+        await client.get(url, headers=headers)
+        sent = 0
+        body_bytes = 0
+        statuses = set()
+
+        async def worker():
+            nonlocal sent, body_bytes
+            while sent < requests:
+                sent += 1
+                response = await client.get(url, headers=headers)
+                body_bytes += len(response.content)
+                statuses.add(response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, body_bytes / requests, sorted(statuses)
+
+
+async def main(file: str, requests: int, concurrency: int) -> None:
+    url = f"/static/{file}"
+    print(f"{url}  ({(STATIC_DIR / file).stat().st_size / 1024:.0f} KB), "
+          f"{requests} requests, concurrency {concurrency}\n")
+    print(f"{'':<20}{'request':<12}{'req/s':>10}{'KB/response':>14}  status")
+    for name, static_class in (("StaticFiles", StaticFiles), ("CachedStaticFiles", CachedStaticFiles)):
+        app = make_app(static_class)
+        # the ETag this server gives out, as a client would have stored it
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as c:
+            etag = (await c.get(url)).headers["etag"]
+        cases = (
+            ("full", {}),
+            ("revalidate", {"if-none-match": etag}),
+            ("range", {"range": "bytes=0-65535"}),
+        )
+        for case, headers in cases:
+            rps, size, statuses = await run(app, url, headers, requests, concurrency)
+            print(f"{name:<20}{case:<12}{rps:>10.0f}{size / 1024:>14.1f}  {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the /static mount")
+    parser.add_argument("--file", help="path under static/ (default: largest certificate PDF)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    file = args.file
+    if not file:
+        largest = max((STATIC_DIR / "certificates").glob("*.pdf"), key=lambda p: p.stat().st_size)
+        file = f"certificates/{largest.name}"
+    asyncio.run(main(file, args.requests, args.concurrency))
@@ -2,58 +2,286 @@
 # Simple connection manager for community chat
 # https://www.youtube.com/watch?v=nZhAW-JQ8NM - inspired this structure
 
-from typing import Set
-from starlette.websockets import WebSocket
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+from starlette.websockets import WebSocket, WebSocketState
 from asyncio import Lock
+from backend.backplane import Backplane, InProcessBackplane, create_backplane
+
+log = logging.getLogger(__name__)
+
+# How many messages can wait for one client before it counts as too slow
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "100"))
+
+# Close code sent to clients that fell too far behind (1013 = "try again later")
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """
+    One connected socket with its own outbound queue and writer task.
+    broadcast() only puts text on the queue; the writer sends it at whatever
+    speed this client can take, so a slow phone only delays itself.
+    """
+
+    def __init__(self, ws: WebSocket, max_queue: int) -> None:
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.writer: Optional[asyncio.Task] = None
+
+    def start(self, on_error) -> None:
+        self.writer = asyncio.create_task(self._write_loop(on_error))
+
+    async def _write_loop(self, on_error) -> None:
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # socket is gone; let the manager forget it
+            await on_error(self.ws)
+
+    def offer(self, text: str) -> bool:
+        """Queues text for this client. False means the queue is full."""
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def stop(self) -> None:
+        if self.writer and not self.writer.done() and self.writer is not asyncio.current_task():
+            self.writer.cancel()
 
 
 class ConnectionManager:
-    def __init__(self) -> None:
+    """
+    Sockets connected to this worker for one chat channel.
+    Messages go out through the backplane (publish) and come back in through it
+    (broadcast), so with several workers everyone sees every message.
+    """
+
+    def __init__(
+        self,
+        backplane: Optional[Backplane] = None,
+        channel: str = "community",
+        max_queue: int = CHAT_SEND_QUEUE_SIZE,
+    ) -> None:
+        self.backplane = backplane or InProcessBackplane()
+        self.channel = channel
+        self.backplane.subscribe(channel, self.broadcast)
         # In the video, he uses a LIST: self.active_connections = []
-        # I improved it by using a SET instead:
-        # - no duplicates
-        # - faster removal
-        # - cleaner for WebSocket tracking
-        self.connections: Set[WebSocket] = set()
+        # I improved it by using a SET instead, and later a dict from socket to its
+        # ClientConnection (same idea - no duplicates, fast removal) so every socket
+        # can have its own send queue
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.max_queue = max_queue
         # The YouTube video doesnt  use a lock.
         # This is more safe when many clients connect/disconnect.
+        # broadcast() does not take it, so sending never blocks connects/disconnects
         self.lock = Lock()
+        # close() calls for dropped clients, kept so they are not garbage collected mid-way
+        self.closing: Set[asyncio.Task] = set()
 
-    async def connect(self, ws: WebSocket) -> None:
+    async def connect(self, ws: WebSocket, with_history: bool = True) -> None:
         """
                Accepts a new WebSocket connection and stores it.
                This behavior is the same as in the video, except
-               I store it inside a set instead of a list.
+               each socket gets its own send queue and writer task.
+               The socket is registered before the history is fetched, so a message
+               published in between is not missed. The history is then sent first,
+               and a queued message that is already in it (same id) is dropped.
                """
         await ws.accept()
+        client = ClientConnection(ws, self.max_queue)
         async with self.lock:
-            self.connections.add(ws)
+            self.connections[ws] = client
+        if with_history:
+            past = await self.history()
+            if ws not in self.connections:
+                # dropped as too slow while the history loaded
+                return
+            seen = {m.get("id") for m in past if isinstance(m, dict)}
+            # no await from here to start(): nothing can be queued in between
+            live = []
+            while not client.queue.empty():
+                live.append(client.queue.get_nowait())
+            client.offer(json.dumps(past, default=str))
+            for text in live:
+                message = json.loads(text)
+                if not (isinstance(message, dict) and message.get("id") in seen):
+                    client.offer(text)
+        client.start(self.disconnect)
 
     async def disconnect(self, ws: WebSocket) -> None:
         """
              Removes a WebSocket connection when a client disconnects.
-             Similar to the video, but using 'discard' avoids errors if missing.
+             Similar to the video, but using pop() avoids errors if missing.
              """
         async with self.lock:
-            self.connections.discard(ws)
+            client = self.connections.pop(ws, None)
+        if client:
+            client.stop()
+
+    async def send(self, ws: WebSocket, message: Any) -> None:
+        """Queues a message for one socket only (goes through its writer like everything else)."""
+        client = self.connections.get(ws)
+        if client and not client.offer(json.dumps(message, default=str)):
+            self._drop_slow(client)
 
-    async def broadcast(self, message: dict) -> None:
+    async def publish(self, message: Any) -> None:
         """
-                Sends a JSON message to every connected client.
-                This is similar to the broadcast function in the video,
-                but I use JSON instead of plain text
+        Sends a new chat message to every worker (each one broadcasts it locally).
+        Gives it an id, which connect() uses to drop duplicates of the history.
+        """
+        if isinstance(message, dict) and "id" not in message:
+            message = {**message, "id": uuid.uuid4().hex}
+        await self.backplane.publish(self.channel, message)
 
+    async def history(self) -> list:
+        """Recent messages on this channel, shared by all workers."""
+        return await self.backplane.history(self.channel)
+
+    async def broadcast(self, message: Any) -> None:
+        """
+                Sends a JSON message to every client connected to this worker.
+                This is similar to the broadcast function in the video,
+                but I use JSON instead of plain text.
+                The message is serialized once and only queued here, so this
+                returns straight away however slow the clients are.
+                Clients whose queue is full are disconnected.
                 """
-        dead = []
+        text = json.dumps(message, default=str)
+        for client in list(self.connections.values()):
+            if not client.offer(text):
+                self._drop_slow(client)
+
+    def _drop_slow(self, client: ClientConnection) -> None:
+        # no await between the check and the pop, so this is safe without the lock
+        self.connections.pop(client.ws, None)
+        client.stop()
+        # closing can itself wait on the slow client, so it runs in the background
+        task = asyncio.create_task(self._close_quietly(client.ws))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    @staticmethod
+    async def _close_quietly(ws: WebSocket) -> None:
+        try:
+            await ws.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception:
+            pass
+
+
+class PrivateConnectionManager:
+    """
+    Private-message sockets, grouped by user (auth_id + role), so one user can
+    have the app open on several devices.
+    Same per-socket send queues as the community chat. Events go through the
+    backplane on the "private" channel with the user they are for, and every
+    worker delivers them to that user's sockets on that worker (if any).
+    """
+
+    def __init__(
+        self,
+        backplane: Optional[Backplane] = None,
+        channel: str = "private",
+        max_queue: int = CHAT_SEND_QUEUE_SIZE,
+    ) -> None:
+        self.backplane = backplane or InProcessBackplane()
+        self.channel = channel
+        self.backplane.subscribe(channel, self._deliver)
+        self.users: Dict[Tuple[str, str], Dict[WebSocket, ClientConnection]] = {}
+        self.max_queue = max_queue
+        self.lock = Lock()
+        self.closing: Set[asyncio.Task] = set()
+        # event loop of the app, so sync (threadpool) endpoints can hand events to it
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _key(auth_id: Any, role: str) -> Tuple[str, str]:
+        return (str(auth_id), role)
+
+    async def connect(self, ws: WebSocket, auth_id: Any, role: str, initial: Any = None) -> None:
+        # already accepted if the endpoint read the token from the first frame
+        if ws.client_state == WebSocketState.CONNECTING:
+            await ws.accept()
+        client = ClientConnection(ws, self.max_queue)
+        if initial is not None:
+            client.offer(json.dumps(initial, default=str))
+        key = self._key(auth_id, role)
+        client.start(lambda ws: self.disconnect(ws, auth_id, role))
+        async with self.lock:
+            self.users.setdefault(key, {})[ws] = client
+
+    async def disconnect(self, ws: WebSocket, auth_id: Any, role: str) -> None:
+        key = self._key(auth_id, role)
         async with self.lock:
-            for ws in list(self.connections):
-                try:
-                    # The video uses send_text() but send_json send structured data
-                    await ws.send_json(message)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                self.connections.discard(ws)
+            sockets = self.users.get(key, {})
+            client = sockets.pop(ws, None)
+            if not sockets:
+                self.users.pop(key, None)
+        if client:
+            client.stop()
+
+    def is_online(self, auth_id: Any, role: str) -> bool:
+        """True if the user has a socket open on this worker."""
+        return bool(self.users.get(self._key(auth_id, role)))
+
+    async def notify(self, auth_id: Any, role: str, *events: Dict[str, Any]) -> None:
+        """Sends events, in order, to every socket this user has open, on any worker."""
+        for event in events:
+            await self.backplane.publish(
+                self.channel,
+                {"to": list(self._key(auth_id, role)), "event": event},
+                keep=False,
+            )
+
+    def notify_threadsafe(self, auth_id: Any, role: str, *events: Dict[str, Any]) -> None:
+        """
+        notify() for sync endpoints, which run in the threadpool.
+        Fire and forget: the request does not wait for the sockets.
+        """
+        if self.loop is None or self.loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self.notify(auth_id, role, *events), self.loop)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future) -> None:
+        if not future.cancelled() and future.exception():
+            # runs in a callback, not an except block, so pass the exception for its traceback
+            log.error("Private message push failed", exc_info=future.exception())
+
+    async def _deliver(self, message: Any) -> None:
+        sockets = self.users.get(tuple(message["to"]))
+        if not sockets:
+            return
+        text = json.dumps(message["event"], default=str)
+        for client in list(sockets.values()):
+            if not client.offer(text):
+                self._drop_slow(client, message["to"])
+
+    def _drop_slow(self, client: ClientConnection, key) -> None:
+        # the app falls back to polling until it reconnects
+        sockets = self.users.get(tuple(key), {})
+        sockets.pop(client.ws, None)
+        if not sockets:
+            self.users.pop(tuple(key), None)
+        client.stop()
+        task = asyncio.create_task(ConnectionManager._close_quietly(client.ws))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
 
 # Same as in the video: create a global manager instance
-manager = ConnectionManager()
+# The backplane is started/stopped by the app lifespan in main.py
+backplane = create_backplane()
+manager = ConnectionManager(backplane)
+private_manager = PrivateConnectionManager(backplane)
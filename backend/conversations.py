@@ -0,0 +1,168 @@
+# backend/conversations.py
+# Keeps the conversations table (backend/models/conversation.py) in step with messages
+#
+# send_message and mark_read call these inside their own session, before commit,
+# so the message and its conversation row are saved in the same transaction.
+# The updates are single atomic statements (upsert / increment), so two messages
+# sent at the same time cannot lose an unread count. Databases without an upsert
+# SQLAlchemy can build here (MySQL) update first and insert when there is no row yet.
+#
+# Unread counts only count messages from the other side, the same as
+# GET /messages/unread-count and the partial unread indexes.
+#
+# Existing databases are filled from the message history by migration 5
+# (python -m backend.migrations upgrade). To rebuild the table by hand:
+#   python -m backend.conversations
+#
+# References:
+# - https://docs.sqlalchemy.org/en/20/dialects/postgresql.html#insert-on-conflict-upsert
+# - https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#upsert
+# - https://docs.sqlalchemy.org/en/20/orm/session_transaction.html#using-savepoint
+
+from sqlalchemy import case, delete, func, literal, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from backend.models.conversation import Conversation
+from backend.models.message import UNREAD_BY_DOULA, UNREAD_BY_MOTHER, Message
+
+
+def record_message(session: Session, msg: Message) -> None:
+    """Upserts the conversation row for a new message and bumps the receiver's unread count."""
+    unread_col = "unread_by_doula" if msg.sender_role == "mother" else "unread_by_mother"
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert = pg_insert
+    elif dialect == "sqlite":
+        insert = sqlite_insert
+    else:
+        record_message_without_upsert(session, msg, unread_col)
+        return
+
+    stmt = insert(Conversation).values(
+        mother_auth_id=msg.mother_auth_id,
+        doula_auth_id=msg.doula_auth_id,
+        last_text=msg.text,
+        last_at=msg.created_at,
+        last_sender_role=msg.sender_role,
+        **{unread_col: 1},
+    )
+    new = stmt.excluded
+    # Only move last_* forward, in case a slower request commits an older message after a newer one
+    is_newer = new.last_at >= Conversation.last_at
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["mother_auth_id", "doula_auth_id"],
+        set_={
+            "last_text": case((is_newer, new.last_text), else_=Conversation.last_text),
+            "last_at": case((is_newer, new.last_at), else_=Conversation.last_at),
+            "last_sender_role": case((is_newer, new.last_sender_role), else_=Conversation.last_sender_role),
+            unread_col: getattr(Conversation, unread_col) + 1,
+        },
+    )
+    session.exec(stmt)
+
+
+def record_message_without_upsert(session: Session, msg: Message, unread_col: str) -> None:
+    """
+    record_message() for other databases (e.g. MySQL): an atomic UPDATE of the
+    pair's row, or an INSERT when it has none. If another request inserts the row
+    first, the INSERT hits uq_conversation_pair and the UPDATE is run again.
+    """
+    col = getattr(Conversation, unread_col)
+    is_newer = literal(msg.created_at) >= Conversation.last_at
+    stmt = (
+        update(Conversation)
+        .where(
+            Conversation.mother_auth_id == msg.mother_auth_id,
+            Conversation.doula_auth_id == msg.doula_auth_id,
+        )
+        .values({
+            Conversation.last_text: case((is_newer, msg.text), else_=Conversation.last_text),
+            Conversation.last_at: case((is_newer, msg.created_at), else_=Conversation.last_at),
+            Conversation.last_sender_role: case((is_newer, msg.sender_role), else_=Conversation.last_sender_role),
+            col: col + 1,
+        })
+    )
+    for _ in range(2):
+        if session.exec(stmt).rowcount:
+            return
+        try:
+            # savepoint, so a lost race only undoes this INSERT and not the message
+            with session.begin_nested():
+                session.add(Conversation(
+                    mother_auth_id=msg.mother_auth_id,
+                    doula_auth_id=msg.doula_auth_id,
+                    last_text=msg.text,
+                    last_at=msg.created_at,
+                    last_sender_role=msg.sender_role,
+                    **{unread_col: 1},
+                ))
+            return
+        except IntegrityError:
+            continue
+    raise RuntimeError("Could not record the conversation for this message")
+
+
+def mark_conversation_read(session: Session, mother_auth_id, doula_auth_id, role: str, count: int) -> None:
+    """Takes `count` messages that were just marked read off the viewer's unread count."""
+    if count <= 0:
+        return
+    col = Conversation.unread_by_mother if role == "mother" else Conversation.unread_by_doula
+    session.exec(
+        update(Conversation)
+        .where(
+            Conversation.mother_auth_id == mother_auth_id,
+            Conversation.doula_auth_id == doula_auth_id,
+        )
+        .values({col: case((col > count, col - count), else_=0)})
+    )
+
+
+def rebuild_conversations(session: Session) -> int:
+    """
+    Recreates every conversation row from the messages table, in the caller's
+    transaction (the caller commits). Used to backfill databases that had messages
+    before the conversations table existed.
+    """
+    unread_mother = func.sum(case((text(UNREAD_BY_MOTHER), 1), else_=0))
+    unread_doula = func.sum(case((text(UNREAD_BY_DOULA), 1), else_=0))
+    pairs = session.exec(
+        select(
+            Message.mother_auth_id,
+            Message.doula_auth_id,
+            func.max(Message.id),
+            unread_mother,
+            unread_doula,
+        ).group_by(Message.mother_auth_id, Message.doula_auth_id)
+    ).all()
+
+    # last message of every pair in one query
+    last_ids = [p[2] for p in pairs]
+    last = {m.id: m for m in session.exec(select(Message).where(Message.id.in_(last_ids))).all()} if last_ids else {}
+
+    session.exec(delete(Conversation))
+
+    for mother_auth_id, doula_auth_id, last_id, n_mother, n_doula in pairs:
+        m = last[last_id]
+        session.add(Conversation(
+            mother_auth_id=mother_auth_id,
+            doula_auth_id=doula_auth_id,
+            last_text=m.text,
+            last_at=m.created_at,
+            last_sender_role=m.sender_role,
+            unread_by_mother=n_mother or 0,
+            unread_by_doula=n_doula or 0,
+        ))
+    session.flush()
+    return len(pairs)
+
+
+if __name__ == "__main__":
+    from backend.db import engine
+
+    with Session(engine) as session:
+        rebuilt = rebuild_conversations(session)
+        session.commit()
+        print("Rebuilt conversations:", rebuilt)
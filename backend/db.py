@@ -1,7 +1,15 @@
 # backend/db.py
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
+import importlib.util
 import os
+import threading
+import time
 
 # Load .env
 load_dotenv()
@@ -9,17 +17,220 @@ load_dotenv()
 DATABASE_URL = os.getenv("SUPABASE_DB_URL")
 print("DATABASE_URL =", DATABASE_URL)
 
+
+def env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Connection pool settings (all optional, defaults suit the Supabase pooler).
+# Each uvicorn worker has its own pool, so workers x (size + overflow) must stay
+# under the pooler's client limit.
+# https://docs.sqlalchemy.org/en/20/core/pooling.html
+# https://supabase.com/docs/guides/database/connecting-to-postgres
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# the pooler drops idle clients, so connections are replaced before that happens
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# checks a connection is still alive before handing it out
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+# Postgres cancels any single statement running longer than this (0 = no limit),
+# see set_statement_timeout below for how it is applied on each kind of connection
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+# SQL logging to stdout, for debugging only
+DB_ECHO = env_bool("DB_ECHO", False)
+
+# Checkouts that wait longer than this are counted as slow in pool_stats()
+SLOW_CHECKOUT_MS = 100
+
+
+class CheckoutTimer:
+    """
+    Pool mixin that records how long each checkout waited for a connection
+    (including opening a new one when the pool is not full yet).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = (time.perf_counter() - start) * 1000
+            with self.stats_lock:
+                self.wait_count += 1
+                self.wait_total_ms += waited
+                self.wait_max_ms = max(self.wait_max_ms, waited)
+                if waited > SLOW_CHECKOUT_MS:
+                    self.slow_checkouts += 1
+
+
+class TimedQueuePool(CheckoutTimer, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(CheckoutTimer, AsyncAdaptedQueuePool):
+    pass
+
+
+def is_transaction_pooler(url: str) -> bool:
+    """Supabase's transaction pooler (Supavisor, port 6543)."""
+    return ":6543" in url
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    options = {"echo": DB_ECHO}
+    if url.startswith("sqlite"):
+        # local testing only: keep SQLite's default pool
+        return options
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    # Supabase transaction pooler (port 6543) can't keep server-side prepared statements.
+    # url must be the one the engine is created with (the async one for the async engine).
+    # https://www.psycopg.org/psycopg3/docs/advanced/prepare.html#using-prepared-statements-with-pgbouncer
+    # https://docs.sqlalchemy.org/en/20/dialects/postgresql.html#prepared-statement-cache
+    if is_transaction_pooler(url):
+        if url.startswith("postgresql+psycopg:"):
+            options["connect_args"] = {"prepare_threshold": None}
+        elif url.startswith("postgresql+asyncpg:"):
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return options
+
+
+# Async drivers for the same databases, so one SUPABASE_DB_URL serves both engines.
+# Each scheme lists (dialect+driver, module) in order of preference; the first one
+# installed is used (psycopg 3 is in requirements.txt, asyncpg works too).
+# https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html
+ASYNC_DRIVERS = {
+    "postgresql": [("postgresql+psycopg", "psycopg"), ("postgresql+asyncpg", "asyncpg")],
+    "postgresql+psycopg2": [("postgresql+psycopg", "psycopg"), ("postgresql+asyncpg", "asyncpg")],
+    "sqlite": [("sqlite+aiosqlite", "aiosqlite")],
+    "mysql+pymysql": [("mysql+aiomysql", "aiomysql")],
+}
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    candidates = ASYNC_DRIVERS.get(scheme)
+    if candidates is None:
+        return url
+    for driver, module in candidates:
+        if importlib.util.find_spec(module) is not None:
+            return f"{driver}://{rest}"
+    modules = " or ".join(module for _, module in candidates)
+    raise RuntimeError(f"No async driver for {scheme}: pip install {modules} (see requirements.txt)")
+
+
 # Create engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+
+# Async engine for the hot read endpoints (async def + get_async_session), so they
+# wait on the database in the event loop instead of holding a threadpool thread.
+# It has its own pool with the same settings.
+ASYNC_DATABASE_URL = async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+
+
+# Supported connections:
+# - direct (db.<project>.supabase.co:5432) and the session pooler (pooler...:5432):
+#   the client keeps its server connection, so the timeout is SET once per connection.
+# - transaction pooler (:6543): each transaction may run on a different server
+#   connection, shared with other clients. A session-level SET would leak to them
+#   and not follow this client, so every transaction starts with SET LOCAL instead
+#   (one extra statement per transaction).
+# Statement-level pooling is not supported: it doesn't allow multi-statement transactions.
+# Setting the timeout on the database role (ALTER ROLE ... SET statement_timeout)
+# works on all of them; DB_STATEMENT_TIMEOUT_MS=0 then leaves it alone.
+# https://supabase.com/docs/guides/database/connecting-to-postgres#how-connection-pooling-works
+# https://www.postgresql.org/docs/current/sql-set.html
+if engine.dialect.name == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+    if is_transaction_pooler(DATABASE_URL):
+        @event.listens_for(engine, "begin")
+        @event.listens_for(async_engine.sync_engine, "begin")
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    else:
+        @event.listens_for(engine, "connect")
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def set_statement_timeout(dbapi_conn, connection_record):
+            cur = dbapi_conn.cursor()
+            cur.execute(f"SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+            cur.close()
+            # the SET opened a transaction on non-autocommit drivers; don't leave it open
+            dbapi_conn.commit()
+
+
+def pool_stats() -> dict:
+    """Connection pool usage of both engines for /admin/db-pool (this worker only)."""
+    return {"sync": _pool_stats(engine.pool), "async": _pool_stats(async_engine.pool)}
+
+
+def _pool_stats(pool) -> dict:
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            # negative until the pool has opened pool_size connections
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, CheckoutTimer):
+        with pool.stats_lock:
+            n = pool.wait_count
+            stats.update(
+                checkouts=n,
+                wait_avg_ms=round(pool.wait_total_ms / n, 2) if n else 0.0,
+                wait_max_ms=round(pool.wait_max_ms, 2),
+                slow_checkouts=pool.slow_checkouts,
+                timeouts=pool.timeouts,
+            )
+    return stats
+
 
 # Import ALL models so SQLModel knows about them
 from backend.models.user import User
 from backend.models.booking import Booking
+from backend.models.review import Review
+from backend.models.favourite import Favourite
+from backend.models.message import Message
+from backend.models.conversation import Conversation
+from backend.models.resources import Resource
+from backend.models.payment import CheckoutSession, StripeEvent
+from backend.models.availability_models import DoulaAvailability, DoulaAvailabilityException
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+# Async twin of get_session, for async def endpoints
+# expire_on_commit=False so returned objects can still be read after the session closes
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+# New tables come from create_all; indexes added to existing tables since come from
+# the migrations, a separate step: python -m backend.migrations upgrade
 def init_db():
     print("Creating tables in Supabase…")
     SQLModel.metadata.create_all(engine)
@@ -27,6 +238,3 @@ def init_db():
 
 if __name__ == "__main__":
     init_db()
-
-
-
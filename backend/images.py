@@ -0,0 +1,202 @@
+# backend/images.py
+# Smaller WebP copies of profile photos for list screens
+#
+# The doula lists used to download the full-size photo for every card. When a photo
+# is uploaded, a few fixed-size WebP versions are made next to it:
+#   static/images/<name>.jpg  ->  <name>_thumb.webp, <name>_small.webp, <name>_medium.webp
+# They can be asked for by file name (the suffix) or with ?size= on the original URL:
+#   /static/images/<name>.jpg?size=thumb
+# If a variant doesn't exist (yet), the original is served instead.
+#
+# Resizing is CPU work, so it runs in a process pool and never holds up the event loop
+# (or, thanks to separate processes, the other requests' Python code).
+# The workers are spawned, not forked: a fork of the running app would copy its
+# threads' locks, the event loop and open database connections mid-use.
+# Photos uploaded before this existed can be converted with:
+#   python -m backend.images backfill
+#
+# References:
+# - https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.thumbnail
+# - https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html#webp
+# - https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+# - https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+
+from backend.static_files import REVALIDATE_CACHE_CONTROL, CachedStaticFiles
+
+log = logging.getLogger(__name__)
+
+# Longest side in pixels for each variant
+VARIANT_SIZES: Dict[str, int] = {"thumb": 160, "small": 320, "medium": 640}
+VARIANT_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# start method of the pool processes (see the note at the top)
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+SOURCE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def variant_name(filename: str, size: str) -> str:
+    return f"{Path(filename).stem}_{size}.webp"
+
+
+def variant_source_stem(filename: str) -> Optional[str]:
+    """'abc_thumb.webp' -> 'abc'; None if filename is not a variant."""
+    path = Path(filename)
+    if path.suffix != ".webp":
+        return None
+    stem, _, size = path.stem.rpartition("_")
+    return stem if stem and size in VARIANT_SIZES else None
+
+
+def is_source_image(path: Path) -> bool:
+    return (
+        path.is_file()
+        and path.suffix.lower() in SOURCE_SUFFIXES
+        and variant_source_stem(path.name) is None
+        and not path.name.startswith(".")
+    )
+
+
+def make_variants(source: str) -> List[str]:
+    """
+    Writes the missing WebP variants of one image and returns their paths.
+    Runs in a worker process, so it takes and returns plain strings.
+    """
+    # imported here so the web workers only load Pillow in the pool processes
+    from PIL import Image, ImageOps
+
+    src = Path(source)
+    missing = {
+        size: src.with_name(variant_name(src.name, size))
+        for size in VARIANT_SIZES
+        if not src.with_name(variant_name(src.name, size)).exists()
+    }
+    if not missing:
+        return []
+
+    written = []
+    with Image.open(src) as img:
+        # phone photos are often stored sideways with an EXIF rotation flag
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+        # largest first, each one resized from the previous (fewer pixels to process)
+        for size, box in sorted(VARIANT_SIZES.items(), key=lambda kv: -kv[1]):
+            img.thumbnail((box, box), Image.Resampling.LANCZOS)  # never enlarges
+            dest = missing.get(size)
+            if dest is None:
+                continue
+            tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+            img.save(tmp, "WEBP", quality=VARIANT_QUALITY, method=4)
+            os.replace(tmp, dest)
+            written.append(str(dest))
+    return written
+
+
+class ImageVariants:
+    """Process pool that makes variants for new uploads. Started/stopped by the app lifespan."""
+
+    def __init__(self, workers: int = IMAGE_WORKERS) -> None:
+        self.workers = workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=POOL_CONTEXT)
+
+    def stop(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    async def generate(self, source: Path) -> List[str]:
+        """Makes the variants for one image. A bad image is logged, not raised: the original still works."""
+        self.start()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, make_variants, str(source))
+        except Exception as e:
+            log.warning("Could not make image variants for %s: %s", source.name, e)
+            return []
+
+
+class VariantStaticFiles(CachedStaticFiles):
+    """
+    Static files (with the caching headers from backend/static_files.py) that answer
+    /images/<file>?size=<variant> with the variant file when it exists, and with the
+    original otherwise.
+    """
+
+    async def get_response(self, path: str, scope):
+        size = _query_param(scope, "size")
+        fallback = False
+        if size:
+            if size not in VARIANT_SIZES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown size '{size}'. Use one of: {', '.join(VARIANT_SIZES)}",
+                )
+            folder, _, filename = path.rpartition("/")
+            if folder == "images" and variant_source_stem(filename) is None:
+                variant = f"{folder}/{variant_name(filename, size)}"
+                full_path, stat_result = await asyncio.to_thread(self.lookup_path, variant)
+                if stat_result:
+                    path = variant
+                else:
+                    fallback = True
+        response = await super().get_response(path, scope)
+        if fallback:
+            # the variant may exist later under this same URL, so don't let it be cached for good
+            response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+        return response
+
+
+def _query_param(scope, name: str) -> Optional[str]:
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(name)
+    return values[0] if values else None
+
+
+def backfill(directory: Path, workers: int = IMAGE_WORKERS) -> int:
+    """Makes the missing variants for every image in directory. Returns how many files were written."""
+    sources = [str(p) for p in sorted(directory.iterdir()) if is_source_image(p)]
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+        for source, result in zip(sources, pool.map(_safe_make_variants, sources)):
+            if isinstance(result, str):
+                print(f"Skipped {Path(source).name}: {result}")
+            else:
+                written += len(result)
+    return written
+
+
+def _safe_make_variants(source: str):
+    try:
+        return make_variants(source)
+    except Exception as e:
+        return str(e)
+
+
+image_variants = ImageVariants()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile photo variants")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    from backend.uploads import PHOTOS
+
+    print("Variants written:", backfill(PHOTOS.directory, workers=args.workers))
@@ -25,8 +25,7 @@ References used while building this:
 
 
 
-from fastapi import FastAPI,Depends, HTTPException, Query,UploadFile, File, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI,Depends, HTTPException, Query,UploadFile, File, Request, Response
 from sqlmodel import SQLModel, Session, create_engine, select
 from typing import List,Optional,Dict, Any
 from sqlalchemy import desc
@@ -34,29 +33,51 @@ from contextlib import asynccontextmanager
 from backend.models.user import User
 #to allow web/mobile development origins
 from fastapi.middleware.cors import CORSMiddleware
-from backend.db import engine, get_session
-from collections import deque
+from backend.db import async_engine, engine, get_async_session, get_session, pool_stats
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .models.booking import Booking
 from pathlib import Path
 #Random filenames for uploads
-from uuid import uuid4
 #file copy for uploads
-import shutil
+import asyncio
 from fastapi.responses import JSONResponse
 from datetime import datetime, timezone, time,date, timedelta
 from fastapi.routing import APIRoute
 from fastapi import WebSocket, WebSocketDisconnect
-from backend.chat import manager
-import requests
+from backend.chat import backplane, manager, private_manager
+from backend.request_log import RequestLogMiddleware, latency, request_logger
+from backend.transcribe import TranscriptionError, WhisperClient
+from backend.uploads import CERTIFICATES, PHOTOS, save_upload
+from backend.images import VARIANT_SIZES, VariantStaticFiles, image_variants
+from backend.search import doula_search, tokenize
+from backend.response_cache import (
+    DOULA_LIST, DOULA_PROFILE, RESOURCE_LIST, cache_key, catalogue_cache,
+)
+from backend.auth import AuthError, verify_access_token
+from backend.analytics import analytics, booking_deltas, combine, user_deltas
+from backend.payments import WebhookWorker, active_checkout, checkout_idempotency_key, save_checkout
+from backend.stripe_client import create_stripe_client
+from backend.unread import unread_counts
+from backend.availability import (
+    INACTIVE_BOOKING_STATUSES, AvailabilityData, booking_conflict, check_booking_period,
+    date_range, is_overlap_violation, lock_doula_bookings, may_be_free, parse_day, raise_conflict,
+)
+from backend.conversations import mark_conversation_read, record_message
+from backend.models.conversation import Conversation
+from backend.pagination import (
+    DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT, NEXT_CURSOR_HEADER, PAGE_LIMIT_HEADER,
+    fetch_rows, keyset, page_headers, set_page_headers, sort_key, split_page,
+)
 from dotenv import load_dotenv
 import os
-from sqlalchemy import and_
+from sqlalchemy import func, literal, text, update
+from sqlalchemy.exc import IntegrityError
 import stripe
 from pydantic import BaseModel
 from backend.schemas import ReviewCreate
 from backend.models.review import Review
 from backend.models.favourite import Favourite
-from backend.models.message import Message
+from backend.models.message import UNREAD_BY_DOULA, UNREAD_BY_MOTHER, Message
 from backend.models.resources import Resource
 from backend.models.availability_models import DoulaAvailability, DoulaAvailabilityException
 
@@ -74,15 +95,30 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # This function makes sure the database and tables are created before the app starts
 #From Youtube Video "How to connect to an online MySQL database using FastAPI"-https://www.youtube.com/watch?v=QuaNqXi-OwM- 3mins
+# Indexes for tables that already exist come from the migrations, run as a deploy
+# step: python -m backend.migrations upgrade (backend/migrations.py)
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
 
 #From Youtube Video "How to connect to an online MySQL database using FastAPI"-https://www.youtube.com/watch?v=QuaNqXi-OwM- 3mins
 # It runs create_db_and_tables() when the app starts
+# Also starts/stops the chat backplane (backend/backplane.py)
+# and gives the private message sockets the event loop, so send_message can push to them
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    request_logger.start()
+    await backplane.start()
+    await whisper.start()
+    await stripe_events.start()
+    private_manager.loop = asyncio.get_running_loop()
     yield
+    await backplane.stop()
+    await whisper.stop()
+    await stripe_events.stop()
+    image_variants.stop()
+    await async_engine.dispose()
+    request_logger.stop()
 
 #For my certifcates uploads
 #"Python FastAPI Tutorial #12 How to serve static files in FastAPI"- https://www.youtube.com/watch?v=nylnxFn1_U0
@@ -102,30 +138,30 @@ load_dotenv(dotenv_path=ENV_PATH)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 print("OPENAI_API_KEY loaded?", bool(OPENAI_API_KEY))
 
+# Shared Whisper client for /voice-search (pooled async HTTP + transcription cache)
+whisper = WhisperClient(api_key=OPENAI_API_KEY)
+
 
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 print("STRIPE key loaded?", bool(stripe.api_key))
 
+# Applies verified Stripe webhook events in the background (backend/payments.py)
+stripe_events = WebhookWorker(engine)
+# Live Stripe, or an offline fake with STRIPE_CLIENT=fake (backend/stripe_client.py)
+stripe_client = create_stripe_client()
+
 #Youtube video-Python FastAPI Tutorial #12 How to serve static files in FastAPI-https://www.youtube.com/watch?v=nylnxFn1_U0
 #anything inside STATIC_DIR is served under this path
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# profile photos can also be asked for as a smaller WebP with ?size=thumb|small|medium (backend/images.py)
+# ETag, Cache-Control (immutable for sha256/uuid names), 304s and Range requests: backend/static_files.py
+app.mount("/static", VariantStaticFiles(directory=str(STATIC_DIR)), name="static")
 print("STATIC_DIR:", STATIC_DIR)
 
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    print("========== NEW REQUEST ==========")
-    print(f"URL: {request.url}")
-    print(f"Client: {request.client.host}")
-    print(f"Method: {request.method}")
-    # you can comment this out if too noisy:
-    # print(f"Headers: {dict(request.headers)}")
-
-    response = await call_next(request)
-
-    print(f"Status code: {response.status_code}")
-    print("=================================")
-    return response
+# Request logging: one JSON line per request, written by a background thread,
+# plus latency histograms per route for /admin/latency (backend/request_log.py)
+# Replaces the old print() middleware, which blocked on stdout for every request
+app.add_middleware(RequestLogMiddleware, request_logger=request_logger, histograms=latency)
 
 # CORS (Cross-Origin Resource Sharing)
 #Allow local vite and Expo development origins
@@ -166,6 +202,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let web clients read the pagination headers (see backend/pagination.py)
+    # and the candidate cap of GET /availability/free-doulas
+    expose_headers=[NEXT_CURSOR_HEADER, PAGE_LIMIT_HEADER, "X-Candidates-Capped"],
 )
 
 #Uploads certificates PDF only
@@ -174,35 +213,25 @@ app.add_middleware(
 @app.post("/upload/certificate")
 async def upload_certificate(file: UploadFile = File(...)):
     # only PDFs for now
-    if file.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-
-    # save with random name to avoid collisions
-    filename = f"{uuid4()}.pdf"
-    dest = CERT_DIR / filename
-    #avoids reading entire file into memory at once
-    with dest.open("wb") as out:
-        shutil.copyfileobj(file.file, out)
+    # streamed to disk in chunks off the event loop and named by its sha256,
+    # so uploading the same PDF again returns the same URL (backend/uploads.py)
+    url = await save_upload(file, CERTIFICATES)
 
     # return a path under /static so the frontend can open it directly
-    return {"url": f"/static/certificates/{filename}"}
-
-ALLOWED_IMAGE_MIME = {"image/jpeg", "image/png", "image/webp"}
-EXT_BY_MIME = {
-    "image/jpeg": ".jpg",
-    "image/png": ".png",
-    "image/webp": ".webp",
-}
+    return {"url": url}
 
+# JPG/PNG/WebP, stored the same way as certificates
+# The WebP variants for list screens are made in the image process pool before
+# returning, so they are there as soon as the app shows the photo
 @app.post("/upload/photo")
 async def upload_photo(file: UploadFile = File(...)):
-    if file.content_type not in ALLOWED_IMAGE_MIME:
-        raise HTTPException(status_code=400, detail="Only JPG/PNG/WebP allowed")
-    filename = f"{uuid4()}{EXT_BY_MIME[file.content_type]}"
-    dest = IMAGE_DIR / filename
-    with dest.open("wb") as out:
-        shutil.copyfileobj(file.file, out)
-    return {"url": f"/static/images/{filename}"}
+    url = await save_upload(file, PHOTOS)
+    filename = url.rsplit("/", 1)[1]
+    await image_variants.generate(PHOTOS.directory / filename)
+    return {
+        "url": url,
+        "variants": {size: f"{url}?size={size}" for size in VARIANT_SIZES},
+    }
 
 # POST endpoint to add a new user to the database
 #Create a new user
@@ -215,15 +244,24 @@ def create_user(user: User):
         session.add(user)
         session.commit()       # Go to DB
         session.refresh(user)  # Get the newly added user with its ID
+        analytics.bump(user_deltas(user.role, user.verified))
+        catalogue_cache.user_changed(user.id, user.role)
         return user
 
 
 # GET endpoint to retrieve all users from the database
+# Paged by id: pass the X-Next-Cursor header from the previous page as ?cursor=
 @app.get("/users", response_model=List[User])
 @app.get("/users/", response_model=List[User])
-def get_users():
+def get_users(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+):
     with Session(engine) as session:
-        users = session.exec(select(User)).all()
+        stmt = keyset(select(User), [User.id], cursor, limit)
+        users, next_cursor = split_page(session.execute(stmt).all(), limit)
+        set_page_headers(response, limit, next_cursor)
         return users
 
 
@@ -237,6 +275,8 @@ def update_user(user_id: int, updated_user: User):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
+        before = user_deltas(user.role, user.verified, -1)
+        role_before = user.role
         # Update only the fields provided
         for key, value in updated_user.dict(exclude_unset=True).items():
             setattr(user, key, value)
@@ -244,6 +284,8 @@ def update_user(user_id: int, updated_user: User):
         session.add(user)
         session.commit()
         session.refresh(user)
+        analytics.bump(combine(before, user_deltas(user.role, user.verified)))
+        catalogue_cache.user_changed(user.id, role_before, user.role)
         return user
 
 
@@ -291,9 +333,12 @@ def to_naive_utc(dt: datetime | None) -> datetime | None:
 # Create a booking
 #Validates mother_id/doula_id
 #Stores tz-naive datetimes not strings
+# 409 if the doula already has an active booking overlapping this one (backend/availability.py)
 @app.post("/bookings", response_model=Booking)
 def create_booking(booking: Booking):
     with Session(engine) as session:
+        # before any other read, see lock_doula_bookings
+        lock_doula_bookings(session, booking.doula_id)
         mother = session.get(User, booking.mother_id)
         doula  = session.get(User, booking.doula_id)
 
@@ -311,53 +356,81 @@ def create_booking(booking: Booking):
 
         booking.starts_at = to_naive_utc(starts)
         booking.ends_at   = to_naive_utc(ends)
+        check_booking_period(booking.starts_at, booking.ends_at)
+
+        if booking.status not in INACTIVE_BOOKING_STATUSES:
+            clash = booking_conflict(session, doula.id, booking.starts_at, booking.ends_at)
+            if clash:
+                raise_conflict(clash)
 
         session.add(booking)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:
+            # another request booked the same time between the check and the insert
+            session.rollback()
+            if is_overlap_violation(e):
+                raise_conflict()
+            raise
         session.refresh(booking)
+        analytics.bump(booking_deltas(booking.status))
         return booking
 
 
 
 
 # List all bookings (useful for debugging)
+# Paged by (starts_at, id), same cursor/limit params as GET /users
 @app.get("/bookings", response_model=List[Booking])
 @app.get("/bookings/", response_model=List[Booking])
-def get_bookings():
+def get_bookings(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+):
     with Session(engine) as session:
-        return session.exec(select(Booking)).all()
+        stmt = keyset(select(Booking), [Booking.starts_at, Booking.id], cursor, limit)
+        bookings, next_cursor = split_page(session.execute(stmt).all(), limit)
+        set_page_headers(response, limit, next_cursor)
+        return bookings
+
+# Shared projector for the booking detail endpoints below.
+# The other party's columns are selected in the same query (Booking ⋈ User)
+# instead of calling session.get(User, ...) once per booking (N+1 round trips).
+# Columns are labelled with the JSON keys, so each row maps straight to the response dict.
+# Outer join keeps bookings whose user row is missing (fields come back as None, same as before).
+#https://docs.sqlalchemy.org/en/20/orm/queryguide/select.html#joins
+BOOKING_DETAIL_TAIL = (Booking.starts_at, Booking.ends_at, Booking.mode, Booking.status)
+
+# The detail endpoints are async (see get_async_session in backend/db.py), so they wait
+# for the database on the event loop instead of each holding a threadpool thread.
+async def booking_details(session: AsyncSession, *other_columns, join_on, where) -> List[Dict[str, Any]]:
+    stmt = (
+        select(Booking.id.label("booking_id"), *other_columns, *BOOKING_DETAIL_TAIL)
+        .outerjoin(User, join_on)
+        .where(where)
+    )
+    return [dict(row._mapping) for row in await session.exec(stmt)]
 
 # List bookings by mother
 
-
 #For a mother her bookings will include doula name
 @app.get("/bookings/by-mother/{mother_id}/details")
-def get_bookings_for_mother_detailed(mother_id: int):
-   with Session(engine) as session:
-       mother = session.get(User, mother_id)
-       if not mother or mother.role != "mother":
-           raise HTTPException(404, "Mother not found")
-
-
-       bookings = session.exec(
-           select(Booking).where(Booking.mother_id == mother_id)
-       ).all()
-       # Ensures mothers can see full doula names after bookings not just ID
-       result = []
-       for b in bookings:
-           doula = session.get(User, b.doula_id)
-           result.append({
-               "booking_id": b.id,
-               "doula_name": doula.name if doula else None,
-               "verified": doula.verified if doula else None,
-               "starts_at": b.starts_at,
-               "ends_at": b.ends_at,
-               "mode": b.mode,
-               "status": b.status
-           })
+async def get_bookings_for_mother_detailed(mother_id: int, session: AsyncSession = Depends(get_async_session)):
+   mother = await session.get(User, mother_id)
+   if not mother or mother.role != "mother":
+       raise HTTPException(404, "Mother not found")
 
 
-       return result
+   # One Booking ⋈ User query instead of a session.get() per booking
+   # Ensures mothers can see full doula names after bookings not just ID
+   return await booking_details(
+       session,
+       User.name.label("doula_name"),
+       User.verified.label("verified"),
+       join_on=User.id == Booking.doula_id,
+       where=Booking.mother_id == mother_id,
+   )
 
 
 
@@ -366,37 +439,23 @@ def get_bookings_for_mother_detailed(mother_id: int):
 #Helps the doula see who/where the booking is
 @app.get("/bookings/by-doula/{doula_id}")
 @app.get("/bookings/by-doula/{doula_id}/")
-def get_bookings_for_doula(doula_id: int):
-   with Session(engine) as session:
-       # ensure the doula exists
-       doula = session.get(User, doula_id)
-       if not doula or doula.role != "doula":
-           raise HTTPException(404, "Doula not found")
-
-
-       # get all bookings for this doula
-       bookings = session.exec(
-           select(Booking).where(Booking.doula_id == doula_id)
-       ).all()
-
-
-       # includes bookings with mother details not just id so its clear to the doula
-       result = []
-       for b in bookings:
-           mother = session.get(User, b.mother_id)
-           result.append({
-               "booking_id": b.id,
-               "mother_name": mother.name if mother else None,
-               "doula_name": doula.name if doula else None,
-               "location": mother.location if mother else None,
-               "starts_at": b.starts_at,
-               "ends_at": b.ends_at,
-               "mode": b.mode,
-               "status": b.status
-           })
-
-
-       return result
+async def get_bookings_for_doula(doula_id: int, session: AsyncSession = Depends(get_async_session)):
+   # ensure the doula exists
+   doula = await session.get(User, doula_id)
+   if not doula or doula.role != "doula":
+       raise HTTPException(404, "Doula not found")
+
+
+   # get all bookings for this doula, joined to the mother in the same query
+   # includes bookings with mother details not just id so its clear to the doula
+   return await booking_details(
+       session,
+       User.name.label("mother_name"),
+       literal(doula.name).label("doula_name"),
+       User.location.label("location"),
+       join_on=User.id == Booking.mother_id,
+       where=Booking.doula_id == doula_id,
+   )
 
 from uuid import UUID
 @app.get("/users/by-auth/{auth_id}", response_model=User)
@@ -438,6 +497,8 @@ def bootstrap_user(payload: AuthBootstrap):
                 changed = True
 
             # keep role in sync
+            before = user_deltas(existing.role, existing.verified, -1)
+            role_before = existing.role
             if payload.role and existing.role != payload.role:
                 existing.role = payload.role
                 changed = True
@@ -446,6 +507,8 @@ def bootstrap_user(payload: AuthBootstrap):
                 session.add(existing)
                 session.commit()
                 session.refresh(existing)
+                analytics.bump(combine(before, user_deltas(existing.role, existing.verified)))
+                catalogue_cache.user_changed(existing.id, role_before, existing.role)
 
             return existing
 
@@ -459,71 +522,55 @@ def bootstrap_user(payload: AuthBootstrap):
         session.add(user)
         session.commit()
         session.refresh(user)
+        analytics.bump(user_deltas(user.role, user.verified))
+        catalogue_cache.user_changed(user.id, user.role)
         return user
 
 #used the same as the other bookings but now using auth id for the log in
 @app.get("/bookings/by-mother-auth/{mother_auth_id}/details")
-def get_bookings_for_mother_by_auth_detailed(mother_auth_id: UUID):
-    with Session(engine) as session:
-        # map auth uuid  internal user
-        mother = session.exec(
-            select(User).where(User.auth_id == mother_auth_id)
-        ).first()
-        if not mother or mother.role != "mother":
-            raise HTTPException(404, "Mother not found for this auth_id")
-
-        # use existing int FK (works even if mother_auth_id is NULL)
-        bookings = session.exec(
-            select(Booking).where(Booking.mother_id == mother.id)
-        ).all()
-
-        result = []
-        for b in bookings:
-            doula = session.get(User, b.doula_id)
-            result.append({
-                "booking_id": b.id,
-                "doula_name": doula.name if doula else None,
-                "verified": doula.verified if doula else None,
-                "starts_at": b.starts_at,
-                "ends_at": b.ends_at,
-                "mode": b.mode,
-                "status": b.status,
-            })
-        return result
+async def get_bookings_for_mother_by_auth_detailed(
+    mother_auth_id: UUID, session: AsyncSession = Depends(get_async_session)
+):
+    # map auth uuid  internal user
+    mother = (await session.exec(
+        select(User).where(User.auth_id == mother_auth_id)
+    )).first()
+    if not mother or mother.role != "mother":
+        raise HTTPException(404, "Mother not found for this auth_id")
+
+    # use existing int FK (works even if mother_auth_id is NULL)
+    return await booking_details(
+        session,
+        User.name.label("doula_name"),
+        User.verified.label("verified"),
+        join_on=User.id == Booking.doula_id,
+        where=Booking.mother_id == mother.id,
+    )
 
 
 @app.get("/bookings/by-doula-auth/{doula_auth_id}")
-def get_bookings_for_doula_by_auth(doula_auth_id: UUID):
-    with Session(engine) as session:
-        # map auth uuid internal user
-        doula = session.exec(
-            select(User).where(User.auth_id == doula_auth_id)
-        ).first()
-        if not doula or doula.role != "doula":
-            raise HTTPException(404, "Doula not found for this auth_id")
-
-        # use existing int FK (works even if doula_auth_id is NULL)
-        bookings = session.exec(
-            select(Booking).where(Booking.doula_id == doula.id)
-        ).all()
-
-        result = []
-        for b in bookings:
-            mother = session.get(User, b.mother_id)
-            result.append({
-                "booking_id": b.id,
-                "mother_name": mother.name if mother else None,
-                "doula_name": doula.name,
-                "care_needs": mother.care_needs if mother else None,
-                "preferred_support": mother.preferred_support if mother else None,
-                "notes": mother.notes if mother else None,
-                "location": mother.location if mother else None,
-                "starts_at": b.starts_at,
-                "ends_at": b.ends_at,
-                "mode": b.mode,
-                "status": b.status,
-            })
-        return result
+async def get_bookings_for_doula_by_auth(
+    doula_auth_id: UUID, session: AsyncSession = Depends(get_async_session)
+):
+    # map auth uuid internal user
+    doula = (await session.exec(
+        select(User).where(User.auth_id == doula_auth_id)
+    )).first()
+    if not doula or doula.role != "doula":
+        raise HTTPException(404, "Doula not found for this auth_id")
+
+    # use existing int FK (works even if doula_auth_id is NULL)
+    return await booking_details(
+        session,
+        User.name.label("mother_name"),
+        literal(doula.name).label("doula_name"),
+        User.care_needs.label("care_needs"),
+        User.preferred_support.label("preferred_support"),
+        User.notes.label("notes"),
+        User.location.label("location"),
+        join_on=User.id == Booking.mother_id,
+        where=Booking.doula_id == doula.id,
+    )
 
 # small helper model for the status update body
 class BookingStatusUpdate(SQLModel):
@@ -533,7 +580,8 @@ class BookingStatusUpdate(SQLModel):
 @app.post("/bookings/{booking_id}/status", response_model=Booking)
 def update_booking_status(booking_id: int, payload: BookingStatusUpdate):
     with Session(engine) as session:
-        booking = session.get(Booking, booking_id)
+        # a locking read, so the overlap check below sees bookings committed since (MySQL)
+        booking = session.get(Booking, booking_id, with_for_update=True)
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
 
@@ -545,71 +593,131 @@ def update_booking_status(booking_id: int, payload: BookingStatusUpdate):
                        f"Must be one of {', '.join(sorted(allowed))}."
             )
 
+        old_status = booking.status
+        # a declined/cancelled booking coming back must not overlap one made since
+        if old_status in INACTIVE_BOOKING_STATUSES and payload.status not in INACTIVE_BOOKING_STATUSES:
+            lock_doula_bookings(session, booking.doula_id)
+            clash = booking_conflict(session, booking.doula_id, booking.starts_at, booking.ends_at, booking.id)
+            if clash:
+                raise_conflict(clash)
+
         booking.status = payload.status
         session.add(booking)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:
+            session.rollback()
+            if is_overlap_violation(e):
+                raise_conflict()
+            raise
         session.refresh(booking)
+        # moves one booking from the old status counter to the new one
+        analytics.bump(combine(booking_deltas(old_status, -1), booking_deltas(booking.status)))
         return booking
 
-#Returns filtered/sorted list of doulas
-# q searches name/location/qualifications/services
-#verirified toggles only verified doulas
-
-@app.get("/doulas", response_model=List[User])
-@app.get("/doulas/", response_model=List[User])
-def get_doulas(
-   verified: bool = True,
-   location: Optional[str] = None,
-   min_price: Optional[float] = None,
-   max_price: Optional[float] = None,
-   q: Optional[str] = None,   # for text search
-   sort_by: Optional[str] = None
+# Filters shared by GET /doulas and GET /availability/free-doulas
+# Returns the statement and the search (match, rank) pair, or None when there is no q
+def filter_doulas(
+   stmt,
+   verified: bool,
+   location: Optional[str],
+   min_price: Optional[float],
+   max_price: Optional[float],
+   q: Optional[str],
 ):
-   with Session(engine) as session:
-       stmt = select(User).where(User.role == "doula")
+   stmt = stmt.where(User.role == "doula")
 
 
-       if verified:
-           stmt = stmt.where(User.verified == True)
+   if verified:
+       stmt = stmt.where(User.verified == True)
 
 
-       if location:
-           stmt = stmt.where(User.location.ilike(f"%{location}%"))
+   if location:
+       stmt = stmt.where(User.location.ilike(f"%{location}%"))
 
 
-       # New min_price support - filter= Youtube vide https://www.youtube.com/watch?v=BR2rrnTavmY&t=24s
-       if min_price is not None:
-           stmt = stmt.where(User.price >= min_price)
+   # New min_price support - filter= Youtube vide https://www.youtube.com/watch?v=BR2rrnTavmY&t=24s
+   if min_price is not None:
+       stmt = stmt.where(User.price >= min_price)
 
 
-       if max_price is not None:
-           stmt = stmt.where(User.price <= max_price)
+   if max_price is not None:
+       stmt = stmt.where(User.price <= max_price)
 
 
-       # Search term (name, location, etc.)
-       # .ilike() performs a case-insensitive text match (similar to SQL ILIKE)
-       # e.g. filters users where "location" includes the search term, ignoring case
-       if q:
-           like = f"%{q}%"
-           stmt = stmt.where(
-               (User.name.ilike(like)) |
-               (User.location.ilike(like)) |
-               (User.qualifications.ilike(like)) |
-               (User.services.ilike(like))
-           )
+   # Search term (name, location, etc.)
+   # On Postgres this is a tokenized prefix match served by a GIN index,
+   # plus trigram matching on the name so small typos still find the doula
+   search = doula_search(q, engine.dialect.name)
+   if search is not None:
+       match, rank = search
+       stmt = stmt.where(match)
 
+   return stmt, search
 
-       # Sorting support
-       # stmt short for statement- it’s a variable that holds your SQL query before it gets sent to the database
-       if sort_by == "price":
-           stmt = stmt.order_by(User.price)
-       elif sort_by == "name":
-           stmt = stmt.order_by(User.name)
-       elif sort_by == "location":
-           stmt = stmt.order_by(User.location)
 
+#Returns filtered/sorted list of doulas
+# q searches name/location/qualifications/services (ranked full-text search, see backend/search.py)
+#verirified toggles only verified doulas
+# sort_by: price | name | location | relevance (relevance needs q)
+# Paged with cursor/limit like GET /users; the cursor follows whichever sort is used
+# Pages are cached per normalized query and sent with an ETag (backend/response_cache.py)
 
-       return session.exec(stmt).all()
+@app.get("/doulas", response_model=List[User])
+@app.get("/doulas/", response_model=List[User])
+async def get_doulas(
+   request: Request,
+   verified: bool = True,
+   location: Optional[str] = None,
+   min_price: Optional[float] = None,
+   max_price: Optional[float] = None,
+   q: Optional[str] = None,   # for text search
+   sort_by: Optional[str] = None,
+   cursor: Optional[str] = None,
+   limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+   session: AsyncSession = Depends(get_async_session),
+):
+   # Same results for "Birth  Support" and "birth support", so one cache entry
+   q = " ".join(tokenize(q)) or None
+   location = location.lower() if location else None
+   if sort_by not in ("price", "name", "location", "relevance") or (sort_by == "relevance" and not q):
+       sort_by = None
+
+   key = cache_key(
+       DOULA_LIST, verified=verified, location=location, min_price=min_price, max_price=max_price,
+       q=q, sort_by=sort_by, cursor=cursor, limit=limit,
+   )
+   cached = catalogue_cache.get(key)
+   if cached is not None:
+       return catalogue_cache.respond(request, cached)
+   generation = catalogue_cache.generation(DOULA_LIST)
+
+   stmt, search = filter_doulas(select(User), verified, location, min_price, max_price, q)
+
+
+   # Sorting support
+   # stmt short for statement- it’s a variable that holds your SQL query before it gets sent to the database
+   # Each sort becomes the page key, with id last so ties keep a stable order.
+   # Users made by /users/bootstrap have no price or location yet, so those keys
+   # go through sort_key(): a missing value sorts first, as 0 / ""
+   descending = False
+   if sort_by == "price":
+       keys = [sort_key(User.price, 0), User.id]
+   elif sort_by == "name":
+       keys = [sort_key(User.name, ""), User.id]
+   elif sort_by == "location":
+       keys = [sort_key(User.location, ""), User.id]
+   elif sort_by == "relevance" and search is not None:
+       # best matches first; similarity() of a NULL name is NULL
+       keys = [sort_key(search[1], 0.0), User.id]
+       descending = True
+   else:
+       keys = [User.id]
+
+   stmt = keyset(stmt, keys, cursor, limit, descending=descending)
+   doulas, next_cursor = split_page(await fetch_rows(session, stmt), limit)
+   entry = catalogue_cache.put(key, generation, doulas, page_headers(limit, next_cursor))
+   return catalogue_cache.respond(request, entry)
 
 
 
@@ -617,12 +725,17 @@ def get_doulas(
 # Get a single doula by id for clickable profiles
 @app.get("/doulas/{doula_id}", response_model=User)
 @app.get("/doulas/{doula_id}/", response_model=User)
-def get_doula_by_id(doula_id: int):
-    with Session(engine) as session:
-        doula = session.get(User, doula_id)
-        if not doula or doula.role != "doula":
-            raise HTTPException(status_code=404, detail="Doula not found")
-        return doula
+async def get_doula_by_id(doula_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
+    key = cache_key(DOULA_PROFILE, doula_id=doula_id)
+    cached = catalogue_cache.get(key)
+    if cached is not None:
+        return catalogue_cache.respond(request, cached)
+    generation = catalogue_cache.generation(DOULA_PROFILE)
+
+    doula = await session.get(User, doula_id)
+    if not doula or doula.role != "doula":
+        raise HTTPException(status_code=404, detail="Doula not found")
+    return catalogue_cache.respond(request, catalogue_cache.put(key, generation, doula, {}))
 
 
 
@@ -678,22 +791,23 @@ def debug_routes():
 
 
 # Single "community" chat room for all moms and doulas
-# keep last 100 messages in memory
-chat_history = deque(maxlen=100)
+# the last 100 messages are kept by the backplane, so every worker has the same history
 
 @app.websocket("/chat")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-
     #  Send chat history as a normal list (JSON serializable)
-    await websocket.send_json(list(chat_history))
+    # it goes through the socket's send queue, ahead of any new messages
+    # (connect fetches it after registering the socket, see backend/chat.py)
+    await manager.connect(websocket)
 
     try:
         while True:
             data = await websocket.receive_json()  # {sender, text, time}
-            chat_history.append(data)
-            await manager.broadcast(data)
+            # published once; every worker (including this one) broadcasts it to its sockets
+            await manager.publish(data)
     except WebSocketDisconnect:
+        pass
+    finally:
         await manager.disconnect(websocket)
 
 
@@ -710,43 +824,17 @@ async def voice_search(file: UploadFile = File(...)):
 
     # Read audio file into memory
     audio_data = await file.read()
-    print("VOICE-SEARCH file:", file.filename, file.content_type, "bytes:", len(audio_data))
-    print("OPENAI_API_KEY loaded?", bool(OPENAI_API_KEY))
 
-    if not OPENAI_API_KEY:
+    if whisper.needs_api_key and not OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="Missing OPENAI_API_KEY")
 
-    # Prepare request headers and form data for Whisper
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    files = {
-        "file": (file.filename, audio_data, file.content_type),
-        "model": (None, "whisper-1"),
-        "response_format": (None, "json"),
-        "language": (None, "en"), # focring english
-    }
-
-    # Send request to OpenAI Whisper API
-    response = requests.post(
-        "https://api.openai.com/v1/audio/transcriptions",
-        headers=headers,
-        files=files,
-    )
-    # Try to read the response as JSON; use raw text if that fails
+    # Sent to Whisper without blocking the event loop (backend/transcribe.py);
+    # the same audio again is answered from the cache
     try:
-        data = response.json()
-    except Exception:
-        data = {"raw": response.text}
-
-    print("OpenAI status:", response.status_code)
-    print("OpenAI body:", data)
-    # Handle any error returned by OpenAI
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=response.status_code,
-            detail=data,
-        )
-    # Extract transcription text from JSON
-    transcription = data.get("text", "")
+        transcription = await whisper.transcribe(audio_data, file.filename, file.content_type)
+    except TranscriptionError as e:
+        # Handle any error returned by OpenAI
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     return JSONResponse(content={"text": transcription})
 
 # Stripe Checkout success and cancel redirect handlers
@@ -765,10 +853,12 @@ def payments_cancel():
 # https://medium.com/@abdulikram/building-a-payment-backend-with-fastapi-stripe-checkout-and-webhooks-08dc15a32010
 # Core Checkout Session structure follows the reference; booking logic and validation are custom
 
-@app.post("/payments/checkout")
-def payments_checkout(payload: CheckoutRequest):
+# The same open session is returned again until it is about to expire, and new ones are
+# created with an idempotency key (backend/payments.py), so double taps cost one session.
+# Database work and the Stripe call run in threads, off the event loop.
+def prepare_checkout(booking_id: int) -> Dict[str, Any]:
     with Session(engine) as session:
-        booking = session.get(Booking, payload.booking_id)
+        booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(404, "Booking not found")
 
@@ -782,8 +872,15 @@ def payments_checkout(payload: CheckoutRequest):
         if not doula:
             raise HTTPException(400, "Invalid doula_id")
 
+        if doula.price is None:
+            raise HTTPException(400, "Doula has not set a price")
+
         amount_cents = int(float(doula.price) * 100)
 
+        active = active_checkout(session, booking.id, amount_cents)
+        if active:
+            return {"booking_id": booking.id, "amount_cents": amount_cents, "url": active.url}
+
 
         success_url = os.getenv(
             "STRIPE_SUCCESS_URL",
@@ -799,7 +896,7 @@ def payments_checkout(payload: CheckoutRequest):
         # Otherwise store booking.id (primary key).
         booking_meta_id = getattr(booking, "booking_id", None) or booking.id
 
-        checkout = stripe.checkout.Session.create(
+        params = dict(
             mode="payment",
             line_items=[
                 {
@@ -812,12 +909,39 @@ def payments_checkout(payload: CheckoutRequest):
                 }
             ],
             metadata={"booking_id": str(booking_meta_id)},
+            # copied onto the PaymentIntent, so payment_intent.succeeded names the booking too
+            payment_intent_data={"metadata": {"booking_id": str(booking_meta_id)}},
             success_url=success_url,
             cancel_url=cancel_url,
         )
+        return {
+            "booking_id": booking.id,
+            "amount_cents": amount_cents,
+            "params": params,
+            "idempotency_key": checkout_idempotency_key(session, booking.id, amount_cents),
+        }
+
+
+@app.post("/payments/checkout")
+async def payments_checkout(payload: CheckoutRequest):
+    plan = await asyncio.to_thread(prepare_checkout, payload.booking_id)
+    if plan.get("url"):
+        return {"url": plan["url"]}
+
+    try:
+        checkout = await asyncio.to_thread(
+            stripe_client.create_checkout_session, plan["params"], plan["idempotency_key"]
+        )
+    except stripe.StripeError as e:
+        raise HTTPException(status_code=502, detail=f"Stripe error: {e.user_message or e}")
 
-        return {"url": checkout.url}
+    # lets the webhook match the session to the booking, and the next tap reuse it
+    await asyncio.to_thread(save_checkout, engine, plan["booking_id"], plan["amount_cents"], checkout)
+    return {"url": checkout["url"]}
 
+# Verifies the signature, saves the event and answers straight away; the booking is
+# updated by the background worker (backend/payments.py). Retries/duplicates of an
+# event id that was already received are acknowledged and ignored.
 @app.post("/payments/webhook")
 async def stripe_webhook(request: Request):
     payload = await request.body()
@@ -829,38 +953,8 @@ async def stripe_webhook(request: Request):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    event_type = event["type"]
-    obj = event["data"]["object"]
-
-    print("WEBHOOK EVENT TYPE:", event_type)
-
-    booking_id = None
-
-    # 1) Preferred: checkout session completed (has metadata booking_id)
-    if event_type == "checkout.session.completed":
-        booking_id = obj.get("metadata", {}).get("booking_id")
-
-    # 2) Also handle payment intent succeeded
-    # This may not include booking metadata unless you set it,
-    if event_type == "payment_intent.succeeded":
-        pi_id = obj.get("id")
-        try:
-            sessions = stripe.checkout.Session.list(payment_intent=pi_id, limit=1)
-            if sessions.data:
-                booking_id = sessions.data[0].get("metadata", {}).get("booking_id")
-        except Exception as e:
-            print("Could not map payment_intent to session:", e)
-
-    if booking_id:
-        with Session(engine) as db:
-            booking = db.get(Booking, int(booking_id))
-            if booking and booking.status in ("confirmed",):
-                booking.status = "paid"
-                db.add(booking)
-                db.commit()
-                print("Booking marked paid:", booking_id)
-
-    return {"received": True}
+    queued = await stripe_events.receive(event["id"], event["type"], payload.decode("utf-8"))
+    return {"received": True, "duplicate": not queued}
 
 # Helper endpoint to check review eligibility
 # Uses same booking-status business rule as POST /reviews (must be paid)
@@ -906,18 +1000,27 @@ def create_review(payload: ReviewCreate, session: Session = Depends(get_session)
     session.add(review)
     session.commit()
     session.refresh(review)
+    analytics.bump({"total_reviews": 1})
     return review
 
 #mothers can now see reviews left by other mothers on the doula profile
+# Newest first, paged by (created_at, id) with cursor/limit like GET /users
 @app.get("/reviews/by-doula/{doula_id}")
-def reviews_by_doula(doula_id: int, session: Session = Depends(get_session)):
+def reviews_by_doula(
+    doula_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    session: Session = Depends(get_session),
+):
     # Same query pattern used in booking retrieval
     # https://docs.sqlalchemy.org/en/20/orm/queryguide/select.html#sqlalchemy.orm.Select.where
-    reviews = session.exec(
-        select(Review)
-        .where(Review.doula_id == doula_id)
-        .order_by(Review.created_at.desc())
-    ).all()
+    stmt = keyset(
+        select(Review).where(Review.doula_id == doula_id),
+        [Review.created_at, Review.id], cursor, limit, descending=True,
+    )
+    reviews, next_cursor = split_page(session.execute(stmt).all(), limit)
+    set_page_headers(response, limit, next_cursor)
 
 
     # Similar to booking responses:
@@ -1076,36 +1179,79 @@ def send_message(body: SendMessageBody, sender_auth_id: UUID, sender_role: str):
         )
 
         session.add(msg)
+        # conversation summary (last message + unread count) is saved in the same transaction
+        record_message(session, msg)
         session.commit()
         session.refresh(msg)
+        analytics.bump({"total_messages": 1})
+        # the receiver has one more unread message (only changes an already cached count)
+        receiver_role = "doula" if sender_role == "mother" else "mother"
+        unread_counts.add(body.receiver_auth_id, receiver_role, 1)
+
+        # push the message and the badge change to the receiver's open sockets
+        # (/messages/ws); apps without a socket still see it on their next poll
+        private_manager.notify_threadsafe(
+            body.receiver_auth_id, receiver_role, message_event(msg), unread_delta_event(1),
+        )
 
         return {"id": msg.id, "created_at": msg.created_at}
 
 
 #Adapted from Chatgpt: forces ordered message retreived for a single conversation.
 #Returns only required fields instead of exposing full Message objects.
+# Pages walk backwards from the newest message: the first page is the latest `limit` messages,
+# X-Next-Cursor fetches the ones before that. Each page is still returned oldest-first.
+# Incremental sync (ordered by id, served by ix_messages_thread):
+# - after_id (and/or since): only the messages newer than the ones the app already has,
+#   oldest first. X-Next-Cursor is set when there are more than limit of them.
+# - before_id: the limit messages just before the oldest one on screen (scrolling back)
+# In these modes the cursor from X-Next-Cursor continues in the same direction.
 @app.get("/messages/thread")
-def get_thread(mother_auth_id: UUID, doula_auth_id: UUID):
-    with Session(engine) as session:
-        msgs = session.exec(
-            select(Message)
-            .where(
-                Message.mother_auth_id == mother_auth_id,
-                Message.doula_auth_id == doula_auth_id
-            )
-            .order_by(Message.created_at)
-        ).all()
-
-        # Return only fields needed by mobile UI (keeps response small)
-        return [
-            {
-                "id": m.id,
-                "sender_role": m.sender_role,
-                "text": m.text,
-                "created_at": m.created_at,
-            }
-            for m in msgs
-        ]
+async def get_thread(
+    mother_auth_id: UUID,
+    doula_auth_id: UUID,
+    response: Response,
+    cursor: Optional[str] = None,
+    after_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    session: AsyncSession = Depends(get_async_session),
+):
+    thread = select(Message).where(
+        Message.mother_auth_id == mother_auth_id,
+        Message.doula_auth_id == doula_auth_id
+    )
+    newer = after_id is not None or since is not None
+    if newer and before_id is not None:
+        raise HTTPException(status_code=400, detail="Use after_id/since or before_id, not both")
+
+    if newer:
+        if after_id is not None:
+            thread = thread.where(Message.id > after_id)
+        if since is not None:
+            thread = thread.where(Message.created_at > to_naive_utc(since))
+        stmt = keyset(thread, [Message.id], cursor, limit)
+    elif before_id is not None:
+        stmt = keyset(thread.where(Message.id < before_id), [Message.id], cursor, limit, descending=True)
+    else:
+        stmt = keyset(thread, [Message.created_at, Message.id], cursor, limit, descending=True)
+
+    msgs, next_cursor = split_page(await fetch_rows(session, stmt), limit)
+    if not newer:
+        msgs.reverse()
+    set_page_headers(response, limit, next_cursor)
+
+    # Return only fields needed by mobile UI (keeps response small)
+    return [
+        {
+            "id": m.id,
+            "sender_role": m.sender_role,
+            "text": m.text,
+            "created_at": m.created_at,
+        }
+        for m in msgs
+    ]
 
 
 #Adapted from ChatGPT: unread messages are counted based on the logged-in user’s role.
@@ -1113,188 +1259,290 @@ def get_thread(mother_auth_id: UUID, doula_auth_id: UUID):
 # - Mother: unread = messages where read_by_mother == False
 # - Doula:  unread = messages where read_by_doula  == False
 #https://sqlmodel.tiangolo.com/tutorial/select/#where
+# The read flag / sender test is sent as the exact text of the partial index's
+# WHERE (models/message.py). Written as `read_by_mother == False` with a bound
+# sender_role, SQLite can't match it to the partial index and counts through
+# ix_messages_mother_auth_id instead.
+def unread_conditions(user_auth_id: UUID, role: str):
+    if role == "mother":
+        return (
+            Message.mother_auth_id == user_auth_id,
+            text(UNREAD_BY_MOTHER),  # unread, and only messages from the other side
+        )
+    if role == "doula":
+        return (
+            Message.doula_auth_id == user_auth_id,
+            text(UNREAD_BY_DOULA),   # unread, and only messages from the other side
+        )
+    raise HTTPException(400, "Invalid role")
+
+
 # This endpoint is used by local notification polling on the device.
+# Most polls are answered from the in-memory counter in backend/unread.py;
+# a miss is a single COUNT(*) served by the partial unread index for that role.
+# Async: a cache hit never touches the database, and a miss waits on the event loop
 @app.get("/messages/unread-count")
-def unread_count(user_auth_id: UUID, role: str):
-    with Session(engine) as session:
-        if role == "mother":
-            unread = session.exec(
-                select(Message).where(
-                    Message.mother_auth_id == user_auth_id,
-                    Message.read_by_mother == False,
-                    Message.sender_role == "doula",   # only messages from the other side
-                )
-            ).all()
-        elif role == "doula":
-            unread = session.exec(
-                select(Message).where(
-                    Message.doula_auth_id == user_auth_id,
-                    Message.read_by_doula == False,
-                    Message.sender_role == "mother",  # only messages from the other side
-                )
-            ).all()
-        else:
-            raise HTTPException(400, "Invalid role")
+async def unread_count(user_auth_id: UUID, role: str, session: AsyncSession = Depends(get_async_session)):
+    unread_conditions(user_auth_id, role)  # 400 on a bad role before touching the cache
+
+    cached = unread_counts.get(user_auth_id, role)
+    if cached is not None:
+        return {"count": cached}
+
+    return {"count": await current_unread_count_async(session, user_auth_id, role)}
+
+
+def unread_count_stmt(user_auth_id: UUID, role: str):
+    return select(func.count()).select_from(Message).where(*unread_conditions(user_auth_id, role))
+
+
+def current_unread_count(session: Session, user_auth_id: UUID, role: str) -> int:
+    """Unread total from the cache, or counted (and cached) if it is not there."""
+    cached = unread_counts.get(user_auth_id, role)
+    if cached is not None:
+        return cached
+    generation = unread_counts.generation(user_auth_id, role)
+    count = session.exec(unread_count_stmt(user_auth_id, role)).one()
+    unread_counts.set(user_auth_id, role, count, generation)
+    return count
+
+
+async def current_unread_count_async(session: AsyncSession, user_auth_id: UUID, role: str) -> int:
+    """current_unread_count() for async endpoints."""
+    cached = unread_counts.get(user_auth_id, role)
+    if cached is not None:
+        return cached
+    generation = unread_counts.generation(user_auth_id, role)
+    count = (await session.exec(unread_count_stmt(user_auth_id, role))).one()
+    unread_counts.set(user_auth_id, role, count, generation)
+    return count
+
+
+# Events sent on the private message socket
+def message_event(msg: Message) -> Dict[str, Any]:
+    return {
+        "type": "message",
+        "id": msg.id,
+        "mother_auth_id": msg.mother_auth_id,
+        "doula_auth_id": msg.doula_auth_id,
+        "sender_role": msg.sender_role,
+        "text": msg.text,
+        "created_at": msg.created_at,
+    }
+
 
-        return {"count": len(unread)}
+def unread_event(count: int) -> Dict[str, Any]:
+    return {"type": "unread_count", "count": count}
+
+
+def unread_delta_event(delta: int) -> Dict[str, Any]:
+    """Change to the last unread_count; saves a COUNT(*) per message sent."""
+    return {"type": "unread_delta", "delta": delta}
+
+
+# How long a socket opened without ?token= has to send its token
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+
+
+# Real-time private messages: one socket per open app, for the logged-in user.
+# The user is whoever the Supabase access token belongs to (its sub claim), sent
+# as ?token= or as the first frame {"token": "..."} (keeps it out of proxy logs).
+# role must be one that user has, same check as send_message.
+# Gets {"type": "unread_count"} straight away, then a {"type": "message"} for every
+# message sent to this user, and {"type": "unread_delta"} whenever the count changes
+# (add it to the last count). The REST endpoints above are unchanged, so the app
+# can fall back to polling whenever the socket is closed.
+@app.websocket("/messages/ws")
+async def private_messages_ws(websocket: WebSocket, role: str, token: Optional[str] = None):
+    if token is None:
+        await websocket.accept()
+        try:
+            first = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT_SECONDS)
+            token = first.get("token") if isinstance(first, dict) else None
+        except WebSocketDisconnect:
+            return
+        except (asyncio.TimeoutError, ValueError):
+            token = None
+
+    try:
+        user_auth_id = verify_access_token(token or "")
+    except AuthError:
+        # 1008 = policy violation (missing / invalid / expired token)
+        await websocket.close(code=1008)
+        return
+
+    # short-lived session: the socket itself can stay open for hours
+    async with AsyncSession(async_engine) as session:
+        user = (await session.exec(
+            select(User).where(User.auth_id == user_auth_id, User.role == role)
+        )).first()
+        count = await current_unread_count_async(session, user_auth_id, role) if user else None
+
+    if count is None:
+        # unknown user / wrong role
+        await websocket.close(code=1008)
+        return
+
+    await private_manager.connect(websocket, user_auth_id, role, initial=unread_event(count))
+    try:
+        while True:
+            # nothing is expected from the client; this just notices when it goes away
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await private_manager.disconnect(websocket, user_auth_id, role)
 
 
 #Request body for marking messages as read in a private mother/doula chat
 #Identifies the conversation and updates read flags based on the viewer's role
+# up_to_message_id (optional): only mark messages up to and including this id,
+# so the app marks exactly what it has shown on screen
 class MarkReadBody(BaseModel):
     mother_auth_id: UUID
     doula_auth_id: UUID
     role: str
+    up_to_message_id: Optional[int] = None
 
 #https://sqlmodel.tiangolo.com/tutorial/select/ - Grouping messages manually to form inbox-style threads
 #Marks all messages in this conversation as read for the current role
 #Adapted form ChatGPT: marks messages as read based on viewer role.
 #Refactored later to only update messages sent by the other user.
+# Done as one UPDATE ... WHERE instead of loading every message in the thread,
+# and only touches rows that are still unread, so `updated` is the number actually changed.
+#https://docs.sqlalchemy.org/en/20/tutorial/data_update.html
 
 @app.post("/messages/mark-read")
 def mark_read(body: MarkReadBody):
+    if body.role == "mother":
+        # mother is viewing to only mark messages sent by doula
+        viewer_auth_id = body.mother_auth_id
+        read_flag = Message.read_by_mother
+        other_role = "doula"
+    elif body.role == "doula":
+        # doula is viewing to only mark messages sent by mother
+        viewer_auth_id = body.doula_auth_id
+        read_flag = Message.read_by_doula
+        other_role = "mother"
+    else:
+        raise HTTPException(400, "Invalid role")
+
     with Session(engine) as session:
         # only update messages in this conversation
-        msgs = session.exec(
-            select(Message).where(
+        stmt = (
+            update(Message)
+            .where(
                 Message.mother_auth_id == body.mother_auth_id,
-                Message.doula_auth_id == body.doula_auth_id
+                Message.doula_auth_id == body.doula_auth_id,
+                Message.sender_role == other_role,
+                read_flag == False,
             )
-        ).all()
-
-        if body.role == "mother":
-            # mother is viewing to only mark messages sent by doula
-            for m in msgs:
-                if m.sender_role == "doula":
-                    m.read_by_mother = True
-
-        elif body.role == "doula":
-            # doula is viewing to only mark messages sent by mother
-            for m in msgs:
-                if m.sender_role == "mother":
-                    m.read_by_doula = True
-        else:
-            raise HTTPException(400, "Invalid role")
+            .values({read_flag: True})
+        )
+        if body.up_to_message_id is not None:
+            stmt = stmt.where(Message.id <= body.up_to_message_id)
 
-        session.add_all(msgs)
+        updated = session.exec(stmt).rowcount
+        mark_conversation_read(session, body.mother_auth_id, body.doula_auth_id, body.role, updated)
         session.commit()
-        return {"ok": True}
 
+    unread_counts.add(viewer_auth_id, body.role, -updated)
+    if updated:
+        # keeps the badge in step on the user's other devices
+        private_manager.notify_threadsafe(viewer_auth_id, body.role, unread_delta_event(-updated))
+    return {"ok": True, "updated": updated}
+
+
+# Inbox rows come from the conversations table (backend/models/conversation.py),
+# which send_message and mark_read keep up to date, instead of grouping the
+# user's whole message history in Python.
+# The other person's name is looked up in the same query (indexed on users.auth_id).
+def conversation_page(session: Session, user_auth_id: UUID, role: str, cursor: Optional[str], limit: int):
+    if role == "mother":
+        own_col, other_col, unread_col = Conversation.mother_auth_id, Conversation.doula_auth_id, Conversation.unread_by_mother
+    elif role == "doula":
+        own_col, other_col, unread_col = Conversation.doula_auth_id, Conversation.mother_auth_id, Conversation.unread_by_doula
+    else:
+        raise HTTPException(400, "Invalid role")
+
+    other_name = (
+        select(User.name).where(User.auth_id == other_col).limit(1).scalar_subquery()
+    )
+    stmt = keyset(
+        select(Conversation, other_name.label("other_name"), unread_col.label("unread_count"))
+        .where(own_col == user_auth_id),
+        [Conversation.last_at, Conversation.id], cursor, limit, descending=True,
+    )
+    return split_page(session.execute(stmt).all(), limit, width=3)
 
-#Loads the full message history for a single mother to doula conversation
-#using a REST GET endpoint instead of WebSockets.
-#Adapted from ChatGPT: manual Python grouping to form inbox-style threads.
+
+#Loads the inbox using a REST GET endpoint instead of WebSockets.
 #Includes last message and unread count per mother/doula pair.
+# Newest conversation first, paged with cursor/limit like GET /users
 
 @app.get("/messages/threads")
-def get_threads(user_auth_id: UUID, role: str):
+def get_threads(
+    user_auth_id: UUID,
+    role: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+):
     """
     Inbox list:
     - Returns one row per conversation (mother/doula pair)
     - Includes last message and unread count for that pair
+    - unread_count only counts messages from the other person, like /messages/inbox
+      and /messages/unread-count. It used to count every message with this side's
+      read flag unset; send_message marks the sender's own message read, so the
+      two only differ for rows written some other way.
     """
     with Session(engine) as session:
-        if role == "mother":
-            # Fetch all messages for this user, newest first
-            msgs = session.exec(
-                select(Message)
-                .where(Message.mother_auth_id == user_auth_id)
-                .order_by(desc(Message.created_at))
-            ).all()
-        elif role == "doula":
-            msgs = session.exec(
-                select(Message)
-                .where(Message.doula_auth_id == user_auth_id)
-                .order_by(desc(Message.created_at))
-            ).all()
-        else:
-            raise HTTPException(400, "Invalid role")
-
-        # Group by "other person" auth id
-        threads: Dict[str, Dict[str, Any]] = {}
-
-        for m in msgs:
-            # Determine the "other participant" depending on role
-            other_auth = (
-                str(m.doula_auth_id) if role == "mother" else str(m.mother_auth_id)
-            )
+        page, next_cursor = conversation_page(session, user_auth_id, role, cursor, limit)
 
-            # create thread record if first time you see it
-            if other_auth not in threads:
-                other_user = session.exec(
-                    select(User).where(User.auth_id == UUID(other_auth))
-                ).first()
-
-                threads[other_auth] = {
-                    "other_auth_id": other_auth,
-                    "other_name": other_user.name if other_user else "Unknown",
-                    "other_role": "doula" if role == "mother" else "mother",
-                    "last_text": m.text,
-                    "last_created_at": m.created_at,
-                    "unread_count": 0,
-                }
-
-            # count unread per thread
-            if role == "mother" and (m.read_by_mother is False):
-                threads[other_auth]["unread_count"] += 1
-            if role == "doula" and (m.read_by_doula is False):
-                threads[other_auth]["unread_count"] += 1
-
-        return list(threads.values())
+    set_page_headers(response, limit, next_cursor)
+    return [
+        {
+            "other_auth_id": str(conv.doula_auth_id if role == "mother" else conv.mother_auth_id),
+            "other_name": other_name or "Unknown",
+            "other_role": "doula" if role == "mother" else "mother",
+            "last_text": conv.last_text,
+            "last_created_at": conv.last_at,
+            "unread_count": unread,
+        }
+        for conv, other_name, unread in page
+    ]
 
-#Adapted from Chatgpt: replaced Python thread grouping with SQL aggregation.
-#Uses rolesafe unread counts and returns one row per conversation.
 #Loads the user's message inbox (one item per conversation),
 #similar to WhatsApp conversation lists.
 #Uses GET /messages/inbox instead of loading full message history.
+# Unread counts only include messages sent by the other role (maintained per side on the conversation row).
 
 @app.get("/messages/inbox")
-def inbox(user_auth_id: UUID, role: str):
+def inbox(
+    user_auth_id: UUID,
+    role: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+):
     with Session(engine) as session:
-        if role == "mother":
-            msgs = session.exec(
-                select(Message).where(Message.mother_auth_id == user_auth_id)
-                .order_by(Message.created_at.desc())
-            ).all()
-        elif role == "doula":
-            msgs = session.exec(
-                select(Message).where(Message.doula_auth_id == user_auth_id)
-                .order_by(Message.created_at.desc())
-            ).all()
-        else:
-            raise HTTPException(400, "Invalid role")
+        page, next_cursor = conversation_page(session, user_auth_id, role, cursor, limit)
 
-        threads = {}
-        for m in msgs:
+    set_page_headers(response, limit, next_cursor)
+    return [
+        {
             # A thread is uniquely identified by the mother/doula pair
-            key = f"{m.mother_auth_id}-{m.doula_auth_id}"
-            if key not in threads:
-                # find the "other" user to show name
-                if role == "mother":
-                    other = session.exec(select(User).where(User.auth_id == m.doula_auth_id)).first()
-                else:
-                    other = session.exec(select(User).where(User.auth_id == m.mother_auth_id)).first()
-
-                threads[key] = {
-                    "thread_key": key,
-                    "mother_auth_id": m.mother_auth_id,
-                    "doula_auth_id": m.doula_auth_id,
-                    "other_name": other.name if other else "User",
-                    "last_text": m.text,
-                    "last_at": m.created_at,
-                    "unread_count": 0,
-                }
-
-            # count unread messages for this role
-            # Only count as unread if:
-            # - The message is unread for this role
-            # - AND it was sent by the other role
-            if role == "mother" and (m.read_by_mother == False) and (m.sender_role == "doula"):
-                threads[key]["unread_count"] += 1
-            if role == "doula" and (m.read_by_doula == False) and (m.sender_role == "mother"):
-                threads[key]["unread_count"] += 1
-
-        return list(threads.values())
+            "thread_key": f"{conv.mother_auth_id}-{conv.doula_auth_id}",
+            "mother_auth_id": conv.mother_auth_id,
+            "doula_auth_id": conv.doula_auth_id,
+            "other_name": other_name or "User",
+            "last_text": conv.last_text,
+            "last_at": conv.last_at,
+            "unread_count": unread,
+        }
+        for conv, other_name, unread in page
+    ]
 
 
 
@@ -1339,6 +1587,8 @@ def patch_user(user_id: int, payload: UserUpdate):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
+        before = user_deltas(user.role, user.verified, -1)
+        role_before = user.role
         # Only apply fields provided in the request
         data = payload.model_dump(exclude_unset=True)
         for key, value in data.items():
@@ -1347,6 +1597,9 @@ def patch_user(user_id: int, payload: UserUpdate):
         session.add(user)
         session.commit()
         session.refresh(user)
+        # e.g. approving a doula moves the doula from pending to verified
+        analytics.bump(combine(before, user_deltas(user.role, user.verified)))
+        catalogue_cache.user_changed(user.id, role_before, user.role)
         return user
 
 # Self-update: updates the currently logged-in user's row using Supabase auth UUID (safer than exposing DB IDs).
@@ -1365,6 +1618,8 @@ def patch_user_by_auth(auth_id: UUID, payload: UserUpdate):
         user = session.exec(select(User).where(User.auth_id == auth_id)).first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
+        before = user_deltas(user.role, user.verified, -1)
+        role_before = user.role
         # Apply only provided fields
         data = payload.model_dump(exclude_unset=True)
         for key, value in data.items():
@@ -1377,6 +1632,8 @@ def patch_user_by_auth(auth_id: UUID, payload: UserUpdate):
         session.add(user)
         session.commit()
         session.refresh(user)
+        analytics.bump(combine(before, user_deltas(user.role, user.verified)))
+        catalogue_cache.user_changed(user.id, role_before, user.role)
         return user
 
 
@@ -1418,8 +1675,12 @@ def delete_user(user_id: int):
         if not user:
             raise HTTPException(404, "User not found")
 
+        removed = user_deltas(user.role, user.verified, -1)
+        role = user.role
         session.delete(user)
         session.commit()
+        analytics.bump(removed)
+        catalogue_cache.user_changed(user_id, role)
         return {"success": True}
 
 
@@ -1448,59 +1709,35 @@ class AdminAnalyticsOut(BaseModel):
 #Defines the structured analytics data returned to the admin dashboard.
 #Separates API response shape from database models.
 #https://fastapi.tiangolo.com/tutorial/response-model/
+# Counts come from GROUP BY queries and are cached in backend/analytics.py,
+# which the write endpoints keep up to date, so this is usually served from memory.
 @app.get("/admin/analytics", response_model=AdminAnalyticsOut)
 def admin_analytics():
     with Session(engine) as session:
-        # Users Counts
-        # Fetch all user records from the database
-        users = session.exec(select(User)).all()
-        # Count total number of users in the system
-        #https://docs.python.org/3/library/functions.html#len
-        total_users = len(users)
-        #https://docs.python.org/3/library/functions.html#sum
-        total_mothers = sum(1 for u in users if u.role == "mother")
-        total_doulas = sum(1 for u in users if u.role == "doula")
-        total_admins = sum(1 for u in users if u.role == "admin")
-        # Count doulas who are not yet verified by admin
-        pending_doulas = sum(1 for u in users if u.role == "doula" and u.verified == False)
-        # Count doulas who have been approved
-        verified_doulas = sum(1 for u in users if u.role == "doula" and u.verified == True)
-
-        # Bookings counts
-        # Fetch all booking records from the database
-        bookings = session.exec(select(Booking)).all()
-        total_bookings = len(bookings)
-        bookings_requested = sum(1 for b in bookings if b.status == "requested")
-        bookings_confirmed = sum(1 for b in bookings if b.status == "confirmed")
-        bookings_declined = sum(1 for b in bookings if b.status == "declined")
-        bookings_cancelled = sum(1 for b in bookings if b.status == "cancelled")
-        bookings_paid = sum(1 for b in bookings if b.status == "paid")
-
-        # Reviews and Messages Counts
-        reviews = session.exec(select(Review)).all()
-        total_reviews = len(reviews)
-
-        messages = session.exec(select(Message)).all()
-        total_messages = len(messages)
-
-        return AdminAnalyticsOut(
-            total_users=total_users,
-            total_mothers=total_mothers,
-            total_doulas=total_doulas,
-            total_admins=total_admins,
-            pending_doulas=pending_doulas,
-            verified_doulas=verified_doulas,
-
-            total_bookings=total_bookings,
-            bookings_requested=bookings_requested,
-            bookings_confirmed=bookings_confirmed,
-            bookings_declined=bookings_declined,
-            bookings_cancelled=bookings_cancelled,
-            bookings_paid=bookings_paid,
-
-            total_reviews=total_reviews,
-            total_messages=total_messages,
-        )
+        return AdminAnalyticsOut(**analytics.get(session))
+
+
+# Request latency per endpoint since the worker started (or since the last reset),
+# slowest p99 first. Each worker has its own numbers.
+@app.get("/admin/latency")
+def admin_latency(reset: bool = False):
+    routes = latency.snapshot()
+    if reset:
+        latency.reset()
+    return {"routes": routes}
+
+
+# Database connection pool for this worker: connections in use, overflow, and how long
+# requests waited for a connection (slow_checkouts / timeouts mean the pool is too small)
+@app.get("/admin/db-pool")
+def admin_db_pool():
+    return pool_stats()
+
+
+# Hits/misses/304s of the /doulas and /resources response cache for this worker
+@app.get("/admin/response-cache")
+def admin_response_cache():
+    return catalogue_cache.stats()
 
 class ResourceIn(BaseModel):
     title: str
@@ -1519,11 +1756,25 @@ class ResourceUpdate(BaseModel):
     source_label: Optional[str] = None
     tags: Optional[str] = None
 
+# Newest first, paged by (created_at, id) with cursor/limit like GET /users
+# Cached with an ETag like GET /doulas; the /admin/resources writes invalidate it
 @app.get("/resources")
-def get_resources():
+def get_resources(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+):
+    key = cache_key(RESOURCE_LIST, cursor=cursor, limit=limit)
+    cached = catalogue_cache.get(key)
+    if cached is not None:
+        return catalogue_cache.respond(request, cached)
+    generation = catalogue_cache.generation(RESOURCE_LIST)
+
     with Session(engine) as session:
-        resources = session.exec(select(Resource).order_by(Resource.created_at.desc())).all()
-        return resources
+        stmt = keyset(select(Resource), [Resource.created_at, Resource.id], cursor, limit, descending=True)
+        resources, next_cursor = split_page(session.execute(stmt).all(), limit)
+    entry = catalogue_cache.put(key, generation, resources, page_headers(limit, next_cursor))
+    return catalogue_cache.respond(request, entry)
 
 
 
@@ -1534,6 +1785,7 @@ def create_resource(body: ResourceIn):
         session.add(r)
         session.commit()
         session.refresh(r)
+        catalogue_cache.resources_changed()
         return r
 
 
@@ -1553,6 +1805,7 @@ def update_resource(resource_id: int, body: ResourceUpdate):
         session.add(r)
         session.commit()
         session.refresh(r)
+        catalogue_cache.resources_changed()
         return r
 
 @app.delete("/admin/resources/{resource_id}")
@@ -1563,6 +1816,7 @@ def delete_resource(resource_id: int):
             raise HTTPException(404, "Resource not found")
         session.delete(r)
         session.commit()
+        catalogue_cache.resources_changed()
         return {"success": True}
 
 class WeeklyAvailabilityIn(BaseModel):
@@ -1671,69 +1925,133 @@ def add_exception(doula_auth_id: UUID, payload: ExceptionIn):
         session.refresh(row)
         return row
 
+# Free start times for one doula on one day.
+# Only that day's bookings are read (index on doula_id, starts_at) and the
+# slot check is a sorted sweep - see backend/availability.py
 @app.get("/availability/free-slots")
 def free_slots(
     doula_id: int,
     date: str = Query(..., description="YYYY-MM-DD"),
-    slot_minutes: int = 30,
-    duration_minutes: int = 60
+    slot_minutes: int = Query(30, ge=1),
+    duration_minutes: int = Query(60, ge=1)
+):
+    target_date = parse_day(date)
+
+    with Session(engine) as session:
+        data = AvailabilityData(session, [doula_id], target_date, target_date)
+
+    dur = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=slot_minutes)
+    slots = data.free_slots(doula_id, target_date, dur, step)
+    return {"slots": [s.strftime("%H:%M") for s in slots]}
+
+
+# Same as /availability/free-slots but for every day from..to (inclusive) in one call,
+# for the booking calendar (a week or a month at a time).
+MAX_RANGE_DAYS = 62
+
+@app.get("/availability/free-slots/range")
+def free_slots_range(
+    doula_id: int,
+    from_date: str = Query(..., alias="from", description="YYYY-MM-DD"),
+    to_date: str = Query(..., alias="to", description="YYYY-MM-DD (inclusive)"),
+    slot_minutes: int = Query(30, ge=1),
+    duration_minutes: int = Query(60, ge=1)
 ):
-    target_date = datetime.fromisoformat(date).date()
-    dow = target_date.weekday()  # 0..6
+    start = parse_day(from_date, "from")
+    end = parse_day(to_date, "to")
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must be on or after 'from'.")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range too long (max {MAX_RANGE_DAYS} days).")
 
     with Session(engine) as session:
-        weekly = session.exec(select(DoulaAvailability).where(
-            DoulaAvailability.doula_id == doula_id,
-            DoulaAvailability.day_of_week == dow,
-            DoulaAvailability.active == True
-        )).all()
-
-        exceptions = session.exec(select(DoulaAvailabilityException).where(
-            DoulaAvailabilityException.doula_id == doula_id,
-            DoulaAvailabilityException.exception_date == target_date
-        )).all()
-
-        bookings = session.exec(select(Booking).where(Booking.doula_id == doula_id)).all()
-
-    # whole-day block?
-    for ex in exceptions:
-        if ex.start_time is None and ex.end_time is None:
-            return {"slots": []}
-
-    blocked = []
-
-    for b in bookings:
-        if not b.starts_at or not b.ends_at:
-            continue
-        if b.status in ("declined", "cancelled"):
-            continue
-        if b.starts_at.date() != target_date:
-            continue
-        blocked.append((b.starts_at, b.ends_at))
-
-    for ex in exceptions:
-        if ex.start_time and ex.end_time:
-            s = datetime.combine(target_date, ex.start_time)
-            e = datetime.combine(target_date, ex.end_time)
-            blocked.append((s, e))
-
-    def overlaps(s1, e1, s2, e2):
-        return s1 < e2 and e1 > s2
+        data = AvailabilityData(session, [doula_id], start, end)
 
     dur = timedelta(minutes=duration_minutes)
     step = timedelta(minutes=slot_minutes)
+    return {
+        "days": [
+            {
+                "date": day.isoformat(),
+                "slots": [s.strftime("%H:%M") for s in data.free_slots(doula_id, day, dur, step)],
+            }
+            for day in date_range(start, end)
+        ]
+    }
 
-    slots = []
-    for w in weekly:
-        window_start = datetime.combine(target_date, w.start_time)
-        window_end = datetime.combine(target_date, w.end_time)
 
-        t = window_start
-        while t + dur <= window_end:
-            s = t
-            e = t + dur
-            if not any(overlaps(s, e, bs, be) for (bs, be) in blocked):
-                slots.append(s.strftime("%H:%M"))
-            t += step
+# "Who is free?" - doulas with at least one free slot in a time window on a date.
+# Takes the same filters as GET /doulas. Instead of the app calling free-slots once per doula,
+# doulas who can't be free (not working then, day off, booked for the whole window) are
+# ruled out in SQL (may_be_free in backend/availability.py), then the remaining candidates'
+# weekly hours, exceptions and bookings are loaded together (three queries, see
+# AvailabilityData) and the slots are worked out in memory.
+# At most FREE_DOULAS_MAX_CANDIDATES candidates are checked, cheapest first; when there
+# were more, the response has X-Candidates-Capped: true.
+# Results are ordered by earliest free time, then price.
+FREE_DOULAS_MAX_CANDIDATES = int(os.getenv("FREE_DOULAS_MAX_CANDIDATES", "500"))
+
+@app.get("/availability/free-doulas")
+def free_doulas(
+    response: Response,
+    date: str = Query(..., description="YYYY-MM-DD"),
+    start_time: Optional[str] = Query(None, description="HH:MM, default start of day"),
+    end_time: Optional[str] = Query(None, description="HH:MM, default end of day"),
+    slot_minutes: int = Query(30, ge=1),
+    duration_minutes: int = Query(60, ge=1),
+    verified: bool = True,
+    location: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    q: Optional[str] = None,
+    slots_per_doula: int = Query(3, ge=1, le=20),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_LIMIT),
+):
+    target_date = parse_day(date)
+    window_start = datetime.combine(target_date, parse_hhmm(start_time) if start_time else time.min)
+    window_end = (
+        datetime.combine(target_date, parse_hhmm(end_time)) if end_time
+        else datetime.combine(target_date + timedelta(days=1), time.min)
+    )
+    if window_end <= window_start:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time.")
 
-    return {"slots": slots}
\ No newline at end of file
+    dur = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=slot_minutes)
+
+    with Session(engine) as session:
+        stmt, _ = filter_doulas(select(User), verified, location, min_price, max_price, q)
+        stmt = (
+            stmt.where(*may_be_free(User.id, target_date, window_start, window_end))
+            .order_by(sort_key(User.price, 0), User.id)
+            .limit(FREE_DOULAS_MAX_CANDIDATES + 1)
+        )
+        candidates = session.exec(stmt).all()
+        if len(candidates) > FREE_DOULAS_MAX_CANDIDATES:
+            candidates = candidates[:FREE_DOULAS_MAX_CANDIDATES]
+            response.headers["X-Candidates-Capped"] = "true"
+        data = AvailabilityData(session, [d.id for d in candidates], target_date, target_date)
+
+    results = []
+    for d in candidates:
+        slots = [
+            s for s in data.free_slots(d.id, target_date, dur, step)
+            if s >= window_start and s + dur <= window_end
+        ]
+        if slots:
+            results.append((slots[0], d.price or 0, d, slots[:slots_per_doula]))
+
+    results.sort(key=lambda r: (r[0], r[1], r[2].id))
+    return [
+        {
+            "doula_id": d.id,
+            "doula_name": d.name,
+            "location": d.location,
+            "verified": d.verified,
+            "price": d.price,
+            "photo_url": d.photo_url,
+            "first_slots": [s.strftime("%H:%M") for s in slots],
+        }
+        for _, _, d, slots in results[:limit]
+    ]
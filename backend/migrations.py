@@ -0,0 +1,394 @@
+# backend/migrations.py
+# Versioned schema migrations for existing databases
+#
+# create_all() only creates missing tables: a table that already exists never gets
+# the indexes added to its model later. Each Migration below brings an existing
+# database up to what the models declare, and is recorded in schema_migrations
+# so it runs once. Every step is also safe to repeat (checkfirst / IF NOT EXISTS),
+# so a fresh database made by create_all() just records the versions.
+#
+# Migrations are a deploy step, not part of app startup: run upgrade once per
+# deploy, before starting the new workers. On Postgres each migration's transaction
+# takes an advisory lock first and re-reads schema_migrations, so two upgrades run
+# at the same time apply each migration once (a transaction-level lock, because
+# the Supabase transaction pooler doesn't keep a session between transactions).
+#
+#   python -m backend.migrations            apply pending migrations (same as upgrade)
+#   python -m backend.migrations status     show applied / pending versions
+#   python -m backend.migrations check      EXPLAIN the hot queries, fail if an index isn't used
+#
+# check runs each migration's PlanChecks: the query an endpoint sends, and the index
+# its plan should use. On Postgres it runs with enable_seqscan off, because on a small
+# table a sequential scan is cheaper and the planner would (rightly) skip the index;
+# the check is that the index can serve the query, not that it is worth it today.
+#
+# Postgres builds the indexes inside the migration's transaction, which blocks
+# writes to that table until it finishes (fine at this app's table sizes).
+#
+# References:
+# - https://docs.sqlalchemy.org/en/20/core/constraints.html#sqlalchemy.schema.Index.create
+# - https://www.postgresql.org/docs/current/using-explain.html
+# - https://www.sqlite.org/eqp.html
+# - https://www.postgresql.org/docs/current/functions-admin.html#FUNCTIONS-ADVISORY-LOCKS
+
+import argparse
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, SQLModel
+
+# every table a migration touches has to be in SQLModel.metadata
+from backend.conversations import rebuild_conversations
+from backend.models.booking import OVERLAP_CONSTRAINT, OVERLAP_CONSTRAINT_SQL
+from backend.models.message import UNREAD_BY_DOULA, UNREAD_BY_MOTHER
+from backend.models.resources import Resource  # noqa: F401
+from backend.models.review import Review  # noqa: F401
+from backend.models.user import SEARCH_DOCUMENT_SQL
+
+# Kept out of SQLModel.metadata so create_all() doesn't treat it as an app table
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+Step = Callable[[Connection], None]
+
+SAMPLE_UUID = "00000000-0000-0000-0000-000000000000"
+
+# pg_advisory_xact_lock key held while a migration is applied (any constant bigint)
+MIGRATION_LOCK_KEY = 7_041_925_001
+
+
+def create_index(table: str, name: str, dialects: Tuple[str, ...] = ()) -> Step:
+    """Creates an index exactly as the model declares it, if it isn't there yet."""
+    def step(conn: Connection) -> None:
+        if dialects and conn.dialect.name not in dialects:
+            return
+        index = next(i for i in SQLModel.metadata.tables[table].indexes if i.name == name)
+        index.create(conn, checkfirst=True)
+    return step
+
+
+def drop_index(table: str, name: str) -> Step:
+    """Drops an index if the table has it (MySQL has no DROP INDEX IF EXISTS)."""
+    def step(conn: Connection) -> None:
+        if name not in {i["name"] for i in inspect(conn).get_indexes(table)}:
+            return
+        if conn.dialect.name == "mysql":
+            conn.execute(text(f"DROP INDEX {name} ON {table}"))
+        else:
+            conn.execute(text(f"DROP INDEX {name}"))
+    return step
+
+
+def run_sql(sql: str, dialects: Tuple[str, ...] = ()) -> Step:
+    def step(conn: Connection) -> None:
+        if dialects and conn.dialect.name not in dialects:
+            return
+        conn.execute(text(sql))
+    return step
+
+
+def check_no_overlapping_bookings(conn: Connection) -> None:
+    """
+    Lists active bookings that overlap before the exclusion constraint is added,
+    instead of leaving it to fail on the first conflicting row it finds.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    if conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": OVERLAP_CONSTRAINT}).first():
+        return
+    rows = conn.execute(text(
+        "SELECT a.doula_id, a.id, a.starts_at, a.ends_at, b.id, b.starts_at, b.ends_at"
+        " FROM bookings a JOIN bookings b ON b.doula_id = a.doula_id AND b.id > a.id"
+        " AND tsrange(a.starts_at, a.ends_at) && tsrange(b.starts_at, b.ends_at)"
+        " WHERE a.status NOT IN ('declined', 'cancelled') AND b.status NOT IN ('declined', 'cancelled')"
+        " ORDER BY a.doula_id, a.starts_at"
+    )).all()
+    if not rows:
+        return
+    print(f"{len(rows)} pair(s) of active bookings overlap; decline or cancel one of each pair:")
+    for doula_id, a_id, a_start, a_end, b_id, b_start, b_end in rows:
+        print(f"    doula {doula_id}: booking {a_id} ({a_start} - {a_end}) and booking {b_id} ({b_start} - {b_end})")
+    raise RuntimeError(f"Cannot add {OVERLAP_CONSTRAINT}: {len(rows)} overlapping booking pair(s)")
+
+
+def backfill_conversations(conn: Connection) -> None:
+    """Fills the conversations table from the message history, in the migration's transaction."""
+    SQLModel.metadata.tables["conversations"].create(conn, checkfirst=True)
+    with Session(bind=conn) as session:
+        print(f"Rebuilt {rebuild_conversations(session)} conversation(s) from messages")
+
+
+@dataclass
+class PlanCheck:
+    """A hot query, with sample parameters, and the index its plan must use."""
+    description: str
+    sql: str
+    index: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    dialects: Tuple[str, ...] = ("postgresql", "sqlite")
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    steps: List[Step]
+    checks: List[PlanCheck] = field(default_factory=list)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "indexes added to the models since the tables were created",
+        steps=[
+            run_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm", ("postgresql",)),
+            create_index("users", "ix_users_search_document", ("postgresql",)),
+            create_index("users", "ix_users_name_trgm", ("postgresql",)),
+            create_index("users", "ix_users_location_trgm", ("postgresql",)),
+            create_index("messages", "ix_messages_unread_by_mother"),
+            create_index("messages", "ix_messages_unread_by_doula"),
+            create_index("messages", "ix_messages_thread"),
+            create_index("bookings", "ix_bookings_doula_period"),
+        ],
+        checks=[
+            PlanCheck(
+                "GET /doulas?q= full-text search",
+                f"SELECT id FROM users WHERE ({SEARCH_DOCUMENT_SQL}) @@ to_tsquery('simple', 'birth:*')",
+                "ix_users_search_document",
+                dialects=("postgresql",),
+            ),
+            PlanCheck(
+                "GET /doulas?location=",
+                "SELECT id FROM users WHERE location ILIKE :location",
+                "ix_users_location_trgm",
+                {"location": "%dublin%"},
+                dialects=("postgresql",),
+            ),
+            # same WHERE as unread_conditions() in main.py sends
+            PlanCheck(
+                "GET /messages/unread-count (mother)",
+                f"SELECT count(*) FROM messages WHERE mother_auth_id = :user AND {UNREAD_BY_MOTHER}",
+                "ix_messages_unread_by_mother",
+                {"user": SAMPLE_UUID},
+            ),
+            PlanCheck(
+                "GET /messages/unread-count (doula)",
+                f"SELECT count(*) FROM messages WHERE doula_auth_id = :user AND {UNREAD_BY_DOULA}",
+                "ix_messages_unread_by_doula",
+                {"user": SAMPLE_UUID},
+            ),
+            PlanCheck(
+                "GET /messages/thread?after_id=",
+                "SELECT id FROM messages WHERE mother_auth_id = :mother AND doula_auth_id = :doula"
+                " AND id > :after_id ORDER BY id LIMIT 101",
+                "ix_messages_thread",
+                {"mother": SAMPLE_UUID, "doula": SAMPLE_UUID, "after_id": 0},
+            ),
+            PlanCheck(
+                "free slots / booking overlap check",
+                "SELECT id FROM bookings WHERE doula_id = :doula_id AND starts_at > :start"
+                " AND starts_at < :end AND ends_at > :start",
+                "ix_bookings_doula_period",
+                {"doula_id": 1, "start": datetime(2026, 1, 1), "end": datetime(2026, 1, 2)},
+            ),
+        ],
+    ),
+    Migration(
+        2,
+        "composite indexes for the hot read paths",
+        steps=[
+            create_index("bookings", "ix_bookings_mother_doula"),
+            create_index("bookings", "ix_bookings_starts"),
+            create_index("reviews", "ix_reviews_doula_created"),
+            create_index("users", "ix_users_role_verified_price"),
+            create_index("messages", "ix_messages_thread_created"),
+            create_index("resources", "ix_resources_created"),
+        ],
+        checks=[
+            PlanCheck(
+                "GET /bookings/by-mother/{id}/details",
+                "SELECT id FROM bookings WHERE mother_id = :mother_id",
+                "ix_bookings_mother_doula",
+                {"mother_id": 1},
+            ),
+            PlanCheck(
+                "GET /reviews/can-review",
+                "SELECT id FROM bookings WHERE mother_id = :mother_id AND doula_id = :doula_id"
+                " AND status IN ('paid')",
+                "ix_bookings_mother_doula",
+                {"mother_id": 1, "doula_id": 1},
+            ),
+            PlanCheck(
+                "GET /bookings",
+                "SELECT id FROM bookings ORDER BY starts_at, id LIMIT 101",
+                "ix_bookings_starts",
+            ),
+            PlanCheck(
+                "GET /reviews/by-doula/{id}",
+                "SELECT id FROM reviews WHERE doula_id = :doula_id ORDER BY created_at DESC, id DESC LIMIT 101",
+                "ix_reviews_doula_created",
+                {"doula_id": 1},
+            ),
+            PlanCheck(
+                "GET /doulas?sort_by=price",
+                "SELECT id FROM users WHERE role = 'doula' AND verified = :verified ORDER BY price, id LIMIT 101",
+                "ix_users_role_verified_price",
+                {"verified": True},
+            ),
+            PlanCheck(
+                "GET /admin/doulas/pending",
+                "SELECT id FROM users WHERE role = 'doula' AND verified = :verified",
+                "ix_users_role_verified_price",
+                {"verified": False},
+            ),
+            PlanCheck(
+                "GET /messages/thread (newest page)",
+                "SELECT id FROM messages WHERE mother_auth_id = :mother AND doula_auth_id = :doula"
+                " ORDER BY created_at DESC, id DESC LIMIT 101",
+                "ix_messages_thread_created",
+                {"mother": SAMPLE_UUID, "doula": SAMPLE_UUID},
+            ),
+            PlanCheck(
+                "GET /resources",
+                "SELECT id FROM resources ORDER BY created_at DESC, id DESC LIMIT 101",
+                "ix_resources_created",
+            ),
+        ],
+    ),
+    Migration(
+        3,
+        "no overlapping active bookings per doula (Postgres)",
+        steps=[
+            run_sql("CREATE EXTENSION IF NOT EXISTS btree_gist", ("postgresql",)),
+            # stops with the list of overlapping bookings, if there are any
+            check_no_overlapping_bookings,
+            run_sql(
+                "DO $$ BEGIN "
+                f"IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{OVERLAP_CONSTRAINT}') THEN "
+                f"{OVERLAP_CONSTRAINT_SQL}; "
+                "END IF; END $$",
+                ("postgresql",),
+            ),
+        ],
+        checks=[
+            PlanCheck(
+                "POST /bookings overlap (exclusion constraint index)",
+                "SELECT id FROM bookings WHERE doula_id = :doula_id"
+                " AND tsrange(starts_at, ends_at) && tsrange(:start, :end)"
+                " AND status NOT IN ('declined', 'cancelled')",
+                OVERLAP_CONSTRAINT,
+                {"doula_id": 1, "start": datetime(2026, 1, 1), "end": datetime(2026, 1, 2)},
+                dialects=("postgresql",),
+            ),
+        ],
+    ),
+    Migration(
+        4,
+        "drop the single-column message indexes the unread count was using",
+        steps=[
+            drop_index("messages", "ix_messages_mother_auth_id"),
+            drop_index("messages", "ix_messages_doula_auth_id"),
+        ],
+    ),
+    Migration(
+        5,
+        "conversations rows for messages sent before the table existed",
+        steps=[backfill_conversations],
+    ),
+]
+
+
+def applied_versions(conn: Connection) -> Dict[int, datetime]:
+    schema_migrations.create(conn, checkfirst=True)
+    rows = conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all()
+    return {version: applied_at for version, applied_at in rows}
+
+
+def lock(conn: Connection) -> None:
+    """Serializes upgrades on Postgres until this transaction ends."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Applies pending migrations in order, each in its own transaction. Returns the versions applied."""
+    applied = []
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            lock(conn)
+            # read under the lock: another upgrade may have just applied it
+            if migration.version in applied_versions(conn):
+                continue
+            for step in migration.steps:
+                step(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.version, name=migration.name, applied_at=datetime.utcnow(),
+            ))
+        print(f"Applied migration {migration.version}: {migration.name}")
+        applied.append(migration.version)
+    return applied
+
+
+def explain(conn: Connection, check: PlanCheck) -> str:
+    """The query plan as one string."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = conn.execute(text(f"EXPLAIN {check.sql}"), check.params).all()
+        return "\n".join(row[0] for row in rows)
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {check.sql}"), check.params).all()
+        return "\n".join(str(row[-1]) for row in rows)
+    raise RuntimeError(f"Plan checks not supported on {conn.dialect.name}")
+
+
+def check_plans(engine: Engine, migrations: Optional[List[Migration]] = None) -> bool:
+    """EXPLAINs every check and prints the result. False if any query doesn't use its index."""
+    ok = True
+    for migration in migrations or MIGRATIONS:
+        for check in migration.checks:
+            if engine.dialect.name not in check.dialects:
+                continue
+            with engine.connect() as conn:
+                plan = explain(conn, check)
+                # only looking: drop the SET LOCAL with the transaction
+                conn.rollback()
+            used = check.index in plan
+            ok = ok and used
+            print(f"[{'ok' if used else 'MISSING'}] {check.description} -> {check.index}")
+            if not used:
+                print("    " + plan.replace("\n", "\n    "))
+    return ok
+
+
+def status(engine: Engine) -> None:
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for migration in MIGRATIONS:
+        applied_at = done.get(migration.version)
+        state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pending"
+        print(f"{migration.version:>4}  {state:<26}{migration.name}")
+
+
+if __name__ == "__main__":
+    from backend.db import engine
+
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        if not upgrade(engine):
+            print("Nothing to apply.")
+    elif args.command == "status":
+        status(engine)
+    else:
+        sys.exit(0 if check_plans(engine) else 1)
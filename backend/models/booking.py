@@ -4,11 +4,28 @@ from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime
 from uuid import UUID
+from sqlalchemy import DDL, Index, event
+
+# No two active bookings of one doula may overlap (Postgres only; see backend/availability.py)
+OVERLAP_CONSTRAINT = "ex_bookings_doula_no_overlap"
+OVERLAP_CONSTRAINT_SQL = (
+    f"ALTER TABLE bookings ADD CONSTRAINT {OVERLAP_CONSTRAINT} "
+    "EXCLUDE USING gist (doula_id WITH =, tsrange(starts_at, ends_at) WITH &&) "
+    "WHERE (status NOT IN ('declined', 'cancelled'))"
+)
 
 # This class defines the structure of the "bookings" table in the MySQL database
 # Each attribute below represents a column in the table
 class Booking(SQLModel, table=True):
     __tablename__ = "bookings"          # Sets the name of the table in the database
+    __table_args__ = (
+        # Free-slot lookups and the overlap check read one doula's bookings for a time window
+        Index("ix_bookings_doula_period", "doula_id", "starts_at", "ends_at"),
+        # a mother's bookings, and "has she a paid booking with this doula?" (can-review)
+        Index("ix_bookings_mother_doula", "mother_id", "doula_id"),
+        # GET /bookings pages by (starts_at, id)
+        Index("ix_bookings_starts", "starts_at", "id"),
+    )
     # Primary key column (automatically increases for each new user)
     id: Optional[int] = Field(default=None, primary_key=True)
     mother_id: int
@@ -21,3 +38,14 @@ class Booking(SQLModel, table=True):
     doula_auth_id: Optional[UUID] = Field(default=None, index=True)
 
 
+# btree_gist lets the exclusion constraint compare doula_id with = inside a GiST index
+event.listen(
+    Booking.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Booking.__table__,
+    "after_create",
+    DDL(OVERLAP_CONSTRAINT_SQL).execute_if(dialect="postgresql"),
+)
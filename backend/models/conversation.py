@@ -0,0 +1,32 @@
+#From Youtube Video "How to connect to an online MySQL database using FastAPI"-https://www.youtube.com/watch?v=QuaNqXi-OwM
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from uuid import UUID
+from datetime import datetime
+from sqlalchemy import Index, UniqueConstraint
+
+# One row per mother/doula conversation, kept up to date by POST /messages/send
+# and POST /messages/mark-read (see backend/conversations.py).
+# The inbox reads this table instead of grouping the whole message history.
+class Conversation(SQLModel, table=True):
+    __tablename__ = "conversations"
+    __table_args__ = (
+        UniqueConstraint("mother_auth_id", "doula_auth_id", name="uq_conversation_pair"),
+        # inbox for each side, newest conversation first
+        Index("ix_conversations_mother_last", "mother_auth_id", "last_at", "id"),
+        Index("ix_conversations_doula_last", "doula_auth_id", "last_at", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    mother_auth_id: UUID
+    doula_auth_id: UUID
+
+    # Latest message in the conversation
+    last_text: str = ""
+    last_at: datetime = Field(default_factory=datetime.utcnow)
+    last_sender_role: str = ""
+
+    # Messages from the other side not yet read by this side
+    unread_by_mother: int = 0
+    unread_by_doula: int = 0
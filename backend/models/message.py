@@ -3,15 +3,35 @@ from sqlmodel import SQLModel, Field
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
+from sqlalchemy import Index, text
+
+# Partial indexes for GET /messages/unread-count: each one only holds the messages
+# still unread by that side, so COUNT(*) for one recipient reads a handful of index
+# entries instead of their whole history.
+UNREAD_BY_MOTHER = "read_by_mother = false AND sender_role = 'doula'"
+UNREAD_BY_DOULA = "read_by_doula = false AND sender_role = 'mother'"
 
 class Message(SQLModel, table=True):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_unread_by_mother", "mother_auth_id",
+              postgresql_where=text(UNREAD_BY_MOTHER), sqlite_where=text(UNREAD_BY_MOTHER)),
+        Index("ix_messages_unread_by_doula", "doula_auth_id",
+              postgresql_where=text(UNREAD_BY_DOULA), sqlite_where=text(UNREAD_BY_DOULA)),
+        # GET /messages/thread?after_id= / ?before_id=: one conversation, walked by id
+        Index("ix_messages_thread", "mother_auth_id", "doula_auth_id", "id"),
+        # GET /messages/thread without them: newest page first by (created_at, id)
+        Index("ix_messages_thread_created", "mother_auth_id", "doula_auth_id", "created_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Conversation participants (Supabase auth UUIDs)
-    mother_auth_id: UUID = Field(index=True)
-    doula_auth_id: UUID = Field(index=True)
+    # No single-column indexes: mother_auth_id leads ix_messages_thread, and the only
+    # query on doula_auth_id alone is the unread count (ix_messages_unread_by_doula).
+    # With a plain index on the same column SQLite picked that one over the partial index.
+    mother_auth_id: UUID
+    doula_auth_id: UUID
 
     # Who sent it ("mother" or "doula")
     sender_role: str
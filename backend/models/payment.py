@@ -0,0 +1,38 @@
+#From Youtube Video "How to connect to an online MySQL database using FastAPI"-https://www.youtube.com/watch?v=QuaNqXi-OwM
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import Column, Text
+
+# One row per Stripe webhook event received (keyed by Stripe's event id), so a retried
+# or duplicated delivery is recognised and not applied twice (see backend/payments.py).
+class StripeEvent(SQLModel, table=True):
+    __tablename__ = "stripe_events"
+
+    id: str = Field(primary_key=True, max_length=255)  # evt_...
+    type: str = Field(max_length=100)
+    # the verified request body, so the background worker (or a restart) can apply it
+    payload: str = Field(sa_column=Column(Text, nullable=False))
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+    # None until the booking change has been committed
+    processed_at: Optional[datetime] = Field(default=None, index=True)
+    attempts: int = 0
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text))
+
+
+# Checkout Sessions created by POST /payments/checkout, so webhook events can be
+# matched to their booking without asking Stripe, and a double tap on "Pay" gets
+# the same session back while it can still be paid.
+# payment_intent_id is filled in from checkout.session.completed (Stripe only creates
+# the PaymentIntent when the customer pays).
+class CheckoutSession(SQLModel, table=True):
+    __tablename__ = "checkout_sessions"
+
+    id: str = Field(primary_key=True, max_length=255)  # cs_...
+    booking_id: int = Field(index=True)
+    # what the session charges; a price change means a new session
+    amount_cents: int = 0
+    payment_intent_id: Optional[str] = Field(default=None, index=True, max_length=255)
+    url: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: Optional[datetime] = None
@@ -3,9 +3,12 @@ from sqlmodel import SQLModel, Field
 from typing import Optional
 
 from datetime import datetime
+from sqlalchemy import Index
 
 class Resource(SQLModel, table=True):
     __tablename__ = "resources"
+    # GET /resources: newest first, paged by (created_at, id)
+    __table_args__ = (Index("ix_resources_created", "created_at", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
@@ -2,9 +2,12 @@
 from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime
+from sqlalchemy import Index
 
 class Review(SQLModel, table=True):
     __tablename__ = "reviews"
+    # GET /reviews/by-doula/{id}: newest first, paged by (created_at, id)
+    __table_args__ = (Index("ix_reviews_doula_created", "doula_id", "created_at", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
 
     booking_id: int
@@ -1,20 +1,44 @@
 #From Youtube Video "How to connect to an online MySQL database using FastAPI"-https://www.youtube.com/watch?v=QuaNqXi-OwM
 from typing import Optional
 from sqlmodel import SQLModel, Field, Column
-from sqlalchemy import String, Text, DECIMAL
+from sqlalchemy import String, Text, DECIMAL, DDL, Index, event, text
 from uuid import UUID
 
+# Weighted search document used by GET /doulas (see backend/search.py).
+# Name matches count most, then qualifications/services, then location.
+# The query must use this exact text so Postgres matches it to the GIN index below.
+SEARCH_DOCUMENT_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(qualifications, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(services, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(location, '')), 'C')"
+)
+
 
 # This class defines the structure of the "users" table in the MySQL database
 # Each attribute below represents a column in the table
 class User(SQLModel, table=True):
     __tablename__ = "users"  # Sets the name of the table in the database
+    # Search indexes are Postgres-only (tsvector + pg_trgm); other databases skip them
+    __table_args__ = (
+        Index("ix_users_search_document", text(f"({SEARCH_DOCUMENT_SQL})"),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+        Index("ix_users_name_trgm", "name", postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        # GET /doulas?location= and /availability/free-doulas filter with
+        # location ILIKE '%...%' (filter_doulas in main.py); a btree can't serve that
+        Index("ix_users_location_trgm", "location", postgresql_using="gin",
+              postgresql_ops={"location": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        # the doula catalogue (role + verified, sorted by price), pending doulas, analytics
+        Index("ix_users_role_verified_price", "role", "verified", "price"),
+    )
 
     # Primary key column (automatically increases for each new user)
     id: int | None = Field(default=None, primary_key=True)
     name: str
-    location: str
-    price: float
+    # both unset for users made by /users/bootstrap until they fill in their profile
+    location: Optional[str] = None
+    price: Optional[float] = None
     verified: bool = False # Showing if the user is verified or not
     email: Optional[str] = Field(default=None, sa_column=Column(String(255)))
     role: str = "doula"  # "doula" | "mother" | "admin"
@@ -38,3 +62,11 @@ class User(SQLModel, table=True):
 
 
 
+
+
+# pg_trgm has to exist before the trigram indexes above can be created
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
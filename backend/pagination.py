@@ -0,0 +1,124 @@
+# backend/pagination.py
+# Keyset (cursor) pagination shared by the list endpoints
+#
+# Instead of OFFSET (which still reads and throws away every skipped row),
+# each page continues from the sort key of the last row on the previous page:
+#   WHERE (created_at, id) > (:last_created_at, :last_id) ORDER BY created_at, id LIMIT n
+# so page 50 costs the same as page 1 when there is an index on the key.
+# The id is always the last key, which makes every key unique and the order stable.
+# A key that can be NULL goes through sort_key(): (NULL, 5) > (...) is NULL rather
+# than true, so those rows would drop out of every later page, and Postgres and
+# SQLite put NULLs at opposite ends of the order.
+#
+# The response body stays the same list as before, so existing clients keep working.
+# The cursor for the next page is sent back in the X-Next-Cursor header (missing on the last page).
+#
+# References:
+# - https://use-the-index-luke.com/no-offset
+# - https://docs.sqlalchemy.org/en/20/core/sqlelement.html#sqlalchemy.sql.expression.tuple_
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, tuple_
+
+# Used when a client does not pass limit (old clients), and the most anyone can ask for
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_LIMIT_HEADER = "X-Page-Limit"
+
+
+def _encode_value(v: Any) -> Any:
+    # JSON has no datetime, so tag it and turn it back into one when decoding
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    return v
+
+
+def _decode_value(v: Any) -> Any:
+    if isinstance(v, dict) and "dt" in v:
+        return datetime.fromisoformat(v["dt"])
+    return v
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Turns the sort key of the last row into an opaque, URL-safe cursor string."""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Reads a cursor made by encode_cursor(). Raises 400 if it is not one of ours."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("wrong cursor size")
+        return [_decode_value(v) for v in values]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def sort_key(column: Any, when_null: Any):
+    """
+    A nullable column as a keyset() key: NULL sorts as when_null on every database.
+    The same expression ends up in the WHERE, the ORDER BY and the cursor.
+    """
+    return func.coalesce(column, when_null)
+
+
+def keyset(stmt, keys: Sequence[Any], cursor: Optional[str], limit: int, descending: bool = False):
+    """
+    Adds keyset paging to a select().
+
+    keys are the columns/expressions the page is ordered by (unique together, id last,
+    nullable ones wrapped in sort_key()).
+    They are also added to the selected columns, so run the statement with
+    session.execute() and pass the rows to split_page().
+    One extra row is fetched to know whether there is a next page.
+    """
+    if cursor:
+        last = decode_cursor(cursor, len(keys))
+        row_key = tuple_(*keys)
+        stmt = stmt.where(row_key < tuple_(*last) if descending else row_key > tuple_(*last))
+
+    order = [k.desc() for k in keys] if descending else list(keys)
+    return stmt.order_by(None).order_by(*order).add_columns(*keys).limit(limit + 1)
+
+
+async def fetch_rows(session, stmt) -> List[Any]:
+    """
+    Runs a keyset() query on an AsyncSession and returns full rows.
+    AsyncSession.exec() would return only the first column, and its execute() is
+    deprecated by SQLModel, so this runs the plain Session.execute() in its greenlet.
+    """
+    return await session.run_sync(lambda sync_session: sync_session.execute(stmt).all())
+
+
+def split_page(rows: Sequence[Any], limit: int, width: int = 1) -> Tuple[List[Any], Optional[str]]:
+    """
+    Splits rows from a keyset() query into (items, next_cursor).
+    width is how many columns the original select() had; with more than one,
+    each item is a tuple of those columns.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    next_cursor = encode_cursor(tuple(rows[-1][width:])) if has_more and rows else None
+    return items, next_cursor
+
+
+def page_headers(limit: int, next_cursor: Optional[str]) -> Dict[str, str]:
+    headers = {PAGE_LIMIT_HEADER: str(limit)}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return headers
+
+
+def set_page_headers(response: Response, limit: int, next_cursor: Optional[str]) -> None:
+    response.headers.update(page_headers(limit, next_cursor))
@@ -0,0 +1,253 @@
+# backend/payments.py
+# Stripe webhook processing for POST /payments/webhook
+#
+# The webhook used to do everything inline, including a blocking
+# stripe.checkout.Session.list() call inside an async endpoint, and applied
+# every retried/duplicated delivery again. Now:
+# - the endpoint verifies the signature, saves the event in stripe_events
+#   (primary key = Stripe event id) and answers 200 straight away.
+#   An event id that is already saved is a duplicate and is not queued again.
+# - WebhookWorker applies saved events in the background (one at a time, DB
+#   work in a thread). The booking change and processed_at are committed
+#   together, so an event is applied exactly once even across restarts.
+# - Events still unprocessed when a worker starts (crash, failed attempts) are
+#   picked up again.
+# - No call to Stripe is needed to find the booking. It comes from the metadata
+#   that POST /payments/checkout puts on the Checkout Session and on its
+#   PaymentIntent, with the checkout_sessions table as a fallback.
+#
+# POST /payments/checkout (helpers at the bottom):
+# - a booking's open Checkout Session is handed out again until shortly before it
+#   expires, so a double tap doesn't create a second session (or call Stripe at all)
+# - new sessions are created with an idempotency key made from the booking id, the
+#   amount and how many sessions the booking already has. Two taps that both miss
+#   the stored session send the same key, and Stripe returns the same session.
+#
+# References:
+# - https://docs.stripe.com/webhooks#handle-duplicate-events
+# - https://docs.stripe.com/webhooks#acknowledge-events-immediately
+# - https://docs.stripe.com/api/checkout/sessions/create#create_checkout_session-payment_intent_data-metadata
+# - https://docs.stripe.com/api/idempotent_requests
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from backend.analytics import analytics, booking_deltas, combine
+from backend.models.booking import Booking
+from backend.models.payment import CheckoutSession, StripeEvent
+
+log = logging.getLogger(__name__)
+
+# Failed events are retried this many times (RETRY_SECONDS * attempt apart),
+# then left for the next worker start
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("STRIPE_WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_RETRY_SECONDS = float(os.getenv("STRIPE_WEBHOOK_RETRY_SECONDS", "5"))
+
+# A stored session this close to expiring is not handed out again
+CHECKOUT_REUSE_MARGIN_SECONDS = int(os.getenv("CHECKOUT_REUSE_MARGIN_SECONDS", "600"))
+
+HANDLED_EVENTS = ("checkout.session.completed", "payment_intent.succeeded")
+
+
+def record_event(engine, event_id: str, event_type: str, payload: str) -> bool:
+    """Saves a verified event. False if this event id was received before."""
+    with Session(engine) as session:
+        session.add(StripeEvent(id=event_id, type=event_type, payload=payload))
+        try:
+            session.commit()
+        except IntegrityError:
+            return False
+    return True
+
+
+def booking_for_event(session: Session, event_type: str, obj: Dict[str, Any]) -> Optional[int]:
+    """The booking an event pays for, from metadata or checkout_sessions (no Stripe call)."""
+    booking_id = (obj.get("metadata") or {}).get("booking_id")
+    if booking_id:
+        return int(booking_id)
+
+    if event_type == "checkout.session.completed":
+        row = session.get(CheckoutSession, obj.get("id"))
+    else:
+        # PaymentIntents of sessions created before payment_intent_data metadata was set
+        row = session.exec(
+            select(CheckoutSession).where(CheckoutSession.payment_intent_id == obj.get("id"))
+        ).first()
+    return row.booking_id if row else None
+
+
+def apply_event(session: Session, event_type: str, obj: Dict[str, Any]) -> Optional[int]:
+    """
+    Applies one event inside the caller's transaction.
+    Returns the booking id if it moved from confirmed to paid.
+    """
+    if event_type not in HANDLED_EVENTS:
+        return None
+
+    if event_type == "checkout.session.completed" and obj.get("payment_intent"):
+        # remember which PaymentIntent belongs to the session
+        session.execute(
+            update(CheckoutSession)
+            .where(CheckoutSession.id == obj.get("id"))
+            .values(payment_intent_id=obj["payment_intent"])
+        )
+
+    booking_id = booking_for_event(session, event_type, obj)
+    if booking_id is None:
+        return None
+
+    # both events arrive for the same payment; only the first one changes the status
+    result = session.execute(
+        update(Booking)
+        .where(Booking.id == booking_id, Booking.status == "confirmed")
+        .values(status="paid")
+    )
+    return booking_id if result.rowcount else None
+
+
+def process_event(engine, event_id: str) -> bool:
+    """Applies a saved event once. True when done (or done before), False if it failed."""
+    with Session(engine) as session:
+        event = session.get(StripeEvent, event_id)
+        if event is None or event.processed_at is not None:
+            return True
+        try:
+            data = json.loads(event.payload)
+            paid = apply_event(session, event.type, data["data"]["object"])
+            event.processed_at = datetime.utcnow()
+            event.attempts += 1
+            event.last_error = None
+            session.add(event)
+            session.commit()
+        except Exception as e:
+            log.exception("Stripe event failed: %s", event_id)
+            session.rollback()
+            session.execute(
+                update(StripeEvent)
+                .where(StripeEvent.id == event_id)
+                .values(attempts=StripeEvent.attempts + 1, last_error=str(e))
+            )
+            session.commit()
+            return False
+
+    if paid is not None:
+        analytics.bump(combine(booking_deltas("confirmed", -1), booking_deltas("paid")))
+        log.info("Booking marked paid: %s", paid)
+    return True
+
+
+def pending_event_ids(engine) -> List[str]:
+    with Session(engine) as session:
+        return list(session.exec(
+            select(StripeEvent.id)
+            .where(StripeEvent.processed_at == None, StripeEvent.attempts < WEBHOOK_MAX_ATTEMPTS)
+            .order_by(StripeEvent.received_at)
+        ).all())
+
+
+class WebhookWorker:
+    """Applies saved webhook events in the background, on the app's event loop."""
+
+    def __init__(self, engine) -> None:
+        self.engine = engine
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.attempts: Dict[str, int] = {}
+
+    async def start(self) -> None:
+        # a queue belongs to the event loop it is first used on, so each start
+        # (each app lifespan) gets its own; anything unprocessed is reloaded below
+        self.queue = asyncio.Queue()
+        self.attempts.clear()
+        try:
+            for event_id in await asyncio.to_thread(pending_event_ids, self.engine):
+                self.queue.put_nowait(event_id)
+        except Exception:
+            # e.g. stripe_events not created yet (python -m backend.db); the app still starts
+            log.exception("Could not load pending Stripe events")
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def receive(self, event_id: str, event_type: str, payload: str) -> bool:
+        """Saves and queues a verified event. False for a duplicate delivery."""
+        if not await asyncio.to_thread(record_event, self.engine, event_id, event_type, payload):
+            return False
+        self.queue.put_nowait(event_id)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            event_id = await self.queue.get()
+            try:
+                done = await asyncio.to_thread(process_event, self.engine, event_id)
+            except Exception:
+                # e.g. the database is unreachable; count it like a failed event
+                log.exception("Stripe event failed: %s", event_id)
+                done = False
+            if done:
+                self.attempts.pop(event_id, None)
+                continue
+            attempt = self.attempts.get(event_id, 0) + 1
+            if attempt < WEBHOOK_MAX_ATTEMPTS:
+                self.attempts[event_id] = attempt
+                asyncio.get_running_loop().call_later(
+                    WEBHOOK_RETRY_SECONDS * attempt, self.queue.put_nowait, event_id
+                )
+            else:
+                self.attempts.pop(event_id, None)
+
+
+def active_checkout(session: Session, booking_id: int, amount_cents: int) -> Optional[CheckoutSession]:
+    """The booking's newest stored session for this amount that can still be paid."""
+    cutoff = datetime.utcnow() + timedelta(seconds=CHECKOUT_REUSE_MARGIN_SECONDS)
+    return session.exec(
+        select(CheckoutSession)
+        .where(
+            CheckoutSession.booking_id == booking_id,
+            CheckoutSession.amount_cents == amount_cents,
+            CheckoutSession.expires_at > cutoff,
+        )
+        .order_by(CheckoutSession.created_at.desc())
+    ).first()
+
+
+def checkout_idempotency_key(session: Session, booking_id: int, amount_cents: int) -> str:
+    """Same key for the same booking, amount and session count (Stripe keeps keys for 24h)."""
+    created = session.exec(
+        select(func.count()).select_from(CheckoutSession).where(CheckoutSession.booking_id == booking_id)
+    ).one()
+    return f"checkout-{booking_id}-{amount_cents}-{created}"
+
+
+def save_checkout(engine, booking_id: int, amount_cents: int, checkout: Dict[str, Any]) -> None:
+    """Stores a session returned by the Stripe client (once, if two taps got the same one)."""
+    expires_at = checkout.get("expires_at")
+    with Session(engine) as session:
+        session.add(CheckoutSession(
+            id=checkout["id"],
+            booking_id=booking_id,
+            amount_cents=amount_cents,
+            payment_intent_id=checkout.get("payment_intent"),
+            url=checkout["url"],
+            expires_at=datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None) if expires_at else None,
+        ))
+        try:
+            session.commit()
+        except IntegrityError:
+            pass
@@ -0,0 +1,189 @@
+# backend/request_log.py
+# Request logging + per-route latency histograms
+#
+# The old log_requests middleware printed five lines per request straight to
+# stdout, which blocks the event loop while the terminal/log pipe catches up.
+# Here each request becomes one JSON log line:
+#   {"method": "GET", "route": "/doulas/{doula_id}", "status": 200, "duration_ms": 3.1}
+# The request only puts the record on a queue (QueueHandler); a QueueListener
+# thread does the actual writing. Logging can be sampled with
+# REQUEST_LOG_SAMPLE_RATE (0-1); 5xx responses are always logged.
+#
+# Every request (sampled or not) is also counted in a latency histogram for its
+# route template, so /admin/latency can show p50/p95/p99 per endpoint without
+# keeping every duration in memory.
+#
+# References:
+# - https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+# - https://asgi.readthedocs.io/en/latest/specs/www.html (pure ASGI middleware)
+
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fraction of requests written to the log (errors are always written)
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+
+# Histogram bucket upper bounds in ms: 0.5ms up to ~2 minutes, each 20% wider than
+# the last, so a percentile is never off by more than about 20%
+BUCKET_BOUNDS_MS: List[float] = [0.5 * 1.2 ** i for i in range(69)]
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {"time": self.formatTime(record), "level": record.levelname, "msg": record.getMessage()}
+        data.update(getattr(record, "fields", {}))
+        return json.dumps(data, default=str)
+
+
+class RequestLogger:
+    """Logger whose handler only enqueues; a background thread writes the lines."""
+
+    def __init__(self, name: str = "doulacare.requests", sample_rate: float = REQUEST_LOG_SAMPLE_RATE) -> None:
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.queue: queue.Queue = queue.Queue(-1)
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.logger.addHandler(self.handler)
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, stream, respect_handler_level=True)
+        self.running = False
+
+    def start(self) -> None:
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self) -> None:
+        # writes out whatever is still queued
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def log_request(self, method: str, route: str, status: int, duration_ms: float) -> None:
+        if status < 500 and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        level = logging.ERROR if status >= 500 else logging.INFO
+        self.logger.log(level, "request", extra={"fields": {
+            "method": method,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+        }})
+
+
+class LatencyHistograms:
+    """Bucketed request durations per (method, route template)."""
+
+    def __init__(self, bounds: List[float] = BUCKET_BOUNDS_MS) -> None:
+        self.bounds = bounds
+        self.lock = threading.Lock()
+        # key -> [bucket counts..., overflow]
+        self.counts: Dict[Tuple[str, str], List[int]] = {}
+        self.totals: Dict[Tuple[str, str], Tuple[int, float, float]] = {}  # count, sum, max
+
+    def record(self, method: str, route: str, duration_ms: float) -> None:
+        i = bisect.bisect_left(self.bounds, duration_ms)
+        key = (method, route)
+        with self.lock:
+            buckets = self.counts.get(key)
+            if buckets is None:
+                buckets = self.counts[key] = [0] * (len(self.bounds) + 1)
+            buckets[i] += 1
+            n, total, worst = self.totals.get(key, (0, 0.0, 0.0))
+            self.totals[key] = (n + 1, total + duration_ms, max(worst, duration_ms))
+
+    def _percentile(self, buckets: List[int], n: int, worst: float, p: float) -> float:
+        # upper bound of the bucket holding the p-th request, never above the slowest seen
+        rank = max(1, round(p * n))
+        seen = 0
+        for i, c in enumerate(buckets):
+            seen += c
+            if seen >= rank:
+                return min(self.bounds[i], worst) if i < len(self.bounds) else worst
+        return worst
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            items = [(k, list(b), self.totals[k]) for k, b in self.counts.items()]
+        out = []
+        for (method, route), buckets, (n, total, worst) in items:
+            out.append({
+                "method": method,
+                "route": route,
+                "count": n,
+                "mean_ms": round(total / n, 2),
+                "p50_ms": round(self._percentile(buckets, n, worst, 0.50), 2),
+                "p95_ms": round(self._percentile(buckets, n, worst, 0.95), 2),
+                "p99_ms": round(self._percentile(buckets, n, worst, 0.99), 2),
+                "max_ms": round(worst, 2),
+            })
+        out.sort(key=lambda r: r["p99_ms"], reverse=True)
+        return out
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counts.clear()
+            self.totals.clear()
+
+
+def route_template(scope: Dict[str, Any], root_path: str) -> str:
+    """Path with placeholders (/doulas/{doula_id}) so every doula id shares one histogram."""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # mounted apps (static files) only change root_path
+    if scope.get("root_path", "") != root_path:
+        return scope["root_path"] + "/{path}"
+    return "<unmatched>"
+
+
+class RequestLogMiddleware:
+    """Times every HTTP request, logs it (sampled) and adds it to the histograms."""
+
+    def __init__(self, app, request_logger: RequestLogger, histograms: LatencyHistograms) -> None:
+        self.app = app
+        self.request_logger = request_logger
+        self.histograms = histograms
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root_path = scope.get("root_path", "")
+        status: Optional[int] = None
+        start = time.perf_counter()
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            route = route_template(scope, root_path)
+            self.histograms.record(scope["method"], route, duration_ms)
+            self.request_logger.log_request(scope["method"], route, status or 500, duration_ms)
+
+
+request_logger = RequestLogger()
+latency = LatencyHistograms()
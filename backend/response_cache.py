@@ -0,0 +1,177 @@
+# backend/response_cache.py
+# In-process response cache for the read-mostly catalogue endpoints:
+# GET /doulas, GET /doulas/{id} and GET /resources
+#
+# - An entry is the finished JSON body plus its headers (X-Next-Cursor etc.),
+#   keyed by the endpoint and its normalized query parameters, so the same page
+#   asked for with a different parameter order or search casing is one entry.
+# - Entries expire after RESPONSE_CACHE_TTL_SECONDS (picks up writes made by other
+#   workers) and the least recently used ones are dropped past RESPONSE_CACHE_MAX_ENTRIES.
+# - The write endpoints invalidate what they change (write-through): a doula's
+#   profile entry plus the doula list pages, or the resource list pages. Changes
+#   to mothers/admins leave the cache alone.
+# - Every body has a strong ETag (sha256 of the body). A request whose
+#   If-None-Match still matches gets a 304 with no body.
+# - Each namespace has a generation number that invalidation bumps. A response
+#   built while a write was committing is not stored, so it can't outlive the write.
+#
+# Hits/misses for this worker: GET /admin/response-cache
+#
+# References:
+# - https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-None-Match
+# - https://docs.python.org/3/library/collections.html#collections.OrderedDict.move_to_end
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+# Clients may keep the body, but must check the ETag before using it again
+CATALOGUE_CACHE_CONTROL = "no-cache"
+
+# Namespaces used by main.py
+DOULA_LIST = "doulas"
+DOULA_PROFILE = "doula"
+RESOURCE_LIST = "resources"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    expires_at: float
+
+    def to_response(self, request: Request) -> Response:
+        headers = {**self.headers, "etag": self.etag, "cache-control": CATALOGUE_CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" matches "x"."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def cache_key(namespace: str, **params: Any) -> Tuple[str, Tuple[Tuple[str, Any], ...]]:
+    """(namespace, sorted params), leaving out parameters that weren't given."""
+    return namespace, tuple(sorted((k, v) for k, v in params.items() if v is not None))
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # cache_key() -> CachedResponse, least recently used first
+        self.entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def generation(self, namespace: str) -> int:
+        """Read this before building a response and pass it to put()."""
+        with self.lock:
+            return self.generations.get(namespace, 0)
+
+    def get(self, key: Tuple[str, Any]) -> Optional[CachedResponse]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() >= entry.expires_at:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Tuple[str, Any], generation: int, content: Any, headers: Dict[str, str]) -> CachedResponse:
+        """
+        Serializes content the way FastAPI would and stores it, unless the namespace
+        was invalidated since generation was read. Returns the entry either way.
+        """
+        body = JSONResponse(content=jsonable_encoder(content)).body
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()}"',
+            headers=dict(headers),
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self.lock:
+            if self.generations.get(key[0], 0) == generation:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        response = entry.to_response(request)
+        if response.status_code == 304:
+            with self.lock:
+                self.not_modified += 1
+        return response
+
+    def invalidate(self, namespace: str, **params: Any) -> None:
+        """Drops one entry (params given) or the whole namespace (no params)."""
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            self.invalidations += 1
+            if params:
+                self.entries.pop(cache_key(namespace, **params), None)
+                return
+            for key in [k for k in self.entries if k[0] == namespace]:
+                del self.entries[key]
+
+    def user_changed(self, user_id: Optional[int], *roles: Optional[str]) -> None:
+        """
+        Call after a user row is created/updated/deleted, with its role before and
+        after. Only doulas appear in the catalogue, so other users change nothing.
+        """
+        if "doula" not in roles:
+            return
+        if user_id is not None:
+            self.invalidate(DOULA_PROFILE, doula_id=user_id)
+        self.invalidate(DOULA_LIST)
+
+    def resources_changed(self) -> None:
+        self.invalidate(RESOURCE_LIST)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+            }
+
+
+catalogue_cache = ResponseCache()
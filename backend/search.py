@@ -0,0 +1,71 @@
+# backend/search.py
+# Free-text search for GET /doulas
+#
+# Before this, every search was ilike('%q%') over name/location/qualifications/services,
+# which no index can serve, so each query scanned the whole users table.
+# On Postgres this now uses:
+# - a weighted tsvector over the four fields (GIN index) for tokenized + prefix matching
+#   ("hypno birth" matches "Hypnobirthing ... birth support")
+# - a pg_trgm index on name so small typos in a doula's name still match
+# (the location filter, a separate ILIKE, has its own pg_trgm index)
+# The indexes are declared on the User model (backend/models/user.py).
+# Other databases (e.g. SQLite for local dev) fall back to the old substring matching.
+#
+# References:
+# - https://www.postgresql.org/docs/current/textsearch-controls.html (to_tsquery prefix :*, ts_rank)
+# - https://www.postgresql.org/docs/current/pgtrgm.html (similarity and the % operator)
+
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, case, cast, func, literal_column, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+from backend.models.user import SEARCH_DOCUMENT_SQL, User
+
+# Long queries do not make results better, they only make the tsquery bigger
+MAX_SEARCH_TOKENS = 8
+
+
+def tokenize(q: Optional[str]) -> List[str]:
+    """Splits a search box string into lowercase word tokens (punctuation is dropped)."""
+    if not q:
+        return []
+    return re.findall(r"\w+", q.lower())[:MAX_SEARCH_TOKENS]
+
+
+def doula_search(q: str, dialect: str) -> Optional[Tuple[ColumnElement, ColumnElement]]:
+    """
+    Builds the WHERE clause and relevance score for a doula text search.
+
+    Returns (match, rank), or None when q has nothing searchable in it.
+    Higher rank = better match, so order by rank.desc() for sort_by=relevance.
+    """
+    tokens = tokenize(q)
+    if not tokens:
+        return None
+
+    if dialect == "postgresql":
+        # Same expression text as the GIN index so the planner can use it
+        document = literal_column(SEARCH_DOCUMENT_SQL)
+        # every token must match, and each one matches as a prefix
+        query = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in tokens))
+        phrase = " ".join(tokens)
+
+        match = or_(document.op("@@")(query), User.name.op("%")(phrase))
+        # ts_rank/similarity return real; as double precision, a score read into Python
+        # compares equal when it is sent back (e.g. inside a page cursor)
+        rank = cast(func.ts_rank(document, query) + func.similarity(User.name, phrase), Float)
+        return match, rank
+
+    # Fallback: every token must appear somewhere in the four text fields
+    fields = (User.name, User.location, User.qualifications, User.services)
+    match = None
+    for t in tokens:
+        like = f"%{t}%"
+        token_match = or_(*(f.ilike(like) for f in fields))
+        match = token_match if match is None else match & token_match
+
+    # name hits rank above hits in the other fields
+    rank = cast(case((User.name.ilike(f"%{tokens[0]}%"), 1), else_=0), Float)
+    return match, rank
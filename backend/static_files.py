@@ -0,0 +1,109 @@
+# backend/static_files.py
+# /static with headers that let the app (and any proxy) cache files properly
+#
+# Uploaded files never change once written: new uploads are named by their sha256
+# (backend/uploads.py) and older ones by a random uuid. So:
+# - ETag is the sha256 of the content (strong). For sha256-named files it is just the
+#   name; for anything else it is hashed once per worker and kept until the file changes.
+# - sha256/uuid-named files (and their image variants) get
+#   Cache-Control: public, max-age=31536000, immutable  -> the app never asks again
+# - any other file gets Cache-Control: no-cache -> the app asks every time, but gets a
+#   304 Not Modified (no body) when its ETag still matches
+# - Range requests (resume a PDF download, open a page without the whole file) and
+#   If-None-Match/If-Range are handled by Starlette's FileResponse (starlette>=0.39)
+#
+# Benchmark (plain StaticFiles vs this): python -m backend.bench_static
+#
+# References:
+# - https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control#immutable
+# - https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+# - https://developer.mozilla.org/en-US/docs/Web/HTTP/Range_requests
+
+import hashlib
+import os
+import re
+import stat
+import threading
+from typing import Dict, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+UUID_NAME = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+# resized copies: <name>_thumb.webp etc. (backend/images.py)
+VARIANT_SUFFIX = re.compile(r"_[a-z]+$")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_name(filename: str) -> Optional[str]:
+    """The sha256 in a content-addressed file name, else None."""
+    stem = os.path.splitext(filename)[0]
+    return stem if SHA256_NAME.match(stem) else None
+
+
+def is_immutable_name(filename: str) -> bool:
+    stem = os.path.splitext(filename)[0]
+    if SHA256_NAME.match(stem) or UUID_NAME.match(stem):
+        return True
+    base = VARIANT_SUFFIX.sub("", stem)
+    return base != stem and bool(SHA256_NAME.match(base) or UUID_NAME.match(base))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with content-hash ETags and Cache-Control headers."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # full path -> (mtime_ns, size, etag, cache-control), worked out once per file version
+        self.file_headers: Dict[str, Tuple[int, int, str, str]] = {}
+        self.lock = threading.Lock()
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        # Starlette runs this in the threadpool, so hashing a file here doesn't block the event loop
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            self._headers_for(full_path, stat_result)
+        return full_path, stat_result
+
+    def _headers_for(self, full_path: str, stat_result: os.stat_result) -> Tuple[int, int, str, str]:
+        version = (stat_result.st_mtime_ns, stat_result.st_size)
+        with self.lock:
+            known = self.file_headers.get(full_path)
+        if known and known[:2] == version:
+            return known
+
+        name = os.path.basename(full_path)
+        sha = content_name(name) or file_sha256(full_path)
+        cache_control = IMMUTABLE_CACHE_CONTROL if is_immutable_name(name) else REVALIDATE_CACHE_CONTROL
+        entry = (*version, f'"{sha}"', cache_control)
+        with self.lock:
+            self.file_headers[full_path] = entry
+        return entry
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        # same as StaticFiles.file_response, with our headers set before the 304 check
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        with self.lock:
+            known = self.file_headers.get(str(full_path))
+        if known:
+            # replaces Starlette's mtime+size tag, so If-None-Match/If-Range compare content
+            response.headers["etag"] = known[2]
+            response.headers["cache-control"] = known[3]
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,75 @@
+# backend/stripe_client.py
+# The Stripe calls made by POST /payments/checkout, behind a small client class
+#
+# - StripeClient: the real Stripe SDK. Its calls block on the network, so the
+#   endpoint runs them with asyncio.to_thread().
+# - FakeStripeClient: no network, no key. Sessions get made-up cs_fake_... ids and
+#   a local URL, and a repeated idempotency key returns the same session like
+#   Stripe does. Use it for local development and tests.
+# Pick one with STRIPE_CLIENT=live|fake (live by default).
+#
+# References:
+# - https://docs.stripe.com/api/idempotent_requests
+# - https://docs.stripe.com/api/checkout/sessions/create
+
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import stripe
+
+# Stripe's default: a Checkout Session can be paid for 24 hours
+FAKE_SESSION_LIFETIME_SECONDS = 24 * 60 * 60
+
+
+class StripeClient:
+    """Live Stripe. Every method blocks, so call it from a thread."""
+
+    def create_checkout_session(self, params: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        checkout = stripe.checkout.Session.create(**params, idempotency_key=idempotency_key)
+        return {
+            "id": checkout.id,
+            "url": checkout.url,
+            "payment_intent": checkout.get("payment_intent"),
+            "expires_at": checkout.get("expires_at"),
+        }
+
+
+class FakeStripeClient(StripeClient):
+    """In-memory stand-in for Stripe with the same idempotency behaviour."""
+
+    def __init__(self, base_url: str = "http://localhost:8000/payments/success") -> None:
+        self.base_url = base_url
+        self.ids = itertools.count(1)
+        # idempotency key -> session, as Stripe replays the first response for a key
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def create_checkout_session(self, params: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        with self.lock:
+            self.calls += 1
+            if idempotency_key in self.sessions:
+                return dict(self.sessions[idempotency_key])
+            session_id = f"cs_fake_{next(self.ids)}"
+            session = {
+                "id": session_id,
+                "url": f"{self.base_url}?session_id={session_id}",
+                "payment_intent": None,
+                "expires_at": int(time.time()) + FAKE_SESSION_LIFETIME_SECONDS,
+                "metadata": dict(params.get("metadata") or {}),
+            }
+            self.sessions[idempotency_key] = session
+            return dict(session)
+
+
+def create_stripe_client() -> StripeClient:
+    """Builds the client chosen by STRIPE_CLIENT (live by default)."""
+    kind = os.getenv("STRIPE_CLIENT", "live").lower()
+    if kind == "fake":
+        return FakeStripeClient()
+    if kind == "live":
+        return StripeClient()
+    raise ValueError(f"Unknown STRIPE_CLIENT '{kind}' (use live or fake)")
@@ -0,0 +1,70 @@
+# backend/tests/conftest.py
+# Shared setup for the backend tests
+#
+# The app runs against a throwaway SQLite file and the fake Stripe client
+# (backend/stripe_client.py), so the tests need no network, keys or Postgres.
+# The environment has to be set before backend.db / backend.main are imported,
+# because the engine and the Stripe client are created at import time.
+#
+# Run from the repository root:
+#   python -m pytest backend/tests
+
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+_tmp = Path(tempfile.mkdtemp(prefix="doulacare-tests-"))
+os.environ["SUPABASE_DB_URL"] = f"sqlite:///{_tmp / 'test.db'}"
+os.environ["STRIPE_CLIENT"] = "fake"
+os.environ["STRIPE_WEBHOOK_SECRET"] = "whsec_test"
+os.environ["TRANSCRIPTION_CACHE_DIR"] = ""
+os.environ["CHAT_BACKPLANE"] = "memory"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel
+
+from backend import main
+from backend.analytics import analytics
+from backend.models.user import User
+from backend.response_cache import catalogue_cache
+from backend.unread import unread_counts
+
+
+@pytest.fixture
+def engine():
+    """A fresh schema for every test."""
+    SQLModel.metadata.drop_all(main.engine)
+    SQLModel.metadata.create_all(main.engine)
+    # in-process caches would otherwise carry counts over from the previous test
+    unread_counts.entries.clear()
+    catalogue_cache.entries.clear()
+    analytics.invalidate()
+    return main.engine
+
+
+@pytest.fixture
+def client(engine):
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def make_user(engine):
+    def make(role: str, **fields) -> User:
+        user = User(
+            name=fields.pop("name", f"{role} {uuid.uuid4().hex[:6]}"),
+            location=fields.pop("location", "Dublin"),
+            price=fields.pop("price", 50 if role == "doula" else 0),
+            role=role,
+            verified=fields.pop("verified", role == "doula"),
+            auth_id=fields.pop("auth_id", uuid.uuid4()),
+            **fields,
+        )
+        with Session(engine) as session:
+            session.add(user)
+            session.commit()
+            session.refresh(user)
+        return user
+    return make
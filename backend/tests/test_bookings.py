@@ -0,0 +1,110 @@
+# backend/tests/test_bookings.py
+# Overlapping bookings are rejected at write time with 409 (POST /bookings and
+# POST /bookings/{id}/status)
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session
+
+from backend.availability import lock_doula_bookings
+from backend.models.booking import Booking
+
+START = datetime(2026, 11, 2, 10)
+
+
+def book(client, mother, doula, start, hours=1.0, **extra):
+    return client.post("/bookings", json={
+        "mother_id": mother.id,
+        "doula_id": doula.id,
+        "starts_at": start.isoformat(),
+        "ends_at": (start + timedelta(hours=hours)).isoformat(),
+        **extra,
+    })
+
+
+@pytest.fixture
+def pair(make_user):
+    return make_user("mother"), make_user("doula")
+
+
+def test_overlapping_booking_is_409(client, pair):
+    mother, doula = pair
+    assert book(client, mother, doula, START).status_code == 200
+
+    clash = book(client, mother, doula, START + timedelta(minutes=30))
+    assert clash.status_code == 409
+    assert "already has a booking" in clash.json()["detail"]
+
+
+def test_booking_inside_and_around_existing_is_409(client, pair):
+    mother, doula = pair
+    book(client, mother, doula, START, hours=2)
+    assert book(client, mother, doula, START + timedelta(minutes=15), hours=0.5).status_code == 409
+    assert book(client, mother, doula, START - timedelta(hours=1), hours=4).status_code == 409
+
+
+def test_adjacent_bookings_are_allowed(client, pair):
+    mother, doula = pair
+    assert book(client, mother, doula, START).status_code == 200
+    # [10:00, 11:00) and [11:00, 12:00) touch but don't overlap
+    assert book(client, mother, doula, START + timedelta(hours=1)).status_code == 200
+    assert book(client, mother, doula, START - timedelta(hours=1)).status_code == 200
+
+
+def test_other_doula_same_time_is_allowed(client, pair, make_user):
+    mother, doula = pair
+    assert book(client, mother, doula, START).status_code == 200
+    assert book(client, mother, make_user("doula"), START).status_code == 200
+
+
+def test_declined_booking_frees_the_slot(client, pair):
+    mother, doula = pair
+    first = book(client, mother, doula, START).json()
+    assert client.post(f"/bookings/{first['id']}/status", json={"status": "declined"}).status_code == 200
+    assert book(client, mother, doula, START).status_code == 200
+
+
+def test_reactivating_into_a_taken_slot_is_409(client, pair):
+    mother, doula = pair
+    first = book(client, mother, doula, START).json()
+    client.post(f"/bookings/{first['id']}/status", json={"status": "cancelled"})
+    book(client, mother, doula, START)
+
+    again = client.post(f"/bookings/{first['id']}/status", json={"status": "confirmed"})
+    assert again.status_code == 409
+
+
+def test_invalid_period_is_400(client, pair):
+    mother, doula = pair
+    assert book(client, mother, doula, START, hours=0).status_code == 400
+    assert book(client, mother, doula, START, hours=-1).status_code == 400
+
+
+def test_long_booking_blocks_its_whole_period(client, pair):
+    mother, doula = pair
+    assert book(client, mother, doula, START, hours=72).status_code == 200
+    # a later, shorter booking doesn't hide the long one from the check
+    assert book(client, mother, doula, START + timedelta(hours=72)).status_code == 200
+    assert book(client, mother, doula, START + timedelta(hours=50)).status_code == 409
+
+
+def test_second_writer_waits_for_the_doula_lock(client, engine, pair):
+    mother, doula = pair
+    result = {}
+
+    with Session(engine) as session:
+        # a booking being written in another request (or worker), not committed yet
+        lock_doula_bookings(session, doula.id)
+        session.add(Booking(mother_id=mother.id, doula_id=doula.id, starts_at=START, ends_at=START + timedelta(hours=1)))
+        session.flush()
+
+        other = threading.Thread(target=lambda: result.update(response=book(client, mother, doula, START)))
+        other.start()
+        other.join(0.3)
+        assert other.is_alive()
+        session.commit()
+
+    other.join()
+    assert result["response"].status_code == 409
@@ -0,0 +1,129 @@
+# backend/tests/test_messages.py
+# Conversation rows kept by send_message (backend/conversations.py) and
+# bulk mark-read (POST /messages/mark-read)
+
+from sqlmodel import Session, select
+
+from backend.conversations import record_message_without_upsert
+from backend.models.conversation import Conversation
+from backend.models.message import Message
+
+
+def send(client, sender, receiver, text):
+    response = client.post(
+        "/messages/send",
+        params={"sender_auth_id": str(sender.auth_id), "sender_role": sender.role},
+        json={"receiver_auth_id": str(receiver.auth_id), "text": text},
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def unread(client, user):
+    return client.get(
+        "/messages/unread-count", params={"user_auth_id": str(user.auth_id), "role": user.role}
+    ).json()["count"]
+
+
+def inbox(client, user):
+    return client.get("/messages/inbox", params={"user_auth_id": str(user.auth_id), "role": user.role}).json()
+
+
+def mark_read(client, mother, doula, role, up_to=None):
+    body = {"mother_auth_id": str(mother.auth_id), "doula_auth_id": str(doula.auth_id), "role": role}
+    if up_to is not None:
+        body["up_to_message_id"] = up_to
+    return client.post("/messages/mark-read", json=body).json()["updated"]
+
+
+def test_one_conversation_row_per_pair(client, engine, make_user):
+    mother, doula = make_user("mother"), make_user("doula", name="Anna")
+    send(client, doula, mother, "hello")
+    send(client, mother, doula, "hi!")
+    send(client, doula, mother, "see you tuesday")
+
+    with Session(engine) as session:
+        rows = session.exec(select(Conversation)).all()
+    assert len(rows) == 1
+    assert rows[0].last_text == "see you tuesday"
+    assert rows[0].last_sender_role == "doula"
+    assert (rows[0].unread_by_mother, rows[0].unread_by_doula) == (2, 1)
+
+    [thread] = inbox(client, mother)
+    assert thread["other_name"] == "Anna"
+    assert thread["unread_count"] == 2
+
+
+def test_inbox_newest_conversation_first(client, make_user):
+    mother = make_user("mother")
+    first, second = make_user("doula", name="First"), make_user("doula", name="Second")
+    send(client, first, mother, "one")
+    send(client, second, mother, "two")
+    send(client, first, mother, "three")
+
+    assert [t["other_name"] for t in inbox(client, mother)] == ["First", "Second"]
+
+
+def test_mark_read_up_to_message(client, make_user):
+    mother, doula = make_user("mother"), make_user("doula")
+    ids = [send(client, doula, mother, f"m{i}") for i in range(3)]
+    send(client, mother, doula, "reply")
+
+    assert unread(client, mother) == 3
+    assert mark_read(client, mother, doula, "mother", up_to=ids[1]) == 2
+    assert unread(client, mother) == 1
+    assert inbox(client, mother)[0]["unread_count"] == 1
+
+    # the rest, then nothing left to flip
+    assert mark_read(client, mother, doula, "mother") == 1
+    assert mark_read(client, mother, doula, "mother") == 0
+    assert unread(client, mother) == 0
+    # the doula's unread reply is untouched
+    assert unread(client, doula) == 1
+
+
+def test_mark_read_only_touches_this_conversation(client, make_user):
+    mother, doula, other = make_user("mother"), make_user("doula"), make_user("doula")
+    send(client, doula, mother, "a")
+    send(client, other, mother, "b")
+
+    assert mark_read(client, mother, doula, "mother") == 1
+    assert unread(client, mother) == 1
+
+
+def test_mark_read_bad_role_is_400(client, make_user):
+    mother, doula = make_user("mother"), make_user("doula")
+    body = {"mother_auth_id": str(mother.auth_id), "doula_auth_id": str(doula.auth_id), "role": "admin"}
+    assert client.post("/messages/mark-read", json=body).status_code == 400
+
+
+def test_update_then_insert_fallback(engine, make_user):
+    # the path used where there is no ON CONFLICT upsert (MySQL), run on SQLite
+    mother, doula = make_user("mother"), make_user("doula")
+    for role, text in [("mother", "one"), ("doula", "two"), ("doula", "three")]:
+        with Session(engine) as session:
+            msg = Message(mother_auth_id=mother.auth_id, doula_auth_id=doula.auth_id, sender_role=role, text=text)
+            session.add(msg)
+            record_message_without_upsert(session, msg, "unread_by_doula" if role == "mother" else "unread_by_mother")
+            session.commit()
+
+    with Session(engine) as session:
+        [row] = session.exec(select(Conversation)).all()
+    assert row.last_text == "three"
+    assert (row.unread_by_mother, row.unread_by_doula) == (2, 1)
+
+
+def test_newer_messages_follow_the_cursor(client, make_user):
+    # what PrivateChatScreen's loadNewer does after the app was away
+    mother, doula = make_user("mother"), make_user("doula")
+    ids = [send(client, doula, mother, f"m{i}") for i in range(6)]
+
+    params = {"mother_auth_id": str(mother.auth_id), "doula_auth_id": str(doula.auth_id), "after_id": ids[0], "limit": 2}
+    fetched, cursor = [], None
+    while True:
+        response = client.get("/messages/thread", params={**params, **({"cursor": cursor} if cursor else {})})
+        fetched += [m["id"] for m in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert fetched == ids[1:]
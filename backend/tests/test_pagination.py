@@ -0,0 +1,91 @@
+# backend/tests/test_pagination.py
+# Keyset paging (backend/pagination.py) at page boundaries, through GET /bookings
+
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from backend.models.booking import Booking
+from backend.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+
+def add_bookings(engine, make_user, starts):
+    mother = make_user("mother")
+    with Session(engine) as session:
+        for start in starts:
+            # a doula per booking, so equal start times don't overlap
+            session.add(Booking(
+                mother_id=mother.id, doula_id=make_user("doula").id,
+                starts_at=start, ends_at=start + timedelta(hours=1),
+            ))
+        session.commit()
+
+
+def all_pages(client, limit):
+    ids, pages, cursor = [], [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/bookings", params=params)
+        assert response.status_code == 200
+        pages.append(len(response.json()))
+        ids += [b["id"] for b in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            return ids, pages
+
+
+def test_pages_cover_every_row_once_with_ties(client, engine, make_user):
+    same = datetime(2026, 11, 2, 10)
+    # three rows share a start time, so the id has to break the tie across pages
+    add_bookings(engine, make_user, [same, same, same, same + timedelta(hours=1), same - timedelta(hours=1)])
+
+    ids, pages = all_pages(client, limit=2)
+    assert pages == [2, 2, 1]
+    assert len(ids) == len(set(ids)) == 5
+    every = [b["id"] for b in client.get("/bookings", params={"limit": 100}).json()]
+    assert ids == every
+
+
+def test_exactly_full_last_page_has_no_cursor(client, engine, make_user):
+    add_bookings(engine, make_user, [datetime(2026, 11, 2, h) for h in range(9, 13)])
+
+    _, pages = all_pages(client, limit=2)
+    # 4 rows in pages of 2: no third, empty page
+    assert pages == [2, 2]
+
+
+def test_empty_table_has_no_cursor(client):
+    response = client.get("/bookings", params={"limit": 2})
+    assert response.json() == []
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 11, 2, 10, 30), 42]
+    assert decode_cursor(encode_cursor(values), 2) == values
+
+
+def test_bad_cursor_is_400(client):
+    assert client.get("/bookings", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def doula_pages(client, sort_by, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"sort_by": sort_by, "limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/doulas", params=params)
+        assert response.status_code == 200
+        ids += [d["id"] for d in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            return ids
+
+
+def test_null_sort_keys_stay_in_the_pages(client, make_user):
+    # users from /users/bootstrap have no price or location until they fill them in
+    priced = [make_user("doula", price=p, location="Cork").id for p in (30, 60)]
+    unpriced = [make_user("doula", price=None, location=None).id for _ in range(3)]
+
+    # a missing value sorts first on every database, and no page loses it
+    assert doula_pages(client, "price", limit=2) == unpriced + priced
+    assert doula_pages(client, "location", limit=2) == unpriced + priced
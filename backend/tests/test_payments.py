@@ -0,0 +1,141 @@
+# backend/tests/test_payments.py
+# Checkout session reuse / idempotency keys (POST /payments/checkout)
+# and webhook deduplication (POST /payments/webhook)
+
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, select, update
+
+from backend import main
+from backend.models.booking import Booking
+from backend.models.payment import CheckoutSession, StripeEvent
+from backend.payments import checkout_idempotency_key, process_event
+
+
+def make_booking(engine, mother, doula, status="confirmed") -> Booking:
+    booking = Booking(
+        mother_id=mother.id, doula_id=doula.id,
+        starts_at=datetime(2026, 11, 2, 10), ends_at=datetime(2026, 11, 2, 11), status=status,
+    )
+    with Session(engine) as session:
+        session.add(booking)
+        session.commit()
+        session.refresh(booking)
+    return booking
+
+
+def signed(payload: bytes, secret: str = "whsec_test"):
+    """Stripe-Signature header for payload, as Stripe computes it."""
+    t = int(time.time())
+    sig = hmac.new(secret.encode(), f"{t}.".encode() + payload, hashlib.sha256).hexdigest()
+    return {"stripe-signature": f"t={t},v1={sig}", "content-type": "application/json"}
+
+
+def test_checkout_reuses_open_session(client, engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula", price=60))
+    calls = main.stripe_client.calls
+
+    first = client.post("/payments/checkout", json={"booking_id": booking.id})
+    second = client.post("/payments/checkout", json={"booking_id": booking.id})
+
+    assert first.status_code == 200
+    assert second.json()["url"] == first.json()["url"]
+    # the second tap is answered from checkout_sessions without calling Stripe
+    assert main.stripe_client.calls == calls + 1
+
+
+def test_checkout_after_expiry_uses_next_idempotency_key(client, engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula", price=60))
+    with Session(engine) as session:
+        assert checkout_idempotency_key(session, booking.id, 6000) == f"checkout-{booking.id}-6000-0"
+
+    first = client.post("/payments/checkout", json={"booking_id": booking.id}).json()["url"]
+    with Session(engine) as session:
+        assert checkout_idempotency_key(session, booking.id, 6000) == f"checkout-{booking.id}-6000-1"
+        # the stored session is about to expire, so it is not handed out again
+        session.exec(update(CheckoutSession).values(expires_at=datetime.utcnow() + timedelta(minutes=1)))
+        session.commit()
+
+    second = client.post("/payments/checkout", json={"booking_id": booking.id}).json()["url"]
+    assert second != first
+
+
+def test_same_idempotency_key_returns_same_session():
+    stripe_client = main.stripe_client
+    a = stripe_client.create_checkout_session({"metadata": {"booking_id": "1"}}, "checkout-1-100-0")
+    b = stripe_client.create_checkout_session({"metadata": {"booking_id": "1"}}, "checkout-1-100-0")
+    assert a["id"] == b["id"]
+
+
+def test_checkout_needs_confirmed_booking(client, engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula"), status="requested")
+    assert client.post("/payments/checkout", json={"booking_id": booking.id}).status_code == 400
+
+
+def test_webhook_duplicate_delivery_is_ignored(client, engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula"))
+    payload = json.dumps({
+        "id": "evt_test_1",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"id": "cs_test_1", "metadata": {"booking_id": str(booking.id)}}},
+    }).encode()
+
+    first = client.post("/payments/webhook", content=payload, headers=signed(payload))
+    second = client.post("/payments/webhook", content=payload, headers=signed(payload))
+
+    assert first.json() == {"received": True, "duplicate": False}
+    assert second.json() == {"received": True, "duplicate": True}
+    with Session(engine) as session:
+        assert len(session.exec(select(StripeEvent)).all()) == 1
+
+
+def test_webhook_rejects_bad_signature(client):
+    payload = b'{"id": "evt_x", "type": "checkout.session.completed"}'
+    assert client.post("/payments/webhook", content=payload, headers=signed(payload, "whsec_other")).status_code == 400
+
+
+def test_event_is_applied_once(engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula"))
+    with Session(engine) as session:
+        session.add(StripeEvent(
+            id="evt_test_2",
+            type="payment_intent.succeeded",
+            payload=json.dumps({"data": {"object": {"id": "pi_1", "metadata": {"booking_id": str(booking.id)}}}}),
+        ))
+        session.commit()
+
+    assert process_event(engine, "evt_test_2")
+    assert process_event(engine, "evt_test_2")
+
+    with Session(engine) as session:
+        assert session.get(Booking, booking.id).status == "paid"
+        event = session.get(StripeEvent, "evt_test_2")
+        assert event.processed_at is not None
+        assert event.attempts == 1
+
+
+def test_worker_processes_received_event(engine, make_user):
+    booking = make_booking(engine, make_user("mother"), make_user("doula"))
+    payload = json.dumps({"data": {"object": {"id": "cs_2", "metadata": {"booking_id": str(booking.id)}}}})
+
+    async def run():
+        worker = main.WebhookWorker(engine)
+        await worker.start()
+        assert await worker.receive("evt_test_3", "checkout.session.completed", payload)
+        assert not await worker.receive("evt_test_3", "checkout.session.completed", payload)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if worker.queue.empty():
+                break
+        await asyncio.sleep(0.05)
+        await worker.stop()
+
+    asyncio.run(run())
+    with Session(engine) as session:
+        assert session.get(Booking, booking.id).status == "paid"
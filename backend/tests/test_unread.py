@@ -0,0 +1,41 @@
+# backend/tests/test_unread.py
+# The per-user unread count cache (backend/unread.py)
+
+import uuid
+
+from backend.unread import UnreadCounter
+
+
+def test_count_from_before_a_write_is_not_stored():
+    counter, user = UnreadCounter(), uuid.uuid4()
+    generation = counter.generation(user, "mother")
+    # a message arrives while the COUNT(*) runs; with no entry, add() has nothing to adjust
+    counter.add(user, "mother", 1)
+    counter.set(user, "mother", 3, generation)
+    assert counter.get(user, "mother") is None
+
+    generation = counter.generation(user, "mother")
+    counter.set(user, "mother", 4, generation)
+    assert counter.get(user, "mother") == 4
+
+
+def test_other_users_writes_dont_block_storing():
+    counter, user = UnreadCounter(), uuid.uuid4()
+    generation = counter.generation(user, "doula")
+    counter.add(uuid.uuid4(), "mother", 1)
+    counter.add(user, "mother", 1)
+    counter.set(user, "doula", 2, generation)
+    assert counter.get(user, "doula") == 2
+
+
+def test_clearing_generations_makes_older_reads_stale():
+    counter = UnreadCounter(max_entries=2)
+    user = uuid.uuid4()
+    generation = counter.generation(user, "mother")
+    counter.add(user, "mother", 1)
+    # enough other writes to clear the user's generation again
+    for _ in range(3):
+        counter.add(uuid.uuid4(), "mother", 1)
+    assert (user, "mother") not in counter.generations
+    counter.set(user, "mother", 0, generation)
+    assert counter.get(user, "mother") is None
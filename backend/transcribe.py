@@ -0,0 +1,257 @@
+# backend/transcribe.py
+# Whisper transcription for /voice-search
+#
+# The endpoint used to call requests.post() inside an async def, which stopped the
+# whole event loop (and every chat socket) until OpenAI answered. Here:
+# - one shared httpx.AsyncClient (connection pooling, timeouts), opened/closed by the app lifespan
+# - retries with backoff for timeouts, connection errors, 429 and 5xx
+# - transcriptions cached by the sha256 of the audio: in memory (LRU) and on disk,
+#   so the same voice command is only sent to Whisper once. Disk entries older than
+#   TRANSCRIPTION_CACHE_MAX_AGE_DAYS, or past TRANSCRIPTION_CACHE_MAX_FILES (least
+#   recently used first, by mtime), are deleted at startup and every few writes.
+# - identical requests already in flight share one API call. The call runs as its
+#   own task, so the request that started it disconnecting doesn't fail the others.
+#
+# WHISPER_URL points it somewhere else (e.g. a local fake for testing).
+#
+# References:
+# - https://www.python-httpx.org/async/
+# - https://www.python-httpx.org/advanced/resource-limits/
+# - https://platform.openai.com/docs/api-reference/audio/createTranscription
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+OPENAI_TRANSCRIPTIONS_URL = "https://api.openai.com/v1/audio/transcriptions"
+WHISPER_URL = os.getenv("WHISPER_URL", OPENAI_TRANSCRIPTIONS_URL)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+WHISPER_LANGUAGE = "en"  # forcing english
+WHISPER_TIMEOUT_SECONDS = float(os.getenv("WHISPER_TIMEOUT_SECONDS", "30"))
+WHISPER_RETRIES = int(os.getenv("WHISPER_RETRIES", "2"))
+
+# Transcriptions kept in memory, and where they are kept on disk ("" = memory only)
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "256"))
+TRANSCRIPTION_CACHE_DIR = os.getenv(
+    "TRANSCRIPTION_CACHE_DIR", str(Path(__file__).parent / "cache" / "transcriptions")
+)
+TRANSCRIPTION_CACHE_MAX_FILES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_FILES", "5000"))
+TRANSCRIPTION_CACHE_MAX_AGE_DAYS = float(os.getenv("TRANSCRIPTION_CACHE_MAX_AGE_DAYS", "30"))
+# The disk cache is pruned after this many new files
+TRANSCRIPTION_CACHE_PRUNE_EVERY = 100
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TranscriptionError(Exception):
+    """Whisper answered with an error; status_code and detail are passed on to the client."""
+
+    def __init__(self, status_code: int, detail: Any) -> None:
+        super().__init__(f"Transcription failed ({status_code})")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class WhisperClient:
+    def __init__(
+        self,
+        url: str = WHISPER_URL,
+        api_key: Optional[str] = None,
+        cache_size: int = TRANSCRIPTION_CACHE_SIZE,
+        cache_dir: Optional[str] = TRANSCRIPTION_CACHE_DIR,
+        max_files: int = TRANSCRIPTION_CACHE_MAX_FILES,
+        max_age_days: float = TRANSCRIPTION_CACHE_MAX_AGE_DAYS,
+        retries: int = WHISPER_RETRIES,
+        timeout: float = WHISPER_TIMEOUT_SECONDS,
+    ) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.retries = retries
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_files = max_files
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.writes_since_prune = 0
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        # audio key -> the task calling Whisper for it (removed when it finishes)
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.client: Optional[httpx.AsyncClient] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def needs_api_key(self) -> bool:
+        return self.url == OPENAI_TRANSCRIPTIONS_URL
+
+    async def start(self) -> None:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(self._disk_prune)
+
+    async def stop(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @staticmethod
+    def cache_key(audio: bytes) -> str:
+        # the model and language are part of the key, so changing either doesn't reuse old text
+        h = hashlib.sha256(audio)
+        h.update(f"|{WHISPER_MODEL}|{WHISPER_LANGUAGE}".encode())
+        return h.hexdigest()
+
+    async def transcribe(self, audio: bytes, filename: str, content_type: Optional[str]) -> str:
+        key = self.cache_key(audio)
+
+        text = self._memory_get(key)
+        if text is None:
+            text = await asyncio.to_thread(self._disk_get, key)
+            if text is not None:
+                self._memory_put(key, text)
+        if text is not None:
+            self.hits += 1
+            return text
+
+        # someone is already transcribing this exact audio: wait for their result
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch(key, audio, filename, content_type))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        # shield: a request that goes away stops waiting, but the call carries on for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, audio: bytes, filename: str, content_type: Optional[str]) -> str:
+        text = await self._call_api(audio, filename, content_type)
+        self._memory_put(key, text)
+        await asyncio.to_thread(self._disk_put, key, text)
+        return text
+
+    def _fetch_done(self, key: str, task: asyncio.Task) -> None:
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        # every waiter may have gone; don't warn about an unread exception
+        if not task.cancelled():
+            task.exception()
+
+    async def _call_api(self, audio: bytes, filename: str, content_type: Optional[str]) -> str:
+        if self.client is None:
+            await self.start()
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        files = {"file": (filename or "audio", audio, content_type or "application/octet-stream")}
+        form = {"model": WHISPER_MODEL, "response_format": "json", "language": WHISPER_LANGUAGE}
+
+        for attempt in range(self.retries + 1):
+            last_try = attempt == self.retries
+            try:
+                response = await self.client.post(self.url, headers=headers, files=files, data=form)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if last_try:
+                    raise TranscriptionError(504, f"Transcription service unavailable: {e}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_try:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+
+            # Try to read the response as JSON; use raw text if that fails
+            try:
+                data = response.json()
+            except ValueError:
+                data = {"raw": response.text}
+            if response.status_code != 200:
+                log.warning("Whisper error %s: %s", response.status_code, data)
+                raise TranscriptionError(response.status_code, data)
+            return data.get("text", "")
+
+        raise TranscriptionError(502, "Transcription failed")  # not reached
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        text = self.memory.get(key)
+        if text is not None:
+            self.memory.move_to_end(key)
+        return text
+
+    def _memory_put(self, key: str, text: str) -> None:
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.cache_size:
+            self.memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        return self.cache_dir / f"{key}.json" if self.cache_dir else None
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            text = json.loads(path.read_text())["text"]
+            # mtime = last use, so pruning keeps the entries that are still asked for
+            os.utime(path)
+            return text
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_put(self, key: str, text: str) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            # write then rename, so a half-written file is never read
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"text": text}))
+            tmp.replace(path)
+        except OSError as e:
+            log.warning("Could not cache transcription: %s", e)
+            return
+        self.writes_since_prune += 1
+        if self.writes_since_prune >= TRANSCRIPTION_CACHE_PRUNE_EVERY:
+            self._disk_prune()
+
+    def _disk_prune(self) -> None:
+        """Deletes cache files past the age limit, then the least recently used past max_files."""
+        self.writes_since_prune = 0
+        if self.cache_dir is None:
+            return
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime
+                if now - mtime > self.max_age_seconds:
+                    path.unlink()
+                else:
+                    entries.append((mtime, path))
+            except OSError:
+                # removed by another worker meanwhile
+                continue
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_files, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "in_memory": len(self.memory)}
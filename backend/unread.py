@@ -0,0 +1,104 @@
+# backend/unread.py
+# Per-user unread message counts for GET /messages/unread-count
+#
+# notifications.js polls unread-count on a timer for every logged-in user,
+# so most polls should be answered from memory:
+# - a miss runs one COUNT(*) (served by the partial unread indexes on messages)
+# - send_message adds 1 to the recipient's cached count
+# - mark_read subtracts the number of messages it actually flipped
+# Entries expire after UNREAD_CACHE_TTL_SECONDS so a count changed by another
+# worker is picked up on a later poll.
+# add() does nothing for a user with no entry, so a COUNT(*) that ran while a write
+# was committing could store a count missing that write for the whole TTL. Every
+# add()/invalidate() gives the user a new generation, and set() only stores a count
+# if the generation read before counting is still the current one.
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+UNREAD_CACHE_TTL_SECONDS = float(os.getenv("UNREAD_CACHE_TTL_SECONDS", "15"))
+# Bounds memory if a lot of different users poll; expired entries are dropped first
+UNREAD_CACHE_MAX_ENTRIES = int(os.getenv("UNREAD_CACHE_MAX_ENTRIES", "50000"))
+
+
+class UnreadCounter:
+    def __init__(
+        self,
+        ttl_seconds: float = UNREAD_CACHE_TTL_SECONDS,
+        max_entries: int = UNREAD_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (auth_id, role) -> (count, expires_at)
+        self.entries: Dict[Tuple[UUID, str], Tuple[int, float]] = {}
+        # (auth_id, role) -> clock value of its last write. Users missing here are at
+        # floor, which moves up to clock whenever the dict is cleared to bound memory.
+        self.generations: Dict[Tuple[UUID, str], int] = {}
+        self.clock = 0
+        self.floor = 0
+        self.lock = threading.Lock()
+
+    def generation(self, auth_id: UUID, role: str) -> int:
+        """Read this before counting in the database and pass it to set()."""
+        with self.lock:
+            return self.generations.get((auth_id, role), self.floor)
+
+    def get(self, auth_id: UUID, role: str) -> Optional[int]:
+        """Cached count, or None if it has to be counted in the database."""
+        with self.lock:
+            entry = self.entries.get((auth_id, role))
+            if entry is None:
+                return None
+            count, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[(auth_id, role)]
+                return None
+            return count
+
+    def set(self, auth_id: UUID, role: str, count: int, generation: int) -> None:
+        """Stores a counted total, unless the user had a write since generation was read."""
+        with self.lock:
+            if self.generations.get((auth_id, role), self.floor) != generation:
+                return
+            if len(self.entries) >= self.max_entries:
+                self._evict()
+            self.entries[(auth_id, role)] = (count, time.monotonic() + self.ttl_seconds)
+
+    def add(self, auth_id: UUID, role: str, delta: int) -> None:
+        """Adjusts a cached count after a committed write. Uncached users are left alone."""
+        with self.lock:
+            self._written((auth_id, role))
+            entry = self.entries.get((auth_id, role))
+            if entry is None:
+                return
+            count, expires_at = entry
+            self.entries[(auth_id, role)] = (max(count + delta, 0), expires_at)
+
+    def invalidate(self, auth_id: UUID, role: str) -> None:
+        with self.lock:
+            self._written((auth_id, role))
+            self.entries.pop((auth_id, role), None)
+
+    def _written(self, key: Tuple[UUID, str]) -> None:
+        self.clock += 1
+        if len(self.generations) >= self.max_entries:
+            # every generation read before now no longer matches, so nothing stale is stored
+            self.generations.clear()
+            self.floor = self.clock
+        self.generations[key] = self.clock
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [k for k, (_, exp) in self.entries.items() if exp <= now]
+        for k in expired:
+            del self.entries[k]
+        # still full: drop the oldest half (dicts keep insertion order)
+        if len(self.entries) >= self.max_entries:
+            for k in list(self.entries)[: self.max_entries // 2]:
+                del self.entries[k]
+
+
+unread_counts = UnreadCounter()
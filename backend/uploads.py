@@ -0,0 +1,211 @@
+# backend/uploads.py
+# Upload store for certificates and profile photos
+#
+# Uploads used to be copied with shutil.copyfileobj inside the async endpoint (blocking
+# the event loop), had no size limit, and got a new uuid name every time, so the
+# same PDF uploaded ten times was stored ten times.
+# Now:
+# - the file is copied in chunks in a worker thread, hashing (sha256) as it goes
+# - anything over the kind's max size is rejected with 413 and nothing is kept
+# - the file is stored as <sha256><ext>, so a duplicate upload just returns the
+#   existing URL, and a URL always points at the same content (safe to cache forever)
+#
+# Files that no user's photo_url / certificate_url points at any more can be removed with:
+#   python -m backend.uploads gc            (lists them)
+#   python -m backend.uploads gc --delete   (removes them)
+# (a photo's resized variants are kept/removed together with the photo)
+#
+# gc and a duplicate upload can meet on the same file. An upload always renames its
+# freshly written copy over the name, which leaves a new mtime in one step; gc first
+# renames a file out of the way, then only deletes it if it is still old. If the
+# file was renamed over while gc looked, gc puts it back.
+#
+# References:
+# - https://fastapi.tiangolo.com/tutorial/request-files/#uploadfile
+# - https://docs.python.org/3/library/hashlib.html
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Set
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile
+from sqlmodel import Session, select
+
+from backend.images import variant_source_stem
+from backend.models.user import User
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Unreferenced files younger than this are kept: a photo is uploaded first and only
+# saved to the profile afterwards
+GC_MIN_AGE_SECONDS = 24 * 3600
+
+TMP_PREFIX = ".upload-"
+
+
+@dataclass(frozen=True)
+class UploadKind:
+    folder: str                    # under static/
+    extensions: Dict[str, str]     # allowed content type -> file extension
+    max_bytes: int
+    error: str                     # message for a wrong content type
+
+    @property
+    def directory(self) -> Path:
+        return STATIC_DIR / self.folder
+
+    def url_for(self, filename: str) -> str:
+        return f"/static/{self.folder}/{filename}"
+
+
+CERTIFICATES = UploadKind(
+    folder="certificates",
+    # only PDFs for now
+    extensions={"application/pdf": ".pdf"},
+    max_bytes=int(os.getenv("MAX_CERTIFICATE_BYTES", str(10 * 1024 * 1024))),
+    error="Only PDF files are allowed",
+)
+
+PHOTOS = UploadKind(
+    folder="images",
+    extensions={"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"},
+    max_bytes=int(os.getenv("MAX_PHOTO_BYTES", str(5 * 1024 * 1024))),
+    error="Only JPG/PNG/WebP allowed",
+)
+
+UPLOAD_KINDS = (CERTIFICATES, PHOTOS)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def copy_and_hash(src: BinaryIO, dest: Path, max_bytes: int) -> str:
+    """Copies src to dest in chunks and returns the sha256. Raises UploadTooLarge past max_bytes."""
+    digest = hashlib.sha256()
+    size = 0
+    with dest.open("wb") as out:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge()
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _store(src: BinaryIO, kind: UploadKind, ext: str) -> str:
+    kind.directory.mkdir(parents=True, exist_ok=True)
+    # temp file in the same folder, so the final rename is atomic
+    tmp = kind.directory / f"{TMP_PREFIX}{uuid4().hex}"
+    try:
+        sha = copy_and_hash(src, tmp, kind.max_bytes)
+        filename = f"{sha}{ext}"
+        # same content may already be stored: replacing it anyway gives it a new
+        # mtime in one atomic step, so gc gives the user time to save it to their
+        # profile and can't delete it between a check and a touch
+        os.replace(tmp, kind.directory / filename)
+        return filename
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+async def save_upload(file: UploadFile, kind: UploadKind) -> str:
+    """Stores an uploaded file and returns its /static URL."""
+    ext = kind.extensions.get(file.content_type)
+    if ext is None:
+        raise HTTPException(status_code=400, detail=kind.error)
+    try:
+        filename = await asyncio.to_thread(_store, file.file, kind, ext)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File is too large (max {kind.max_bytes // (1024 * 1024)} MB)",
+        )
+    return kind.url_for(filename)
+
+
+def referenced_files(session: Session) -> Set[str]:
+    """File names (not paths) that some user's photo_url or certificate_url points at."""
+    names: Set[str] = set()
+    for photo_url, certificate_url in session.exec(select(User.photo_url, User.certificate_url)):
+        for url in (photo_url, certificate_url):
+            if url:
+                # stored either as /static/... or as a full http URL
+                names.add(Path(urlparse(url).path).name)
+    return names
+
+
+def collect_garbage(session: Session, delete: bool = False, min_age: float = GC_MIN_AGE_SECONDS) -> List[Path]:
+    """
+    Upload files (and leftover temp files) older than min_age that no user references.
+    Only removes them when delete=True; returns what was (or would be) removed.
+    """
+    keep = referenced_files(session)
+    # resized copies of a photo (backend/images.py) live as long as the photo
+    keep_stems = {Path(name).stem for name in keep}
+    cutoff = time.time() - min_age
+    garbage: List[Path] = []
+    for kind in UPLOAD_KINDS:
+        if not kind.directory.exists():
+            continue
+        for path in kind.directory.iterdir():
+            if not path.is_file() or path.stat().st_mtime > cutoff:
+                continue
+            if path.name.startswith(TMP_PREFIX):
+                garbage.append(path)
+            elif path.name not in keep and variant_source_stem(path.name) not in keep_stems:
+                garbage.append(path)
+    if delete:
+        garbage = [path for path in garbage if remove_if_old(path, cutoff)]
+    return garbage
+
+
+def remove_if_old(path: Path, cutoff: float) -> bool:
+    """
+    Deletes an upload unless it was uploaded again (renamed over) since gc listed it.
+    Renaming first means an upload after this point creates a new file instead of
+    having its file deleted.
+    """
+    tomb = path.with_name(f"{TMP_PREFIX}gc-{uuid4().hex}")
+    try:
+        os.rename(path, tomb)
+    except FileNotFoundError:
+        return False
+    if tomb.stat().st_mtime > cutoff:
+        # uploaded again just before the rename: put it back (same content if the
+        # name has been uploaded once more since)
+        os.replace(tomb, path)
+        return False
+    tomb.unlink()
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from backend.db import engine
+
+    parser = argparse.ArgumentParser(description="Upload store maintenance")
+    parser.add_argument("command", choices=["gc"])
+    parser.add_argument("--delete", action="store_true", help="remove the files instead of listing them")
+    parser.add_argument("--min-age-hours", type=float, default=GC_MIN_AGE_SECONDS / 3600)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        garbage = collect_garbage(session, delete=args.delete, min_age=args.min_age_hours * 3600)
+    for path in garbage:
+        print(("Deleted " if args.delete else "Unreferenced ") + str(path.relative_to(STATIC_DIR)))
+    print(f"{len(garbage)} file(s)" + ("" if args.delete else " (run with --delete to remove)"))
@@ -155,6 +155,15 @@ export const toAbsolute = (u) => {
   return `${PUBLIC_BASE}${s.startsWith("/") ? s : "/" + s}`;
 };
 
+// Smaller WebP version of an uploaded profile photo for list rows/avatars.
+// size: "thumb" (160px), "small" (320px) or "medium" (640px); the backend serves
+// the original if it has no resized copy. Other URLs are returned unchanged.
+export const photoVariant = (u, size = "thumb") => {
+  const abs = toAbsolute(u);
+  if (!abs || !abs.includes("/static/images/") || abs.includes("?")) return abs;
+  return `${abs}?size=${size}`;
+};
+
 // Converts an absolute URL back to relative for storage consistency.
 export const toRelative = (url) =>
   url?.startsWith(PUBLIC_BASE) ? url.slice(PUBLIC_BASE.length) : url;
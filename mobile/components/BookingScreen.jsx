@@ -399,6 +399,14 @@ if ([mother_id, doula_id, dur].some((n) => Number.isNaN(n)) || dur <= 0) {
       setMode("online");
       onBooked?.();
     } catch (err) {
+      // the server rejects a time the doula was booked for in the meantime
+      if (err?.response?.status === 409) {
+        showMessage(
+          "Time no longer available",
+          `${err.response.data?.detail || "This doula already has a booking at this time."} Please choose another time.`
+        );
+        return;
+      }
       const msg = err?.response
         ? `${err.response.status} ${err.response.statusText}\n${JSON.stringify(
             err.response.data
@@ -105,7 +105,7 @@ export default function ChatScreen() {
       // If server sends chat history (array)
       if (Array.isArray(payload)) {
         const history = payload.map((m) => ({
-          id: `${Date.now()}-${Math.random()}`,
+          id: m.id || `${Date.now()}-${Math.random()}`,
           sender: m.sender || "Someone",
           text: m.text || "",
           time: m.time || "",
@@ -116,7 +116,7 @@ export default function ChatScreen() {
 
       // Single incoming message
       const item = {
-        id: `${Date.now()}-${Math.random()}`,
+        id: payload.id || `${Date.now()}-${Math.random()}`,
         sender: payload.sender || "Someone",
         text: payload.text || "",
         time: payload.time || "",
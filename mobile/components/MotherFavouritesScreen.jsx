@@ -33,7 +33,7 @@ import {
   StyleSheet,
 } from "react-native";
 import { supabase } from "../supabaseClient";
-import api, { toAbsolute } from "../api";
+import api, { photoVariant } from "../api";
 
 // Placeholder image shown if a doula has not uploaded a photo
 const PLACEHOLDER =
@@ -147,7 +147,7 @@ export default function MotherFavouritesScreen({ navigation }) {
             <Image
               source={{
                 uri: item.photo_url
-                  ? toAbsolute(item.photo_url)
+                  ? photoVariant(item.photo_url)
                   : PLACEHOLDER,
               }}
               style={styles.avatar}
@@ -105,6 +105,8 @@ export default function PrivateChatScreen({ route }) {
   const [myAuthId, setMyAuthId] = React.useState(null);
   const [loading, setLoading] = React.useState(true);
   const [messages, setMessages] = React.useState([]);
+  // true while older history is being fetched (pull down at the top of the list)
+  const [loadingEarlier, setLoadingEarlier] = React.useState(false);
   // Controlled input for message text
   const [text, setText] = React.useState("");
 
@@ -133,16 +135,21 @@ export default function PrivateChatScreen({ route }) {
         },
       });
 
-      setMessages(res.data || []);
+      const loaded = res.data || [];
+      setMessages(loaded);
 
 
        // Mark messages as read for the current role after loading
       // POST /messages/mark-read updates read_by_mother / read_by_doula
-      await api.post("/messages/mark-read", {
-        mother_auth_id: motherAuthId,
-        doula_auth_id: doulaAuthId,
-        role,
-      });
+      // up_to_message_id: only what is on screen, not a message that arrived since
+      if (loaded.length) {
+        await api.post("/messages/mark-read", {
+          mother_auth_id: motherAuthId,
+          doula_auth_id: doulaAuthId,
+          role,
+          up_to_message_id: loaded[loaded.length - 1].id,
+        });
+      }
       //  Reset local notification baseline after reading messages
 // so HomeScreen doesn't think "new unread messages" exist for this user/role
 const unreadRes = await api.get("/messages/unread-count", {
@@ -162,6 +169,64 @@ await AsyncStorage.setItem(
     }
   };
 
+  // Fetch only the messages newer than the last one on screen (after_id) and append them,
+  // instead of downloading the whole conversation again.
+  // More than one page may have arrived while the app was away, so keep following
+  // X-Next-Cursor until the last page (no header)
+  const loadNewer = async () => {
+    const lastId = messages.length ? messages[messages.length - 1].id : null;
+    if (lastId == null) return loadThread();
+    try {
+      const newer = [];
+      let cursor = null;
+      do {
+        const res = await api.get("/messages/thread", {
+          params: {
+            mother_auth_id: motherAuthId,
+            doula_auth_id: doulaAuthId,
+            after_id: lastId,
+            ...(cursor ? { cursor } : {}),
+          },
+        });
+        newer.push(...(res.data || []));
+        cursor = res.headers?.["x-next-cursor"];
+      } while (cursor);
+      if (newer.length) setMessages((prev) => [...prev, ...newer]);
+      // anything from the other person is read now that it is on screen
+      if (newer.some((m) => m.sender_role !== role)) {
+        await api.post("/messages/mark-read", {
+          mother_auth_id: motherAuthId,
+          doula_auth_id: doulaAuthId,
+          role,
+          up_to_message_id: newer[newer.length - 1].id,
+        });
+      }
+    } catch (e) {
+      console.warn("Thread sync failed", e?.message || e);
+    }
+  };
+
+  // Pull down to load the page of messages before the oldest one shown (before_id)
+  const loadEarlier = async () => {
+    if (!messages.length) return;
+    try {
+      setLoadingEarlier(true);
+      const res = await api.get("/messages/thread", {
+        params: {
+          mother_auth_id: motherAuthId,
+          doula_auth_id: doulaAuthId,
+          before_id: messages[0].id,
+        },
+      });
+      const older = res.data || [];
+      if (older.length) setMessages((prev) => [...older, ...prev]);
+    } catch (e) {
+      console.warn("Loading earlier messages failed", e?.message || e);
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
+
    // Load the conversation when both participant IDs are available
   React.useEffect(() => {
   if (myAuthId && motherAuthId && doulaAuthId) loadThread();
@@ -189,8 +254,8 @@ await AsyncStorage.setItem(
 
   // Clear input field after sending
       setText("");
-      // Reload thread so UI reflects the new message immediately
-      await loadThread(); // reload after send
+      // Fetch what is new (our message and anything received meanwhile)
+      await loadNewer();
     } catch (e) {
       console.warn("Send failed", e?.message || e);
     }
@@ -218,6 +283,8 @@ await AsyncStorage.setItem(
         contentContainerStyle={{ padding: 12 }}
         data={messages}
         keyExtractor={(m) => String(m.id)}
+        refreshing={loadingEarlier}
+        onRefresh={loadEarlier}
         renderItem={({ item }) => (
           <View
             style={[
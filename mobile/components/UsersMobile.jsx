@@ -36,7 +36,7 @@ import {
 
 import { SafeAreaProvider, SafeAreaView } from "react-native-safe-area-context";
 import { useRoute, useNavigation } from "@react-navigation/native";
-import api, { toAbsolute } from "../api";
+import api, { photoVariant } from "../api";
 import { supabase } from "../supabaseClient";
 // YouTube #56 vibe (list and API): still using a separate slider lib for React native/Expo
 import Slider from "@react-native-community/slider";
@@ -719,7 +719,7 @@ useEffect(() => {
           activeOpacity={0.8}
         >
           <Image
-            source={{ uri: toAbsolute(u.photo_url) || PLACEHOLDER }}
+            source={{ uri: photoVariant(u.photo_url) || PLACEHOLDER }}
             style={styles.avatar}
           />
 